@@ -0,0 +1,223 @@
+"""Measure every scan engine against local stand-in targets, and fail on regressions.
+
+Run with `python benchmarks/bench_engines.py [--probes N] [--engine NAME ...]`. The engines:
+
+- connect: `probe`, the engine of `is_port_open`, one connect at a time against loopback listeners
+- async: `scan_targets`, many connects in flight against the same listeners
+- syn: `SynScanner`, which `tcp_syn_scan` grew into, against a `SimulatedNetwork` that drops and delays probes
+- arp: `ArpScanner`, the engine of `arp_scan`, against the same simulated network
+
+Each engine runs in a fresh interpreter, so its peak memory and file descriptors, sampled while it scans, are its
+own. Results are probes per second, the median and 99th percentile of the latency the engine reports, and the memory
+and file descriptors on top of what the process used before the scan.
+
+Every run is appended to a history file. A run is compared with the median of the last runs of the same engine and
+settings on the same machine, and the script exits with status 1 when any measurement got worse by more than the
+tolerance.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from collections.abc import Callable, Iterable
+from pathlib import Path
+
+from simulated import LOCALHOST, Listeners, Profile, SimulatedNetwork
+
+from port_scanner.arp import ArpScanner
+from port_scanner.networking import probe, scan_targets
+from port_scanner.syn_scanner import SynScanner
+
+ENGINES = ("connect", "async", "syn", "arp")
+DEFAULT_PROBES = 20_000
+DEFAULT_HISTORY = Path(".benchmarks/engines.jsonl")
+DEFAULT_TOLERANCE = 0.25  # how much worse than the recent median a measurement can get
+WINDOW = 5  # recent runs the median is taken over
+LISTENERS = 100  # open loopback ports for the connect engines
+CONCURRENCY = 256  # connects in flight for the async engine
+RATE = 1_000_000  # probes per second the packet engines are limited to, high enough not to be the bottleneck
+TIMEOUT = 0.05  # seconds the packet engines wait for an answer before retransmitting
+SAMPLE_INTERVAL = 0.005  # seconds in between samples of memory and file descriptors
+# slack on top of the tolerance, so tiny numbers don't fail on noise
+SLACK = {"p50": 0.0005, "p99": 0.002, "memory": 1.0, "fds": 2}
+
+
+def _resident() -> float:
+    """Resident memory of this process in MiB."""
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def _descriptors() -> int:
+    return len(os.listdir("/proc/self/fd"))
+
+
+class _Sampler:
+    """Sample the peak memory and file descriptors of this process on a thread."""
+
+    def __init__(self) -> None:
+        self.memory = self.fds = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self) -> None:
+        memory, fds = _resident(), _descriptors()
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            self.memory = max(self.memory, _resident() - memory)
+            self.fds = max(self.fds, _descriptors() - fds)
+
+    def __enter__(self) -> "_Sampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def _targets(probes: int, ports: list[int]) -> list[tuple[str, int]]:
+    """`probes` loopback targets, the listener ports and closed ports in between."""
+    listening = set(ports)
+    closed = (port for port in range(1024, 65536) if port not in listening)
+    count = probes - len(ports)
+    return [(LOCALHOST, port) for port in ports] + [(LOCALHOST, next(closed)) for _ in range(count)]
+
+
+def _run_connect(probes: int, profile: Profile) -> Callable[[], Iterable[float]]:  # noqa: ARG001
+    listeners = Listeners(min(LISTENERS, probes))
+    targets = _targets(probes, listeners.ports)
+    return lambda: [probe(host, port, timeout=1.0).latency for host, port in targets]
+
+
+def _run_async(probes: int, profile: Profile) -> Callable[[], Iterable[float]]:  # noqa: ARG001
+    listeners = Listeners(min(LISTENERS, probes))
+    targets = _targets(probes, listeners.ports)
+
+    async def _scan() -> list[float]:
+        return [result.latency async for result in scan_targets(targets, concurrency=CONCURRENCY, timeout=1.0)]
+
+    return lambda: asyncio.run(_scan())
+
+
+def _run_syn(probes: int, profile: Profile) -> Callable[[], Iterable[float]]:
+    network = SimulatedNetwork(profile)
+    scanner = SynScanner(rate=RATE, timeout=TIMEOUT, send_socket=network.transport, recv_socket=network.transport)
+    # simulated hosts all over 127.0.0.0/8, 256 ports each
+    targets = [(f"127.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}", 1 + i % 256) for i in range(probes)]
+    return lambda: [result.latency for result in scanner.scan_targets(targets)]
+
+
+def _run_arp(probes: int, profile: Profile) -> Callable[[], Iterable[float]]:
+    network = SimulatedNetwork(profile)
+    scanner = ArpScanner(
+        "simulated", LOCALHOST, b"\x02\x00\x00\x00\x00\x01", rate=RATE, timeout=TIMEOUT, transport=network.transport
+    )
+    hosts = [socket.inet_ntoa((0x0A000000 + i).to_bytes(4)) for i in range(probes)]
+    return lambda: [reply.rtt for reply in scanner.sweep(hosts)]
+
+
+RUNNERS = {"connect": _run_connect, "async": _run_async, "syn": _run_syn, "arp": _run_arp}
+
+
+def measure(engine: str, probes: int, profile: Profile) -> dict:
+    """Scan with `engine` in this process, set up first so the targets don't count."""
+    scan = RUNNERS[engine](probes, profile)
+    with _Sampler() as sampler:
+        start = time.perf_counter()
+        latencies = sorted(scan())
+        elapsed = time.perf_counter() - start
+    return {
+        "pps": probes / elapsed,
+        "p50": statistics.median(latencies) if latencies else 0.0,
+        "p99": latencies[int(len(latencies) * 0.99)] if latencies else 0.0,
+        "memory": sampler.memory,
+        "fds": sampler.fds,
+    }
+
+
+def measure_isolated(engine: str, probes: int, profile: Profile) -> dict:
+    """Run `measure` in a fresh interpreter."""
+    command = [sys.executable, __file__, "--measure", engine, "--probes", str(probes), "--profile", json.dumps(profile)]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout  # noqa: S603
+    return json.loads(output.splitlines()[-1])
+
+
+def _key(engine: str, probes: int, profile: Profile) -> str:
+    """Runs are only compared with runs of the same engine and settings on the same machine."""
+    machine = f"{platform.node()}/{os.cpu_count()}cpu/python{platform.python_version()}"
+    return json.dumps([machine, engine, probes, profile])
+
+
+def _history(path: Path) -> list[dict]:
+    if not path.exists():
+        return []
+    with open(path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def regressions(result: dict, previous: list[dict], tolerance: float) -> list[str]:
+    """What got worse than the median of the `previous` runs by more than the tolerance."""
+    if not previous:
+        return []
+    worse = []
+    pps = statistics.median(run["pps"] for run in previous)
+    if result["pps"] < pps * (1 - tolerance):
+        worse.append(f"pps {result['pps']:.0f} < {pps:.0f}")
+    for name, slack in SLACK.items():
+        usual = statistics.median(run[name] for run in previous)
+        if result[name] > usual * (1 + tolerance) + slack:
+            worse.append(f"{name} {result[name]:.4g} > {usual:.4g}")
+    return worse
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--engine", action="append", choices=ENGINES, help="only these engines, all by default")
+    parser.add_argument("--probes", type=int, default=DEFAULT_PROBES)
+    parser.add_argument("--drop", type=float, default=Profile().drop, help="share of simulated probes dropped")
+    parser.add_argument("--latency", type=float, default=Profile().latency, help="simulated seconds per answer")
+    parser.add_argument("--history", type=Path, default=DEFAULT_HISTORY, help="file the runs are kept in")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--no-record", action="store_true", help="compare without adding this run to the history")
+    parser.add_argument("--measure", choices=ENGINES, help=argparse.SUPPRESS)
+    parser.add_argument("--profile", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure is not None:
+        # the fresh interpreter of `measure_isolated`
+        print(json.dumps(measure(args.measure, args.probes, Profile(*json.loads(args.profile)))))  # noqa: T201
+        return
+
+    profile = Profile(drop=args.drop, latency=args.latency)
+    history = _history(args.history)
+    print(f"{args.probes} probes per engine, {profile}")  # noqa: T201
+    print(f"{'engine':<8} {'probes/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'MiB':>6} {'fds':>5}  status")  # noqa: T201
+    failed = False
+    runs = []
+    for engine in args.engine or ENGINES:
+        result = measure_isolated(engine, args.probes, profile)
+        key = _key(engine, args.probes, profile)
+        worse = regressions(result, [run for run in history if run["key"] == key][-WINDOW:], args.tolerance)
+        failed |= bool(worse)
+        print(  # noqa: T201
+            f"{engine:<8} {result['pps']:>10.0f} {result['p50'] * 1000:>8.3f} {result['p99'] * 1000:>8.3f} "
+            f"{result['memory']:>6.1f} {result['fds']:>5.0f}  {'REGRESSED: ' + ', '.join(worse) if worse else 'ok'}"
+        )
+        runs.append({"key": key, "time": time.time(), **result})
+    if not args.no_record:
+        args.history.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.history, "a") as file:
+            file.writelines(json.dumps(run) + "\n" for run in runs)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
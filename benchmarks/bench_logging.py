@@ -0,0 +1,63 @@
+"""Compare the cost of logging scan results with a plain file handler and with the background log writer.
+
+Run with `python benchmarks/bench_logging.py [records]`. For every setup it reports how long the scan loop spends
+logging, and how long until every record is on disk.
+"""
+
+import logging
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from port_scanner.logger import ResultLog, ResultLogger, _DeferredQueueHandler, get_logger
+from port_scanner.networking import PortState, ProbeResult
+
+DEFAULT_RECORDS = 200_000
+
+
+def _reset(logger: logging.Logger) -> None:
+    for handler in logger.handlers[:]:
+        logger.removeHandler(handler)
+        handler.close()
+
+
+def bench(records: int, *, background: bool, mode: ResultLog) -> tuple[float, float]:
+    """Log `records` results, returning seconds spent in the scan loop and seconds until they are written."""
+    with tempfile.TemporaryDirectory() as directory:
+        logger = get_logger(str(Path(directory) / "bench.log"), background=background)
+        log = ResultLogger(logger, mode)
+        # one open port in a thousand, like a typical scan
+        results = [
+            ProbeResult("10.0.0.1", port % 65536, PortState.OPEN if port % 1000 == 0 else PortState.CLOSED, 0.001)
+            for port in range(records)
+        ]
+        start = time.perf_counter()
+        for result in results:
+            log(result)
+        looped = time.perf_counter() - start
+        for handler in logger.handlers:
+            if isinstance(handler, _DeferredQueueHandler):
+                # wait for the writer to catch up
+                handler.writer.stop()
+        written = time.perf_counter() - start
+        _reset(logger)
+    return looped, written
+
+
+def main() -> None:
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_RECORDS
+    print(f"{records} results")  # noqa: T201
+    print(f"{'setup':<32} {'loop (s)':>10} {'results/s':>12} {'written (s)':>12}")  # noqa: T201
+    for name, background, mode in [
+        ("file handler, every result", False, ResultLog.ALL),
+        ("background writer, every result", True, ResultLog.ALL),
+        ("background writer, open ports", True, ResultLog.OPEN),
+        ("background writer, summaries", True, ResultLog.SUMMARY),
+    ]:
+        looped, written = bench(records, background=background, mode=mode)
+        print(f"{name:<32} {looped:>10.3f} {records / looped:>12.0f} {written:>12.3f}")  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
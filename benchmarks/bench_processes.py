@@ -0,0 +1,59 @@
+"""Measure how the scan rate scales with the number of worker processes.
+
+Run with `python benchmarks/bench_processes.py [ports] [max processes]`. Every closed port of 127.0.0.1 answers
+right away, so the scan is bound by the cpu time the engines spend per probe, which is what the processes split. The
+SYN engine is measured as well when raw sockets can be opened.
+"""
+
+import os
+import socket
+import sys
+import time
+
+from port_scanner.parallel import scan_processes
+from port_scanner.targets import TargetSpec
+
+DEFAULT_PORTS = 20_000
+CONCURRENCY = 256  # connects in flight in every worker
+
+
+def can_use_raw_sockets() -> bool:
+    try:
+        socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_TCP).close()
+    except PermissionError:
+        return False
+    return True
+
+
+def measure(targets: TargetSpec, processes: int, *, use_tcp_syn: bool) -> float:
+    """Probes per second of scanning `targets` with `processes` workers."""
+    start = time.perf_counter()
+    count = sum(
+        1
+        for _ in scan_processes(
+            targets,
+            processes=processes,
+            use_tcp_syn=use_tcp_syn,
+            concurrency=1 if use_tcp_syn else CONCURRENCY,
+            randomize=True,
+        )
+    )
+    return count / (time.perf_counter() - start)
+
+
+def main() -> None:
+    ports = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PORTS
+    max_processes = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 1)  # noqa: PLR2004
+    targets = TargetSpec.parse("127.0.0.1", f"1-{ports}")
+    engines = {"connect": False} | ({"syn": True} if can_use_raw_sockets() else {})
+    print(f"{len(targets)} probes, {os.cpu_count()} cpus")  # noqa: T201
+    for engine, use_tcp_syn in engines.items():
+        single = measure(targets, 1, use_tcp_syn=use_tcp_syn)
+        print(f"{engine:<8} 1 process   {single:>9.0f}/s")  # noqa: T201
+        for processes in range(2, max_processes + 1):
+            rate = measure(targets, processes, use_tcp_syn=use_tcp_syn)
+            print(f"{engine:<8} {processes} processes {rate:>9.0f}/s x{rate / single:.2f}")  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
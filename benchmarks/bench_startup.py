@@ -0,0 +1,46 @@
+"""Measure how long the command line takes to start, and fail when it is over budget.
+
+Run with `python benchmarks/bench_startup.py [runs]`. Every measurement runs in a fresh interpreter, the median of
+`runs` is compared to the budget and the script exits with status 1 if any of them is over it.
+"""
+
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+DEFAULT_RUNS = 10
+BUDGET = 0.5  # seconds on top of the bare interpreter start, importing scapy alone takes about a second
+COMMANDS = {
+    "import port_scanner.app": ("-c", "import port_scanner.app"),
+    "port-scan --help": ("-m", "port_scanner", "port-scan", "--help"),
+}
+
+
+def measure(args: tuple[str, ...], runs: int) -> float:
+    """Median wall time in seconds of running the interpreter with `args`."""
+    timings = []
+    with tempfile.TemporaryDirectory() as directory:
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, *args], check=True, capture_output=True, cwd=directory)  # noqa: S603
+            timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main() -> None:
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_RUNS
+    baseline = measure(("-c", "pass"), runs)
+    print(f"interpreter start: {baseline:.3f}s, budget {BUDGET:.3f}s on top of that")  # noqa: T201
+    over = False
+    for name, args in COMMANDS.items():
+        elapsed = measure(args, runs) - baseline
+        status = "ok" if elapsed <= BUDGET else "OVER BUDGET"
+        over |= elapsed > BUDGET
+        print(f"{name:<28} {elapsed:.3f}s {status}")  # noqa: T201
+    sys.exit(1 if over else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Compare the thread pool connect scan with the sequential one.
+
+Run with `python benchmarks/bench_threads.py [--probes N] [--workers N ...] [--host HOST]`. By default the targets
+are loopback listeners and the closed ports in between, see `simulated.Listeners`. Loopback answers right away, so
+threads can only overlap the cpu time of the probes there. A `--host` on the network, where every connect waits a
+round trip, shows what the threads are for. Every thread pool scan has to report exactly what the sequential scan
+reported, in the same order, or the script exits with status 1.
+"""
+
+import argparse
+import sys
+import time
+from collections.abc import Callable, Iterable
+
+from simulated import LOCALHOST, Listeners
+
+from port_scanner.networking import ProbeResult, probe, scan_threads
+
+DEFAULT_PROBES = 5_000
+DEFAULT_WORKERS = (2, 8, 32)
+LISTENERS = 50  # open loopback ports among the targets
+TIMEOUT = 1.0  # seconds a connect may take
+
+
+def _targets(host: str, probes: int, open_ports: list[int]) -> list[tuple[str, int]]:
+    """`probes` targets on `host`, the open ports first and then the other ports from 1024 up."""
+    listening = set(open_ports)
+    other = (port for port in range(1024, 65536) if port not in listening)
+    return [(host, port) for port in open_ports] + [(host, next(other)) for _ in range(probes - len(open_ports))]
+
+
+def measure(scan: Callable[[], Iterable[ProbeResult]]) -> tuple[float, list[tuple[str, int, str]]]:
+    """Seconds `scan` took and what it reported, without the latencies."""
+    start = time.perf_counter()
+    results = [(result.host, result.port, result.state.name) for result in scan()]
+    return time.perf_counter() - start, results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--probes", type=int, default=DEFAULT_PROBES)
+    parser.add_argument("--workers", type=int, action="append", help=f"thread counts, {DEFAULT_WORKERS} by default")
+    parser.add_argument("--host", help="scan this host instead of loopback listeners")
+    args = parser.parse_args()
+
+    with Listeners(0 if args.host else min(LISTENERS, args.probes)) as listeners:
+        targets = _targets(args.host or LOCALHOST, args.probes, listeners.ports)
+        elapsed, expected = measure(lambda: (probe(host, port, timeout=TIMEOUT) for host, port in targets))
+        print(f"{len(targets)} probes of {args.host or LOCALHOST}")  # noqa: T201
+        print(f"{'engine':<12} {'probes/s':>10} {'speedup':>8}  results")  # noqa: T201
+        print(f"{'sequential':<12} {len(targets) / elapsed:>10.0f} {1:>8.2f}  reference")  # noqa: T201
+        failed = False
+        for workers in args.workers or DEFAULT_WORKERS:
+            took, results = measure(lambda: scan_threads(targets, workers=workers, timeout=TIMEOUT))  # noqa: B023
+            identical = results == expected
+            failed |= not identical
+            print(  # noqa: T201
+                f"{f'{workers} threads':<12} {len(targets) / took:>10.0f} {elapsed / took:>8.2f}  "
+                f"{'identical' if identical else 'DIFFERENT'}"
+            )
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""Local stand-ins for the networks the benchmarks scan.
+
+`Listeners` opens loopback listeners on many ports, for the connect engines: the other ports of 127.0.0.1 answer
+with a RST. `SimulatedNetwork` stands in for the wire of the raw socket engines: it hands out a transport that takes
+the place of their sockets and answers SYN and ARP probes from another process, dropping a share of them and
+delaying the rest, like a lossy network with some latency.
+"""
+
+import heapq
+import itertools
+import multiprocessing
+import random
+import select
+import socket
+import struct
+import time
+from types import TracebackType
+from typing import NamedTuple
+
+from port_scanner.arp import ARP_REPLY, ETH_P_ARP, ETH_P_IP, FRAME
+from port_scanner.syn_scanner import TCP_ACK, TCP_HEADER, TCP_RST, TCP_SYN, WINDOW_SIZE
+
+LOCALHOST = "127.0.0.1"
+IP_HEADER = struct.Struct("!BBHHHBBH4s4s")
+SIMULATED_MAC = b"\x02\x00\x5e\x00\x00\x01"
+RECEIVE_SIZE = 65535
+
+
+class Listeners:
+    """Listening sockets on `count` free loopback ports, as a context manager."""
+
+    def __init__(self, count: int) -> None:
+        self.sockets = []
+        for _ in range(count):
+            sock = socket.socket()
+            sock.bind((LOCALHOST, 0))
+            # every port is connected to once per run, nothing is accepted
+            sock.listen(128)
+            self.sockets.append(sock)
+        self.ports = sorted(sock.getsockname()[1] for sock in self.sockets)
+
+    def __enter__(self) -> "Listeners":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        for sock in self.sockets:
+            sock.close()
+
+
+class Profile(NamedTuple):
+    """How the simulated network behaves."""
+
+    drop: float = 0.01  # share of probes that get no answer
+    open_every: int = 100  # one port in this many is open, the others answer with a RST
+    latency: float = 0.0005  # seconds before an answer arrives
+    jitter: float = 0.0002  # seconds the latency varies by, uniformly
+
+
+class SimulatedTransport:
+    """The engine side of a `SimulatedNetwork`, with the socket methods `BatchProber` uses.
+
+    Every probe is sent with the address it goes to in front of it, since a SYN segment doesn't carry it.
+    """
+
+    def __init__(self, sock: socket.socket) -> None:
+        self.sock = sock
+
+    def _send(self, data: bytes) -> int:
+        while True:
+            try:
+                return self.sock.send(data)
+            except TimeoutError:
+                # the receive timeout applies to sends too, a full buffer only means the network is behind
+                continue
+
+    def sendto(self, data: bytes | bytearray, address: tuple[str, int]) -> int:
+        return self._send(socket.inet_aton(address[0]) + data)
+
+    def send(self, data: bytes | bytearray) -> int:
+        return self._send(bytes(4) + data)
+
+    def recvfrom(self, size: int) -> tuple[bytes, None]:
+        return self.sock.recv(size), None
+
+    def settimeout(self, timeout: float | None) -> None:
+        self.sock.settimeout(timeout)
+
+    def close(self) -> None:
+        self.sock.close()
+
+
+def _syn_answer(destination: bytes, segment: bytes, profile: Profile) -> bytes | None:
+    """The SYN-ACK or RST a host would answer a SYN `segment` with."""
+    source_port, port, seq, _, _, flags, _, _, _ = TCP_HEADER.unpack_from(segment)
+    if not flags & TCP_SYN:
+        return None
+    answer = TCP_SYN | TCP_ACK if port % profile.open_every == 0 else TCP_RST | TCP_ACK
+    tcp = TCP_HEADER.pack(port, source_port, 0, (seq + 1) & 0xFFFFFFFF, 5 << 4, answer, WINDOW_SIZE, 0, 0)
+    ip = IP_HEADER.pack(0x45, 0, IP_HEADER.size + len(tcp), 0, 0, 64, socket.IPPROTO_TCP, 0, destination, b"\x7f\0\0\1")
+    return ip + tcp
+
+
+def _arp_answer(frame: bytes) -> bytes | None:
+    """The ARP reply the host asked for in a request `frame` would send."""
+    if len(frame) < FRAME.size:
+        return None
+    _, source_mac, ethertype, _, _, _, _, _, _, source_ip, _, target_ip = FRAME.unpack_from(frame)
+    if ethertype != ETH_P_ARP:
+        return None
+    return FRAME.pack(
+        source_mac,
+        SIMULATED_MAC,
+        ETH_P_ARP,
+        1,
+        ETH_P_IP,
+        6,
+        4,
+        ARP_REPLY,
+        SIMULATED_MAC,
+        target_ip,
+        source_mac,
+        source_ip,
+    )
+
+
+def _respond(sock: socket.socket, profile: Profile, seed: int) -> None:
+    """Answer probes, after a delay and unless they are dropped, until the engine side is closed."""
+    chance = random.Random(seed)  # noqa: S311
+    # (time the answer arrives, tie breaker, answer)
+    answers: list[tuple[float, int, bytes]] = []
+    counter = itertools.count()
+    while True:
+        timeout = max(0.0, answers[0][0] - time.monotonic()) if answers else None
+        readable, _, _ = select.select([sock], [], [], timeout)
+        if readable:
+            try:
+                probe = sock.recv(RECEIVE_SIZE)
+            except ConnectionError:
+                return
+            if not probe:
+                return
+            if chance.random() >= profile.drop:
+                destination, packet = probe[:4], probe[4:]
+                # the arp engine sends ethernet frames, the syn engine bare tcp segments
+                answer = _syn_answer(destination, packet, profile) if any(destination) else _arp_answer(packet)
+                if answer is not None:
+                    delay = profile.latency + chance.uniform(-profile.jitter, profile.jitter)
+                    heapq.heappush(answers, (time.monotonic() + max(0.0, delay), next(counter), answer))
+        now = time.monotonic()
+        while answers and answers[0][0] <= now:
+            try:
+                sock.send(heapq.heappop(answers)[2])
+            except OSError:
+                return
+
+
+class SimulatedNetwork:
+    """A responder process behind a transport the raw socket engines can use instead of their sockets.
+
+    Use it as a context manager, the transport is passed to the engine as its send and receive socket.
+    """
+
+    def __init__(self, profile: Profile | None = None, *, seed: int = 0) -> None:
+        engine_side, network_side = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        self.transport = SimulatedTransport(engine_side)
+        self._process = multiprocessing.get_context("spawn").Process(
+            target=_respond, args=(network_side, profile or Profile(), seed), name="simulated-network", daemon=True
+        )
+        self._process.start()
+        network_side.close()
+
+    def __enter__(self) -> SimulatedTransport:
+        return self.transport
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.transport.close()
+        self._process.join(timeout=1)
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join()
@@ -1,39 +1,108 @@
+import asyncio
+import contextlib
+import enum
+import functools
 import ipaddress
+import logging
+import math
+import random
 import sys
-from typing import Annotated
+import time
+from collections.abc import AsyncIterable, Iterable, Iterator
+from pathlib import Path
+from typing import Annotated, NamedTuple
 
 import typer
 from rich.console import Console
 from rich.live import Live
 from rich.table import Table
 
-from port_scanner.decorators import rate_limit
-from port_scanner.logger import get_logger
-from port_scanner.networking import is_ip_address, is_port_open, ping, tcp_syn_scan
-
-LOGGER = get_logger("port-scan.log")
+from port_scanner.arp import DEFAULT_RATE as ARP_RATE
+from port_scanner.arp import DEFAULT_RETRIES as ARP_RETRIES
+from port_scanner.arp import ArpScanner, arp_sweep
+from port_scanner.baseline import DEFAULT_SAMPLE, Change, ClosedPolicy, Differ, plan
+from port_scanner.checkpoint import Checkpoint
+from port_scanner.discovery import discover
+from port_scanner.display import ScanView
+from port_scanner.distributed import (
+    DEFAULT_HOST,
+    DEFAULT_LEASE,
+    DEFAULT_PIECES,
+    DEFAULT_PORT,
+    Coordinator,
+    run_worker,
+)
+from port_scanner.logger import ResultLog, ResultLogger, get_logger
+from port_scanner.metrics import DEFAULT_INTERVAL as STATS_INTERVAL
+from port_scanner.metrics import METRICS, RESULTS, Counter, Gauge, StatsDumper, serve_metrics, stage
+from port_scanner.networking import (
+    MAX_PORT,
+    MIN_PORT,
+    PortState,
+    ProbeResult,
+    ping_rtt,
+    probe,
+    scan_targets,
+    scan_threads,
+)
+from port_scanner.output import OutputFormat, open_output
+from port_scanner.parallel import scan_processes
+from port_scanner.permutation import walk
+from port_scanner.pipeline import DEFAULT_QUEUE_SIZE, HostPipe, aexpand, expand
+from port_scanner.ratelimit import RateLimiter
+from port_scanner.services import DEFAULT_CONCURRENCY as SERVICE_CONCURRENCY
+from port_scanner.services import DEFAULT_TIMEOUT as SERVICE_TIMEOUT
+from port_scanner.services import Service, ServiceDetector
+from port_scanner.store import ResultStore
+from port_scanner.syn_scanner import DEFAULT_RATE, SynScanner
+from port_scanner.targets import Ranges, TargetSpec, parse_hosts, parse_ports, read_hosts_file
+from port_scanner.timing import DEFAULT_RETRIES, INITIAL_TIMEOUT, MAX_TIMEOUT, MIN_TIMEOUT, HostTimings
 
 app = typer.Typer(no_args_is_help=True)
 
 console = Console()
 
+_OUTPUT = stage("output")
+
+
+@functools.cache
+def _logger() -> logging.Logger:
+    """The program logger, created on first use so --help doesn't start its writer thread."""
+    return get_logger("port-scan.log")
 
-def _typer_check_host(host: str) -> str:
-    """Wrap `is_ip_address` for typer.
+
+def _typer_check_host(host: str | None) -> str | None:
+    """Check that `host` is a valid host specification for typer.
 
     Args:
-    ----
-        host (str): the host string to check
+        host (str | None): the host specification to check, see `targets.parse_hosts`
 
     Raises:
-    ------
-        typer.BadParameter: raised if host is not an ip address
+        typer.BadParameter: raised if host is not a valid host specification
     """
-    if not is_ip_address(host):
-        msg = "Host needs to be an ip address"
-        raise typer.BadParameter(msg)
-    else:
-        return host
+    if host is not None:
+        try:
+            parse_hosts(host)
+        except ValueError as e:
+            raise typer.BadParameter(str(e)) from None
+    return host
+
+
+def _typer_check_ports(ports: str | None) -> str | None:
+    """Check that `ports` is a valid port specification for typer.
+
+    Args:
+        ports (str | None): the port specification to check, see `targets.parse_ports`
+
+    Raises:
+        typer.BadParameter: raised if ports is not a valid port specification
+    """
+    if ports is not None:
+        try:
+            parse_ports(ports)
+        except ValueError as e:
+            raise typer.BadParameter(str(e)) from None
+    return ports
 
 
 def _typer_check_range(ip_range: str):
@@ -54,53 +123,836 @@ def _typer_check_range(ip_range: str):
 
 
 @app.command()
-def scan_arp(ip_range: Annotated[str, typer.Option(callback=_typer_check_range, prompt=True)]):
-    """perform an arp scan of the ip-range."""
-    from port_scanner import networking
+def scan_arp(
+    ip_range: Annotated[str, typer.Option(callback=_typer_check_range, prompt=True)],
+    rate: Annotated[float, typer.Option(min=1, help="arp requests per second")] = ARP_RATE,
+    retries: Annotated[int, typer.Option(min=0, help="requests to silent addresses after the first")] = ARP_RETRIES,
+    stats: Annotated[bool, typer.Option(help="show the packet counters of the sweep at the end")] = False,  # noqa: FBT002
+):
+    """perform an arp scan of the ip-range.
 
-    devices = networking.arp_scan(ip_range)
+    With --stats the packets the kernel filter let through and dropped are shown next to the replies.
+    """
     table = Table()
     table.add_column("device ip address")
-    for device in devices:
-        table.add_row(device)
+    table.add_column("mac address")
+    table.add_column("rtt (ms)")
+    with Live(table, console=console, refresh_per_second=4):
+        for reply in arp_sweep(ip_range, rate=rate, retries=retries):
+            _logger().info(f"{reply.ip} is at {reply.mac}")
+            table.add_row(reply.ip, reply.mac, f"{reply.rtt * 1000:.1f}")
+    if stats:
+        _report_stats()
+
+
+def _typer_check_shard(shard: str) -> str:
+    """Check that `shard` is of the form `index/count`, counting from 1, for typer.
+
+    Args:
+        shard (str): the shard to check, like 2/4
+
+    Raises:
+        typer.BadParameter: raised if shard isn't of the form index/count with 1 <= index <= count
+    """
+    try:
+        index, count = (int(part) for part in shard.split("/"))
+    except ValueError:
+        msg = "Shard needs to be of the form index/count"
+        raise typer.BadParameter(msg) from None
+    if not 1 <= index <= count:
+        msg = "Shard index needs to be in between 1 and the number of shards"
+        raise typer.BadParameter(msg)
+    return shard
+
+
+def _discover_hosts(
+    hosts: Iterable[str], timings: HostTimings, limiter: RateLimiter
+) -> Iterator[tuple[str, float | None]]:
+    """Ping all `hosts` at once, or one by one with the ping command without the privileges for raw sockets."""
+    hosts = list(hosts)
+    reported = set()
+    try:
+        for host, rtt in discover(hosts, timings=timings, limiter=limiter, report_down=True):
+            reported.add(host)
+            yield host, rtt
+    except PermissionError:
+        _logger().warning("not allowed to open raw sockets, falling back to the ping command")
+        for host in hosts:
+            if host in reported:
+                continue
+            rtt = ping_rtt(host)
+            if rtt is not None:
+                timings.update(host, rtt)
+            yield host, rtt
+
+
+def _report_hosts(found: Iterable[tuple[str, float | None]]) -> Iterator[str]:
+    """Print and log whether every host is up, and yield the ones that are."""
+    for host, rtt in found:
+        if rtt is not None:
+            console.print(f"{host} seems to be up")
+            _logger().info(f"{host} seems to be up")
+            yield host
+        else:
+            console.print(f"{host} could not be pinged")
+            _logger().error(f"{host} could not be pinged")
+
+
+def _live_hosts(hosts: Iterable[str], timings: HostTimings, limiter: RateLimiter) -> list[str]:
+    """Ping every host and return the ones that answer, seeding `timings` with their round trip times."""
+    return list(_report_hosts(_discover_hosts(hosts, timings, limiter)))
+
+
+def _arp_hosts(host_ranges: Ranges) -> Iterator[str]:
+    """Arp scan every host in `host_ranges` and yield the ones that answer, as they answer."""
+    for start, end in host_ranges:
+        scanner = ArpScanner.for_network(str(ipaddress.IPv4Address(start)))
+        found = scanner.sweep(str(ipaddress.IPv4Address(address)) for address in range(start, end + 1))
+        yield from _report_hosts((reply.ip, reply.rtt) for reply in found)
+
+
+class Engine(NamedTuple):
+    """The options of the scan engine, shared by every scan command."""
+
+    use_tcp_syn: bool = False
+    concurrency: int = 1
+    workers: int = 1
+    retries: int = DEFAULT_RETRIES
+    rate: float | None = None
+    host_rate: float | None = None
+    min_timeout: float = MIN_TIMEOUT
+    max_timeout: float = MAX_TIMEOUT
+    initial_timeout: float = INITIAL_TIMEOUT
+    wait_between_ports: float = 0
+
+
+class Report(NamedTuple):
+    """How the results and metrics of a scan are shown and written, shared by every scan command."""
+
+    headless: bool = False
+    log_results: ResultLog = ResultLog.ALL
+    output: OutputFormat | None = None
+    output_file: str = "-"
+    stats: bool = False
+    stats_file: Path | None = None
+    stats_interval: float = STATS_INTERVAL
+    metrics_port: int | None = None
+
+
+# the options every scan command has, declared once so their checks and help can't drift apart
+_Host = Annotated[
+    str | None, typer.Option(callback=_typer_check_host, help="ip addresses, networks and ranges, comma separated")
+]
+_HostsFile = Annotated[Path | None, typer.Option(exists=True, dir_okay=False, help="file with hosts to scan")]
+_Ports = Annotated[
+    str | None, typer.Option(callback=_typer_check_ports, help="ports, port ranges and named sets like top-1000")
+]
+_UseTcpSyn = Annotated[bool, typer.Option()]
+_Concurrency = Annotated[int, typer.Option(min=1, help="connects in flight, above 1 uses the asyncio engine")]
+_Workers = Annotated[int, typer.Option(min=1, help="threads that connect at once, results stay in target order")]
+_Rate = Annotated[
+    float | None, typer.Option(help=f"probes per second over all hosts, {DEFAULT_RATE} for --use-tcp-syn")
+]
+_HostRate = Annotated[float | None, typer.Option(help="probes per second to a single host")]
+_Randomize = Annotated[bool, typer.Option(help="visit the targets in pseudo-random order")]
+_Retries = Annotated[int, typer.Option(min=0, help="retransmissions of unanswered probes")]
+_MinTimeout = Annotated[float, typer.Option(help="lower bound of the adaptive timeout")]
+_MaxTimeout = Annotated[float, typer.Option(help="upper bound of the adaptive timeout")]
+_InitialTimeout = Annotated[
+    float, typer.Option(help="timeout of a host that hasn't answered yet, and of one that never does")
+]
+_Headless = Annotated[bool, typer.Option(help="don't show a live view, only a summary at the end")]
+_LogResults = Annotated[ResultLog, typer.Option(help="which results to log")]
+_Output = Annotated[OutputFormat | None, typer.Option(help="also write every result in this format, as it comes in")]
+_OutputFile = Annotated[str, typer.Option(help="file the results are written to, - for stdout")]
+_Store = Annotated[
+    Path | None, typer.Option(dir_okay=False, help="keep the state of every port in this compact result file")
+]
+_StoreLatency = Annotated[bool, typer.Option(help="keep every latency in the result file too")]
+_Stats = Annotated[bool, typer.Option(help="show the counters and stage latencies of the scan at the end")]
+_StatsFile = Annotated[
+    Path | None, typer.Option(dir_okay=False, help="append the metrics as a JSON line to this file periodically")
+]
+_StatsInterval = Annotated[float, typer.Option(help="seconds in between two lines of --stats-file")]
+_MetricsPort = Annotated[
+    int | None, typer.Option(min=0, max=MAX_PORT, help="serve the metrics in the Prometheus format on this port")
+]
+
+
+def _limits(engine: Engine) -> tuple[HostTimings, RateLimiter]:
+    """Check the engine options and build the timings and rate limiter every scan command shares."""
+    if engine.concurrency > 1 and engine.use_tcp_syn:
+        msg = "--concurrency can't be combined with --use-tcp-syn"
+        raise typer.BadParameter(msg)
+    if engine.workers > 1 and (engine.use_tcp_syn or engine.concurrency > 1):
+        msg = "--workers can't be combined with --use-tcp-syn or --concurrency"
+        raise typer.BadParameter(msg)
+    rate = engine.rate
+    if rate is None and engine.use_tcp_syn:
+        rate = DEFAULT_RATE
+    if engine.wait_between_ports:
+        # a single probe every `wait_between_ports` seconds, without bursts
+        rate = min(rate or math.inf, 1 / engine.wait_between_ports)
+    try:
+        timings = HostTimings(
+            initial_timeout=engine.initial_timeout, min_timeout=engine.min_timeout, max_timeout=engine.max_timeout
+        )
+        limiter = RateLimiter(rate, engine.host_rate, burst=1 if engine.wait_between_ports else None)
+    except ValueError as e:
+        raise typer.BadParameter(str(e)) from None
+    return timings, limiter
+
+
+def _run_scan(
+    targets: Iterable[tuple[str, int]] | AsyncIterable[tuple[str, int]],
+    *,
+    engine: Engine,
+    timings: HostTimings,
+    limiter: RateLimiter,
+    report: Report,
+    total: int | None = None,
+    checkpoint: Checkpoint | None = None,
+    store: ResultStore | None = None,
+    differ: Differ | None = None,
+    results: Iterable[ProbeResult] | None = None,
+    detector: ServiceDetector | None = None,
+) -> None:
+    """Scan `targets` with the engine the options pick, showing open ports and progress as results come in.
+
+    `targets` has to be async iterable for the asyncio engine, used when the `engine` concurrency is above 1, and
+    iterable otherwise. With more than one worker the connects run on a thread pool instead. How the results and
+    metrics are shown, logged and written is up to `report`. Every result is marked done in `checkpoint` and added
+    to `store`, if given. With a `differ` only the results that changed since its baseline are logged and written.
+    `results` that are scanned elsewhere, by worker processes, are shown instead of scanning `targets`. A connect
+    scan hands the connections to open ports to `detector`, whose services are shown at the end.
+    """
+    view = ScanView(total)
+    log = ResultLogger(_logger(), report.log_results, summary=view.summary)
+    stats_dumper = _stats_dumper(report.stats_file, report.stats_interval)
+    writer = open_output(report.output, report.output_file) if report.output is not None else None
+
+    def _add_result(result: ProbeResult) -> None:
+        RESULTS.inc()
+        changed = differ is None or differ(result) is not None
+        if changed or report.log_results == ResultLog.SUMMARY:
+            log(result)
+        view.add(result)
+        if checkpoint is not None:
+            checkpoint.mark(result.host, result.port)
+        if store is not None:
+            store.add(result)
+        if writer is not None and changed:
+            start = time.perf_counter()
+            writer.write(result)
+            _OUTPUT.observe(time.perf_counter() - start)
+
+    with (
+        writer if writer is not None else contextlib.nullcontext(),
+        checkpoint if checkpoint is not None else contextlib.nullcontext(),
+        store if store is not None else contextlib.nullcontext(),
+        differ.baseline if differ is not None else contextlib.nullcontext(),
+        detector if detector is not None else contextlib.nullcontext(),
+        stats_dumper if stats_dumper is not None else contextlib.nullcontext(),
+        _serve_metrics(report.metrics_port),
+        contextlib.nullcontext() if report.headless else Live(view, console=console, refresh_per_second=4),
+    ):
+        if results is not None:
+            for result in results:
+                _add_result(result)
+        elif engine.use_tcp_syn:
+            for result in SynScanner(retries=engine.retries, timings=timings, limiter=limiter).scan_targets(targets):  # type: ignore
+                _add_result(result)
+        elif engine.workers > 1:
+            for result in scan_threads(
+                targets,  # type: ignore
+                workers=engine.workers,
+                timings=timings,
+                retries=engine.retries,
+                limiter=limiter,
+                on_open=detector,
+            ):
+                _add_result(result)
+        elif engine.concurrency > 1:
+
+            async def _scan() -> None:
+                async for result in scan_targets(
+                    targets,
+                    concurrency=engine.concurrency,
+                    timings=timings,
+                    retries=engine.retries,
+                    limiter=limiter,
+                    on_open=detector,
+                ):
+                    _add_result(result)
+
+            asyncio.run(_scan())
+        else:
+            scan = functools.partial(probe, timings=timings, retries=engine.retries, limiter=limiter, on_open=detector)
+            for target_host, port in targets:  # type: ignore
+                _add_result(scan(target_host, port))
+    log.close()
+    if report.headless:
+        console.print(view.summary())
+    if differ is not None:
+        _report_changes(differ.changes)
+    if detector is not None:
+        _report_services(detector.services, detector.skipped)
+    if report.stats:
+        _report_stats()
+
+
+@contextlib.contextmanager
+def _serve_metrics(port: int | None) -> Iterator[None]:
+    """Serve the metrics on `port` of this machine while the scan runs, if given."""
+    if port is None:
+        yield
+        return
+    try:
+        server = serve_metrics(port)
+    except OSError as e:
+        msg = f"can't serve metrics on port {port}: {e.strerror}"
+        raise typer.BadParameter(msg) from None
+    console.print(f"metrics on http://127.0.0.1:{server.server_address[1]}/metrics")
+    try:
+        yield
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def _report_stats() -> None:
+    """Show the counters, queue depths and stage latencies of the scan."""
+    table = Table(title="stats")
+    table.add_column("Metric")
+    table.add_column("Value")
+    table.add_column("p50 (ms)")
+    table.add_column("p99 (ms)")
+    table.add_column("total (s)")
+    for metric in sorted(METRICS, key=lambda metric: (metric.kind, metric.name, sorted(metric.labels.items()))):
+        name = ",".join([metric.name, *metric.labels.values()])
+        if isinstance(metric, Counter):
+            table.add_row(name, f"{metric.value}")
+        elif isinstance(metric, Gauge):
+            table.add_row(name, f"{metric.value:g} (peak {metric.peak:g})")
+        elif metric.count:
+            table.add_row(
+                name,
+                f"{metric.count}",
+                f"{metric.quantile(0.5) * 1000:.3f}",
+                f"{metric.quantile(0.99) * 1000:.3f}",
+                f"{metric.sum:.3f}",
+            )
+    console.print(table)
+
+
+def _stats_dumper(path: Path | None, interval: float) -> StatsDumper | None:
+    """Append the metrics to `path` every `interval` seconds while the scan runs, if given."""
+    if path is None:
+        return None
+    try:
+        return StatsDumper(path, interval)
+    except ValueError as e:
+        raise typer.BadParameter(str(e)) from None
+
+
+def _report_changes(changes: list[Change]) -> None:
+    """Show the ports that opened or closed since the baseline."""
+    if not changes:
+        console.print("no changes since the baseline")
+        return
+    table = Table(title="changes since the baseline")
+    table.add_column("Host")
+    table.add_column("Port")
+    table.add_column("before")
+    table.add_column("now")
+    for change in changes:
+        before = "not scanned" if change.before is None else change.before.name.lower()
+        table.add_row(change.host, f"{change.port}", before, change.after.name.lower())
     console.print(table)
 
 
+def _report_services(services: list[Service], skipped: int) -> None:
+    """Show the services found on the open ports, in target order."""
+    table = Table(title="services")
+    table.add_column("Host")
+    table.add_column("Port")
+    table.add_column("Service")
+    table.add_column("Version")
+    for service in sorted(services, key=lambda service: (ipaddress.IPv4Address(service.host), service.port)):
+        table.add_row(service.host, f"{service.port}", service.name or "unknown", service.version or "")
+        _logger().info(f"{service.host}:{service.port} {service.name or 'unknown'} {service.version or ''}".rstrip())
+    console.print(table)
+    if skipped:
+        console.print(f"{skipped} open ports skipped, raise --service-concurrency to identify them")
+
+
+def _targets(
+    host: str | None,
+    hosts_file: Path | None,
+    ports: str | None,
+    start_port: int | None = None,
+    end_port: int | None = None,
+) -> TargetSpec:
+    """The targets of a scan command, prompting for whatever is missing.
+
+    Without `ports` the range from `start_port` to `end_port` is scanned.
+    """
+    if host is None and hosts_file is None:
+        host = _typer_check_host(typer.prompt("Host"))
+    if ports is None:
+        if start_port is None:
+            start_port = typer.prompt("Start port", type=int)
+        if end_port is None:
+            end_port = typer.prompt("End port", type=int)
+        start_port, end_port = max(MIN_PORT, start_port), min(MAX_PORT, end_port)  # type: ignore
+        if start_port > end_port:
+            msg = "--start-port can't be higher than --end-port"
+            raise typer.BadParameter(msg)
+        ports = f"{start_port}-{end_port}"
+
+    host_ranges = parse_hosts(host) if host is not None else []
+    if hosts_file is not None:
+        host_ranges += read_hosts_file(hosts_file)
+    return TargetSpec(host_ranges, parse_ports(ports))
+
+
+def _result_store(path: Path | None, hosts: Ranges, *, latency: bool) -> ResultStore | None:
+    """The store results are added to, an existing one for the same hosts is added to, to resume or rescan."""
+    if path is None:
+        return None
+    if path.exists():
+        try:
+            store = ResultStore.open(path, writable=True)
+        except ValueError as e:
+            raise typer.BadParameter(str(e)) from None
+        if store.host_ranges == hosts and store.has_latency == latency:
+            return store
+        store.close()
+    return ResultStore.create(hosts, path, latency=latency)
+
+
+def _check_output(report: Report) -> None:
+    """Move everything but the results to stderr when they are written to stdout."""
+    if report.output is not None and report.output_file == "-":
+        console.stderr = True
+
+
 @app.command()
 def port_scan(
-    host: Annotated[str, typer.Option(callback=_typer_check_host, prompt=True)],
-    start_port: Annotated[int, typer.Option(prompt=True)],
-    end_port: Annotated[int, typer.Option(prompt=True)],
+    *,
+    host: _Host = None,
+    hosts_file: _HostsFile = None,
+    ports: _Ports = None,
+    start_port: Annotated[int | None, typer.Option()] = None,
+    end_port: Annotated[int | None, typer.Option()] = None,
     wait_between_ports: Annotated[float, typer.Option()] = 0,
-    use_tcp_syn: bool = False,  # noqa: FBT001, FBT002
-    skip_ping: bool = False,  # noqa: FBT002, FBT001
+    use_tcp_syn: _UseTcpSyn = False,
+    skip_ping: Annotated[bool, typer.Option()] = False,
+    concurrency: _Concurrency = 1,
+    workers: _Workers = 1,
+    rate: _Rate = None,
+    host_rate: _HostRate = None,
+    randomize: _Randomize = False,
+    seed: Annotated[int | None, typer.Option(help="seed of the random order, reuse it to resume or shard")] = None,
+    shard: Annotated[str, typer.Option(callback=_typer_check_shard, help="only scan shard INDEX/COUNT")] = "1/1",
+    start_index: Annotated[int, typer.Option(min=0, help="skip this many targets of the shard, to resume")] = 0,
+    retries: _Retries = DEFAULT_RETRIES,
+    min_timeout: _MinTimeout = MIN_TIMEOUT,
+    max_timeout: _MaxTimeout = MAX_TIMEOUT,
+    initial_timeout: _InitialTimeout = INITIAL_TIMEOUT,
+    headless: _Headless = False,
+    log_results: _LogResults = ResultLog.ALL,
+    output: _Output = None,
+    output_file: _OutputFile = "-",
+    store: _Store = None,
+    store_latency: _StoreLatency = False,
+    checkpoint_file: Annotated[
+        Path | None, typer.Option("--checkpoint", dir_okay=False, help="keep track of the progress in this file")
+    ] = None,
+    resume: Annotated[
+        Path | None,
+        typer.Option(exists=True, dir_okay=False, help="continue the scan of this checkpoint, ignoring the targets"),
+    ] = None,
+    baseline: Annotated[
+        Path | None,
+        typer.Option(exists=True, dir_okay=False, help="result file of an earlier scan, only report what changed"),
+    ] = None,
+    closed_policy: Annotated[
+        ClosedPolicy, typer.Option(help="what to do with ports that weren't open in the baseline")
+    ] = ClosedPolicy.SCAN,
+    sample: Annotated[
+        float, typer.Option(min=0, max=1, help="fraction of those ports probed with --closed-policy sample")
+    ] = DEFAULT_SAMPLE,
+    processes: Annotated[
+        int, typer.Option(min=1, help="worker processes that each scan a shard, with a share of the rate")
+    ] = 1,
+    services: Annotated[bool, typer.Option(help="identify the services on open ports, reusing the connection")] = False,
+    service_concurrency: Annotated[
+        int, typer.Option(min=1, help="services identified at once, apart from the connects of the scan")
+    ] = SERVICE_CONCURRENCY,
+    service_timeout: Annotated[float, typer.Option(min=0, help="seconds spent on a service at most")] = SERVICE_TIMEOUT,
+    stats: _Stats = False,
+    stats_file: _StatsFile = None,
+    stats_interval: _StatsInterval = STATS_INTERVAL,
+    metrics_port: _MetricsPort = None,
 ) -> None:
-    """Scan host's ports from start-port to end-port"""
-    if not skip_ping:
-        if ping(host):
-            console.print(f"{host} seems to be up")
-            LOGGER.info(f"{host} seems to be up")
-        else:
-            console.print(f"{host} could not be pinged")
-            LOGGER.error(f"{host} could not be pinged")
+    """Scan the ports of one or more hosts.
+
+    Ports are given with --ports or as the range from --start-port to --end-port. With --checkpoint the progress is
+    kept in a file, and --resume continues the scan where it stopped. With --baseline the ports that were open in an
+    earlier scan are probed first and only the ports that opened or closed since are reported. With --processes
+    the scan is spread over several cores. With --services the connections to open ports are kept to find out
+    which service listens. --stats, --stats-file and --metrics-port show how the scan itself is doing.
+    """
+    if baseline is not None and (randomize or shard != "1/1" or start_index or checkpoint_file or resume):
+        msg = "--baseline can't be combined with --randomize, --shard, --start-index, --checkpoint or --resume"
+        raise typer.BadParameter(msg)
+    if baseline is not None and processes > 1:
+        msg = "--baseline can't be combined with --processes"
+        raise typer.BadParameter(msg)
+    if workers > 1 and processes > 1:
+        msg = "--workers can't be combined with --processes"
+        raise typer.BadParameter(msg)
+    if services and (use_tcp_syn or processes > 1):
+        msg = "--services needs a connect scan, it can't be combined with --use-tcp-syn or --processes"
+        raise typer.BadParameter(msg)
+    if baseline is not None and store is not None and store.resolve() == baseline.resolve():
+        msg = "--store needs to be another file than --baseline"
+        raise typer.BadParameter(msg)
+    engine = Engine(
+        use_tcp_syn=use_tcp_syn,
+        concurrency=concurrency,
+        workers=workers,
+        retries=retries,
+        rate=rate,
+        host_rate=host_rate,
+        min_timeout=min_timeout,
+        max_timeout=max_timeout,
+        initial_timeout=initial_timeout,
+        wait_between_ports=wait_between_ports,
+    )
+    report = Report(
+        headless=headless,
+        log_results=log_results,
+        output=output,
+        output_file=output_file,
+        stats=stats,
+        stats_file=stats_file,
+        stats_interval=stats_interval,
+        metrics_port=metrics_port,
+    )
+    _check_output(report)
+    timings, limiter = _limits(engine)
+    if resume is not None:
+        try:
+            checkpoint = Checkpoint.open(resume)
+        except ValueError as e:
+            raise typer.BadParameter(str(e)) from None
+        # the targets were pinged and ordered when the scan started
+        targets = checkpoint.targets
+        seed, randomize, shard, start_index = (
+            checkpoint.settings[key] for key in ("seed", "randomize", "shard", "start")
+        )
+        console.print(f"resuming: {checkpoint.completed} probes were done")
+    else:
+        targets = _targets(host, hosts_file, ports, start_port, end_port)
+        if not skip_ping:
+            live = _live_hosts(targets.hosts(), timings, limiter)
+            if not live:
+                sys.exit(1)
+            targets = TargetSpec(parse_hosts(",".join(live)), targets.port_ranges)
+        if randomize and seed is None:
+            seed = random.getrandbits(32)
+            console.print(f"random order seed: {seed}")
+            _logger().info(f"random order seed: {seed}")
+        checkpoint = (
+            Checkpoint.create(checkpoint_file, targets, seed=seed, randomize=randomize, shard=shard, start=start_index)
+            if checkpoint_file is not None
+            else None
+        )
+    shard_index, shard_count = (int(part) for part in shard.split("/"))
+    ordered = walk(
+        targets, seed=seed, randomize=randomize, shard=shard_index - 1, shards=shard_count, start=start_index
+    )
+    total = len(range(shard_index - 1 + start_index * shard_count, len(targets), shard_count))
+    if checkpoint is not None:
+        ordered = checkpoint.pending(ordered)
+        total -= checkpoint.completed
+    result_store = _result_store(store, targets.host_ranges, latency=store_latency)
+    differ = None
+    if baseline is not None:
+        try:
+            differ = Differ(ResultStore.open(baseline))
+        except ValueError as e:
+            raise typer.BadParameter(str(e)) from None
+        ordered = plan(targets, differ.baseline, policy=closed_policy, sample=sample, seed=seed, carry=result_store)
+
+    results = None
+    if processes > 1:
+        results = scan_processes(
+            targets,
+            processes=processes,
+            seed=seed,
+            randomize=randomize,
+            shard=shard_index - 1,
+            shards=shard_count,
+            start=start_index,
+            use_tcp_syn=use_tcp_syn,
+            concurrency=concurrency,
+            retries=retries,
+            timings=timings,
+            limiter=limiter,
+            checkpoint=checkpoint.path if checkpoint is not None else None,
+        )
+    try:
+        _run_scan(
+            ordered,
+            engine=engine,
+            timings=timings,
+            limiter=limiter,
+            report=report,
+            # how many closed ports are probed isn't known up front
+            total=total if differ is None or closed_policy == ClosedPolicy.SCAN else None,
+            checkpoint=checkpoint,
+            store=result_store,
+            differ=differ,
+            results=results,
+            detector=ServiceDetector(concurrency=service_concurrency, timeout=service_timeout) if services else None,
+        )
+    except RuntimeError as e:
+        if results is None:
+            raise
+        # a worker process failed or died
+        console.print(f"scan failed: {e}")
+        sys.exit(1)
+
+
+@app.command()
+def coordinate(
+    *,
+    host: _Host = None,
+    hosts_file: _HostsFile = None,
+    ports: _Ports = "top-1000",
+    listen: Annotated[
+        str, typer.Option(help="HOST:PORT workers connect to, only loopback by default, 0.0.0.0 for every interface")
+    ] = f"{DEFAULT_HOST}:{DEFAULT_PORT}",
+    pieces: Annotated[int, typer.Option(min=1, help="pieces the scan is split into and handed out")] = DEFAULT_PIECES,
+    lease: Annotated[
+        float, typer.Option(min=0.1, help="seconds a worker can stay silent before its piece is handed to another")
+    ] = DEFAULT_LEASE,
+    use_tcp_syn: _UseTcpSyn = False,
+    concurrency: _Concurrency = 1,
+    rate: Annotated[
+        float | None,
+        typer.Option(help=f"probes per second of every worker, {DEFAULT_RATE} for --use-tcp-syn"),
+    ] = None,
+    host_rate: Annotated[float | None, typer.Option(help="probes per second to a single host of every worker")] = None,
+    randomize: _Randomize = False,
+    seed: Annotated[int | None, typer.Option(help="seed of the random order")] = None,
+    retries: _Retries = DEFAULT_RETRIES,
+    min_timeout: _MinTimeout = MIN_TIMEOUT,
+    max_timeout: _MaxTimeout = MAX_TIMEOUT,
+    initial_timeout: _InitialTimeout = INITIAL_TIMEOUT,
+    headless: _Headless = False,
+    log_results: _LogResults = ResultLog.ALL,
+    output: _Output = None,
+    output_file: _OutputFile = "-",
+    store: _Store = None,
+    store_latency: _StoreLatency = False,
+) -> None:
+    """Hand out the scan of one or more hosts to workers started with scan-worker, and merge their results.
+
+    The hosts aren't pinged, workers scan every target. A piece whose worker goes away, stays silent for longer
+    than --lease or fails is handed to another worker.
+    """
+    engine = Engine(
+        use_tcp_syn=use_tcp_syn,
+        concurrency=concurrency,
+        retries=retries,
+        rate=rate,
+        host_rate=host_rate,
+        min_timeout=min_timeout,
+        max_timeout=max_timeout,
+        initial_timeout=initial_timeout,
+    )
+    report = Report(headless=headless, log_results=log_results, output=output, output_file=output_file)
+    _check_output(report)
+    timings, limiter = _limits(engine)
+    targets = _targets(host, hosts_file, ports)
+    try:
+        coordinator = Coordinator(
+            targets,
+            address=listen,
+            pieces=pieces,
+            lease=lease,
+            seed=seed,
+            randomize=randomize,
+            use_tcp_syn=use_tcp_syn,
+            concurrency=concurrency,
+            retries=retries,
+            timings=timings,
+            limiter=limiter,
+        )
+    except (ValueError, OSError) as e:
+        raise typer.BadParameter(str(e)) from None
+    with coordinator:
+        address, port = coordinator.listening
+        console.print(f"waiting for workers on {address}:{port}")
+        try:
+            _run_scan(
+                [],
+                engine=engine,
+                timings=timings,
+                limiter=limiter,
+                report=report,
+                total=len(targets),
+                store=_result_store(store, targets.host_ranges, latency=store_latency),
+                results=coordinator,
+            )
+        except RuntimeError as e:
+            console.print(f"scan failed: {e}")
             sys.exit(1)
+        finally:
+            for worker, reason in coordinator.failed.items():
+                console.print(f"dropped {worker}: {reason}")
+
+
+@app.command()
+def scan_worker(
+    coordinator: Annotated[str, typer.Argument(help="HOST:PORT of the coordinator")],
+    name: Annotated[
+        str | None, typer.Option(help="how the coordinator calls this worker, the host name by default")
+    ] = None,
+) -> None:
+    """Scan the pieces a coordinator hands out, until its scan is done."""
+    try:
+        scanned = run_worker(coordinator, name=name)
+    except ValueError as e:
+        raise typer.BadParameter(str(e)) from None
+    except PermissionError as e:
+        # like raw sockets for --use-tcp-syn without root, the coordinator is fine
+        console.print(f"not allowed to scan: {e}")
+        sys.exit(1)
+    except OSError as e:
+        console.print(f"lost the coordinator: {e}")
+        sys.exit(1)
+    console.print(f"{scanned} pieces scanned")
+
+
+class Discovery(enum.StrEnum):
+    """How `discover-scan` finds the hosts to scan."""
 
-    if use_tcp_syn:
-        scan = tcp_syn_scan
+    PING = "ping"
+    ARP = "arp"
+
+
+@app.command()
+def discover_scan(
+    *,
+    host: _Host = None,
+    hosts_file: _HostsFile = None,
+    ports: _Ports = "top-1000",
+    discovery: Annotated[Discovery, typer.Option(help="find live hosts with pings or arp requests")] = Discovery.PING,
+    queue_size: Annotated[
+        int, typer.Option(min=1, help="discovered hosts waiting to be scanned before discovery pauses")
+    ] = DEFAULT_QUEUE_SIZE,
+    use_tcp_syn: _UseTcpSyn = False,
+    concurrency: _Concurrency = 1,
+    workers: _Workers = 1,
+    rate: _Rate = None,
+    host_rate: _HostRate = None,
+    retries: _Retries = DEFAULT_RETRIES,
+    min_timeout: _MinTimeout = MIN_TIMEOUT,
+    max_timeout: _MaxTimeout = MAX_TIMEOUT,
+    initial_timeout: _InitialTimeout = INITIAL_TIMEOUT,
+    headless: _Headless = False,
+    log_results: _LogResults = ResultLog.ALL,
+    output: _Output = None,
+    output_file: _OutputFile = "-",
+    store: _Store = None,
+    store_latency: _StoreLatency = False,
+    stats: _Stats = False,
+    stats_file: _StatsFile = None,
+    stats_interval: _StatsInterval = STATS_INTERVAL,
+    metrics_port: _MetricsPort = None,
+) -> None:
+    """Find the live hosts among one or more hosts and scan them while discovery is still running.
+
+    Every host is scanned as soon as it is found. Discovery pauses while --queue-size hosts are waiting to be scanned.
+    """
+    engine = Engine(
+        use_tcp_syn=use_tcp_syn,
+        concurrency=concurrency,
+        workers=workers,
+        retries=retries,
+        rate=rate,
+        host_rate=host_rate,
+        min_timeout=min_timeout,
+        max_timeout=max_timeout,
+        initial_timeout=initial_timeout,
+    )
+    report = Report(
+        headless=headless,
+        log_results=log_results,
+        output=output,
+        output_file=output_file,
+        stats=stats,
+        stats_file=stats_file,
+        stats_interval=stats_interval,
+        metrics_port=metrics_port,
+    )
+    _check_output(report)
+    timings, limiter = _limits(engine)
+    spec = _targets(host, hosts_file, ports)
+    if discovery == Discovery.ARP:
+        found = _arp_hosts(spec.host_ranges)
     else:
-        scan = is_port_open
-    if wait_between_ports:
-        scan = rate_limit(wait_between_ports)(scan)
-    table = Table()
-    table.add_column("Port")
-    table.add_column("Status")
-    with Live(table, refresh_per_second=4):
-        ports = range(max(1, start_port), min(65535, end_port + 1))
-        for port in ports:
-            response = scan(host, port)
-            if response:
-                LOGGER.info(f"port {port} on {host} is open")
-                table.add_row(f"{port}", "[green]open[/]")
-            else:
-                LOGGER.info(f"port {port} on {host} is closed")
-                table.add_row(f"{port}", "[red]closed[/]")
+        found = _report_hosts(_discover_hosts(spec.hosts(), timings, limiter))
+    with HostPipe(found, queue_size) as pipe:
+        targets = aexpand(pipe, spec.port_ranges) if concurrency > 1 else expand(pipe, spec.port_ranges)
+        _run_scan(
+            targets,
+            engine=engine,
+            timings=timings,
+            limiter=limiter,
+            report=report,
+            store=_result_store(store, spec.host_ranges, latency=store_latency),
+        )
+    console.print(f"{pipe.discovered} live hosts scanned")
+
+
+class State(enum.StrEnum):
+    """Port states that can be queried."""
+
+    OPEN = "open"
+    CLOSED = "closed"
+    FILTERED = "filtered"
+
+
+@app.command()
+def results(
+    store: Annotated[Path, typer.Argument(exists=True, dir_okay=False, help="result file written with --store")],
+    host: Annotated[str | None, typer.Option(help="list the ports of this host")] = None,
+    port: Annotated[int | None, typer.Option(min=MIN_PORT, max=MAX_PORT, help="list the hosts with this port")] = None,
+    state: Annotated[State, typer.Option(help="the state of the listed ports")] = State.OPEN,
+) -> None:
+    """Query a result file and summarize it."""
+    try:
+        result_store = ResultStore.open(store)
+    except ValueError as e:
+        raise typer.BadParameter(str(e)) from None
+    port_state = PortState[state.name]
+    with result_store:
+        if host is not None:
+            try:
+                ports = result_store.ports(host, port_state)
+            except ValueError:
+                msg = f"{host} is not in {store}"
+                raise typer.BadParameter(msg) from None
+            console.print(f"{host}: {', '.join(str(port) for port in ports) or f'no {state} ports'}")
+        if port is not None:
+            hosts = result_store.hosts_with(port, port_state)
+            console.print(f"port {port} is {state} on {len(hosts)} hosts")
+            for found in hosts:
+                console.print(found)
+        console.print(result_store.summary())
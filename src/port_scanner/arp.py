@@ -0,0 +1,274 @@
+"""Streaming ARP sweeps.
+
+Requests are written one by one to a packet socket from a prebuilt frame, patching only the target address, and
+paced by a rate limiter so a large network doesn't overflow switch or host queues. Replies are matched by their
+sender address as they arrive and addresses that stay silent are asked again.
+"""
+
+import ipaddress
+import socket
+import struct
+from collections.abc import Iterable, Iterator
+from typing import NamedTuple
+
+from port_scanner.batch import DEFAULT_RETRIES, DEFAULT_TIMEOUT, BatchProber
+from port_scanner.packetio import (
+    ACCEPT,
+    BPF_ABS,
+    BPF_H,
+    BPF_JEQ,
+    BPF_JMP,
+    BPF_K,
+    BPF_LD,
+    BPF_RET,
+    BPF_W,
+    Instruction,
+    Packet,
+    PacketIO,
+    RawIO,
+    ScapyIO,
+    attach_filter,
+)
+from port_scanner.ratelimit import RateLimiter
+
+DEFAULT_RATE = 1000  # requests per second
+ETH_P_ARP = 0x0806
+ETH_P_IP = 0x0800
+ARP_REQUEST = 1
+ARP_REPLY = 2
+BROADCAST = b"\xff" * 6
+# ethernet header and arp message of an ipv4 over ethernet request
+FRAME = struct.Struct("!6s6sHHHBBH6s4s6s4s")
+OPERATION_OFFSET = 20  # of the arp operation in a frame
+TARGET_OFFSET = 38  # of the target protocol address in a frame
+
+
+class ArpReply(NamedTuple):
+    """A host that answered an ARP request."""
+
+    ip: str
+    mac: str
+    rtt: float
+
+
+def format_mac(mac: bytes) -> str:
+    """Format a hardware address like 02:fc:00:00:00:01."""
+    return mac.hex(":")
+
+
+def arp_request(source_mac: bytes, source_ip: str, target_ip: str) -> bytearray:
+    """Build a broadcast ARP request frame.
+
+    Args:
+        source_mac (bytes): hardware address of the interface the request is sent from
+        source_ip (str): ip address of the interface the request is sent from
+        target_ip (str): ip address whose hardware address is asked for
+
+    Returns:
+        bytearray: the ethernet frame
+    """
+    return bytearray(
+        FRAME.pack(
+            BROADCAST,
+            source_mac,
+            ETH_P_ARP,
+            1,  # ethernet
+            ETH_P_IP,
+            6,
+            4,
+            ARP_REQUEST,
+            source_mac,
+            socket.inet_aton(source_ip),
+            bytes(6),
+            socket.inet_aton(target_ip),
+        )
+    )
+
+
+def parse_arp_reply(frame: Packet) -> tuple[str, bytes, str] | None:
+    """Extract the addresses of an ARP reply, without copying the frame.
+
+    Args:
+        frame (Packet): an ethernet frame as read from a packet socket, or a view of one
+
+    Returns:
+        tuple[str, bytes, str] | None: sender ip address, sender hardware address and target ip address, or None if
+      it isn't an ipv4 ARP reply
+    """
+    if len(frame) < FRAME.size:
+        return None
+    _, _, ethertype, _, ptype, _, _, op, sha, spa, _, tpa = FRAME.unpack_from(frame)
+    if ethertype != ETH_P_ARP or ptype != ETH_P_IP or op != ARP_REPLY:
+        return None
+    return socket.inet_ntoa(spa), sha, socket.inet_ntoa(tpa)
+
+
+def reply_filter(source_ip: str) -> list[Instruction]:
+    """A classic BPF program that only admits ARP replies to `source_ip`.
+
+    Args:
+        source_ip (str): ip address of the interface the requests are sent from
+
+    Returns:
+        list[Instruction]: the program for a packet socket, see `packetio.attach_filter`
+    """
+    return [
+        (BPF_LD | BPF_H | BPF_ABS, 0, 0, 12),  # ethertype
+        (BPF_JMP | BPF_JEQ | BPF_K, 0, 5, ETH_P_ARP),
+        (BPF_LD | BPF_H | BPF_ABS, 0, 0, OPERATION_OFFSET),
+        (BPF_JMP | BPF_JEQ | BPF_K, 0, 3, ARP_REPLY),
+        (BPF_LD | BPF_W | BPF_ABS, 0, 0, TARGET_OFFSET),
+        (BPF_JMP | BPF_JEQ | BPF_K, 0, 1, int.from_bytes(socket.inet_aton(source_ip))),
+        (BPF_RET | BPF_K, 0, 0, ACCEPT),
+        (BPF_RET | BPF_K, 0, 0, 0),
+    ]
+
+
+def route(ip_network: str) -> tuple[str, str, bytes]:
+    """Find the interface `ip_network` is reached through.
+
+    Args:
+        ip_network (str): the network that is swept
+
+    Returns:
+        tuple[str, str, bytes]: name, ip address and hardware address of the interface
+    """
+    from scapy.all import conf, get_if_hwaddr  # type: ignore  # noqa: PLC0415
+
+    network = ipaddress.IPv4Network(ip_network, strict=False)
+    interface, address, _ = conf.route.route(str(network.network_address))
+    return interface, address, bytes.fromhex(get_if_hwaddr(interface).replace(":", ""))
+
+
+class ArpScanner(BatchProber[str, ArpReply]):
+    """Sweep ip addresses on the local network with ARP requests."""
+
+    def __init__(
+        self,
+        interface: str,
+        source_ip: str,
+        source_mac: bytes,
+        *,
+        rate: float = DEFAULT_RATE,
+        retries: int = DEFAULT_RETRIES,
+        timeout: float = DEFAULT_TIMEOUT,
+        limiter: RateLimiter | None = None,
+        transport: socket.socket | None = None,
+        io: PacketIO | None = None,
+    ) -> None:
+        """Configure the scanner.
+
+        Args:
+            interface (str): name of the interface to send from
+            source_ip (str): ip address of that interface
+            source_mac (bytes): hardware address of that interface
+            rate (float): maximum number of requests per second, retransmissions included, unless `limiter` is given
+            retries (int): how often an unanswered request is retransmitted
+            timeout (float): seconds to wait for a reply before retransmitting
+            limiter (RateLimiter | None): global and per host packet budgets, shared with other scanners
+            transport (socket.socket | None): packet socket to send and receive frames on, bound to `interface` if
+          not given
+            io (PacketIO | None): backend to send and receive frames on instead of the transport
+
+        Raises:
+            ValueError: if rate isn't positive or retries is negative
+        """
+        if rate <= 0:
+            msg = "rate needs to be positive"
+            raise ValueError(msg)
+        super().__init__(
+            retries=retries,
+            timeout=timeout,
+            limiter=limiter if limiter is not None else RateLimiter(rate),
+            send_socket=transport,
+            recv_socket=transport,
+            io=io,
+        )
+        self.interface = interface
+        self.source_ip = source_ip
+        self._frame = arp_request(source_mac, source_ip, "0.0.0.0")  # noqa: S104
+
+    @classmethod
+    def for_network(cls, ip_network: str, **kwargs) -> "ArpScanner":
+        """Create a scanner sending from the interface `ip_network` is reached through.
+
+        Args:
+            ip_network (str): the network that is swept
+            kwargs: passed on to the constructor
+
+        Returns:
+            ArpScanner: the scanner
+        """
+        return cls(*route(ip_network), **kwargs)
+
+    def sweep(self, hosts: Iterable[str]) -> Iterator[ArpReply]:
+        """Ask every host for its hardware address.
+
+        Args:
+            hosts (Iterable[str]): ip addresses to ask for
+
+        Yields:
+            ArpReply: every host that answered, as the replies come in
+        """
+        return self.run(hosts)
+
+    def _open_io(self) -> PacketIO:
+        family = getattr(socket, "AF_PACKET", None)
+        if family is None:
+            # no packet sockets, frames go through scapy's capture instead, with the filter in tcpdump's words
+            target = int.from_bytes(socket.inet_aton(self.source_ip))
+            return ScapyIO(interface=self.interface, capture_filter=f"arp[6:2] = {ARP_REPLY} and arp[24:4] = {target}")
+        sock = socket.socket(family, socket.SOCK_RAW, socket.htons(ETH_P_ARP))
+        # the requests of every other host on the network are broadcast to us too
+        attach_filter(sock, reply_filter(self.source_ip))
+        sock.bind((self.interface, 0))
+        return RawIO(sock)
+
+    def _host(self, key: str) -> str:
+        return key
+
+    def _transmit(self, key: str) -> None:
+        frame = self._frame
+        frame[TARGET_OFFSET : TARGET_OFFSET + 4] = socket.inet_aton(key)
+        self._io.send(frame)
+
+    def _expired(self, key: str, waited: float) -> None:  # noqa: ARG002
+        # silent addresses aren't reported
+        return None
+
+    def handle_reply(self, packet: Packet, source: str | None = None) -> None:  # noqa: ARG002
+        """Report the host `packet` comes from, if it is a reply to one of our requests.
+
+        Args:
+            packet (Packet): an ethernet frame as read from the packet socket
+            source (str | None): unused, the sender is read from the frame
+        """
+        reply = parse_arp_reply(packet)
+        if reply is None:
+            return
+        ip, mac, target = reply
+        if target != self.source_ip:
+            return
+        self._answered(ip, lambda rtt: ArpReply(ip, format_mac(mac), rtt))
+
+
+def arp_sweep(ip_network: str, **kwargs) -> Iterator[ArpReply]:
+    """Sweep every host address of `ip_network` with ARP requests.
+
+    Args:
+        ip_network (str): the network to sweep, like 192.168.0.0/24
+        kwargs: passed on to `ArpScanner`
+
+    Raises:
+        ValueError: if `ip_network` isn't an ipv4 network
+
+    Yields:
+        ArpReply: every host that answered, as the replies come in
+    """
+    try:
+        network = ipaddress.IPv4Network(ip_network, strict=False)
+    except ValueError:
+        msg = "Not a valid ip network"
+        raise ValueError(msg) from None
+    scanner = ArpScanner.for_network(ip_network, **kwargs)
+    return scanner.sweep(str(host) for host in network.hosts())
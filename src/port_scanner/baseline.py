@@ -0,0 +1,112 @@
+"""Differential scans against the results of an earlier scan.
+
+A rescan of the same hosts mostly confirms what the baseline already says. `plan` puts the ports that were open
+first, so whatever closed is found quickly, and thins out the ports that weren't open according to a `ClosedPolicy`.
+`Differ` tells which results differ from the baseline. The ports that aren't probed keep their baseline state in the
+store of the rescan, so it can be the baseline of the next one.
+"""
+
+import enum
+import random
+from collections.abc import Iterator
+from typing import NamedTuple
+
+from port_scanner.networking import PortState, ProbeResult
+from port_scanner.store import ResultStore
+from port_scanner.targets import TargetSpec
+
+DEFAULT_SAMPLE = 0.1  # fraction of the closed ports probed again when sampling
+
+
+class ClosedPolicy(enum.StrEnum):
+    """What to do with ports that were closed or filtered in the baseline."""
+
+    SCAN = "scan"  # probe them all again
+    SAMPLE = "sample"  # probe a random fraction of them
+    SKIP = "skip"  # only probe ports that were open or not probed
+
+
+class Change(NamedTuple):
+    """A port that opened or closed since the baseline."""
+
+    host: str
+    port: int
+    before: PortState | None  # None if the port wasn't probed in the baseline
+    after: PortState
+
+
+def plan(
+    targets: TargetSpec,
+    baseline: ResultStore,
+    *,
+    policy: ClosedPolicy = ClosedPolicy.SCAN,
+    sample: float = DEFAULT_SAMPLE,
+    seed: int | None = None,
+    carry: ResultStore | None = None,
+) -> Iterator[tuple[str, int]]:
+    """Order and thin out `targets` using what `baseline` knows about them.
+
+    First come the ports that were open, host by host, then every other target in the usual order. Ports that were
+    closed or filtered follow `policy`, ports and hosts the baseline doesn't know are always probed.
+
+    Args:
+        targets (TargetSpec): the targets of the scan
+        baseline (ResultStore): results of an earlier scan
+        policy (ClosedPolicy): what to do with ports that were closed or filtered
+        sample (float): fraction of those ports to probe with ClosedPolicy.SAMPLE
+        seed (int | None): seed of the sample, random if not given
+        carry (ResultStore | None): the store of this scan, the baseline state of every target that isn't probed is
+      copied to it as the targets are planned
+
+    Raises:
+        ValueError: if sample isn't in between 0 and 1
+
+    Yields:
+        tuple[str, int]: the (host, port) targets to probe
+    """
+    if not 0 <= sample <= 1:
+        msg = "sample needs to be in between 0 and 1"
+        raise ValueError(msg)
+    known = {host for host in targets.hosts() if host in baseline}
+    ports = set(targets.ports())
+    for host in sorted(known, key=targets.host_index):
+        for port in baseline.ports(host):
+            if port in ports:
+                yield host, port
+    chance = random.Random(seed).random  # noqa: S311
+    state = baseline.state
+    for host, port in targets:
+        if host not in known:
+            yield host, port
+            continue
+        before = state(host, port)
+        if before == PortState.OPEN:
+            # planned first
+            continue
+        if before is None or policy == ClosedPolicy.SCAN or (policy == ClosedPolicy.SAMPLE and chance() < sample):
+            yield host, port
+        elif carry is not None and host in carry:
+            carry.add(ProbeResult(host, port, before, baseline.latency(host, port) or 0.0))
+
+
+class Differ:
+    """Compare results with a baseline."""
+
+    def __init__(self, baseline: ResultStore) -> None:
+        """Compare with `baseline`.
+
+        Args:
+            baseline (ResultStore): results of an earlier scan
+        """
+        self.baseline = baseline
+        self.changes: list[Change] = []
+
+    def __call__(self, result: ProbeResult) -> Change | None:
+        """The change `result` makes, if a port opened or an open port no longer is, and remember it."""
+        host, port, after, _ = result
+        before = self.baseline.state(host, port) if host in self.baseline else None
+        if (after == PortState.OPEN) == (before == PortState.OPEN):
+            return None
+        change = Change(host, port, before, after)
+        self.changes.append(change)
+        return change
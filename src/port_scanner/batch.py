@@ -0,0 +1,236 @@
+"""Send-everything-then-collect probing over raw sockets.
+
+`BatchProber` runs a sender thread that streams probes and a receiver thread that matches replies, so sending never
+waits on the network. It keeps track of unanswered probes, retransmits them when their host's timeout expires and
+gives up after a bounded number of retries. Subclasses only know how to write a probe and how to read a reply.
+"""
+
+import heapq
+import itertools
+import queue
+import socket
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Callable, Hashable, Iterable, Iterator
+from typing import Generic, TypeVar
+
+from port_scanner.metrics import PROBES_SENT, REPLIES, RETRIES, TIMEOUTS, queue_depth, stage
+from port_scanner.packetio import Packet, PacketIO, SocketIO
+from port_scanner.ratelimit import RateLimiter
+from port_scanner.timing import HostTimings
+
+K = TypeVar("K", bound=Hashable)
+R = TypeVar("R")
+
+DEFAULT_RETRIES = 2  # retransmissions of an unanswered probe
+DEFAULT_TIMEOUT = 1.0  # seconds to wait for a reply before retransmitting
+_RATE_LIMIT = stage("rate_limit")
+_TRANSMIT = stage("transmit")  # building a probe and writing it to the socket
+_REPLY = stage("reply")  # round trip of answered probes
+_PENDING = queue_depth("pending")  # probes waiting for a reply
+
+
+class BatchProber(ABC, Generic[K, R]):
+    """Stream probes from one thread and match their replies on another.
+
+    Probes are identified by a key, like a (host, port) pair. Subclasses implement `_open_io`, `_host`, `_transmit`,
+    `_expired` and `handle_reply`, write probes to `_io` and report matched replies through `_answered`.
+    """
+
+    def __init__(
+        self,
+        *,
+        retries: int = DEFAULT_RETRIES,
+        timeout: float = DEFAULT_TIMEOUT,
+        timings: HostTimings | None = None,
+        limiter: RateLimiter | None = None,
+        send_socket: socket.socket | None = None,
+        recv_socket: socket.socket | None = None,
+        io: PacketIO | None = None,
+    ) -> None:
+        """Configure the prober.
+
+        Args:
+            retries (int): how often an unanswered probe is retransmitted before giving up
+            timeout (float): seconds to wait for a reply before retransmitting, unless `timings` is given
+            timings (HostTimings | None): derive timeouts from the round trip times of every host, and update them
+            limiter (RateLimiter | None): global and per host packet budgets, unlimited if not given
+            send_socket (socket.socket | None): socket probes are written to, see `_open_io` if not given
+            recv_socket (socket.socket | None): socket replies are read from, see `_open_io` if not given
+            io (PacketIO | None): backend probes are written to and replies read from, instead of the sockets
+
+        Raises:
+            ValueError: if retries is negative
+        """
+        if retries < 0:
+            msg = "retries can't be negative"
+            raise ValueError(msg)
+        self.retries = retries
+        self.timeout = timeout
+        self.timings = timings
+        self.limiter = limiter if limiter is not None else RateLimiter()
+        if io is None and send_socket is not None and recv_socket is not None:
+            io = SocketIO(send_socket, recv_socket)
+        self._given_io = io
+        self._io: PacketIO = io  # type: ignore
+        # key -> (time of the last transmission, retransmissions so far)
+        self._pending: dict[K, tuple[float, int]] = {}
+        # (deadline, time of the transmission, tie breaker, key), entries answered meanwhile are skipped
+        self._deadlines: list[tuple[float, float, int, K]] = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._results: queue.SimpleQueue[R | None] = queue.SimpleQueue()
+        self._error: BaseException | None = None
+
+    @abstractmethod
+    def _open_io(self) -> PacketIO:
+        """Open the backend to send probes on and read replies from, when it wasn't given."""
+
+    @abstractmethod
+    def _host(self, key: K) -> str:
+        """The host a probe is sent to, for rate limiting and timeouts."""
+
+    @abstractmethod
+    def _transmit(self, key: K) -> None:
+        """Write the probe for `key` to `_io`."""
+
+    @abstractmethod
+    def _expired(self, key: K, waited: float) -> R | None:
+        """The result for a probe that was never answered, or None to report nothing."""
+
+    @abstractmethod
+    def handle_reply(self, packet: Packet, source: str | None = None) -> None:
+        """Match a packet read from the backend to a probe and report it through `_answered`.
+
+        The packet may be a view of a buffer that is reused once this returns.
+
+        Args:
+            packet (Packet): the packet as read from the backend
+            source (str | None): the address the packet came from
+        """
+
+    def run(self, keys: Iterable[K]) -> Iterator[R]:
+        """Probe every key and yield results as they come in.
+
+        Keys are consumed lazily by the sender thread.
+
+        Args:
+            keys (Iterable[K]): the probes to send
+
+        Yields:
+            R: the result of every probe, in the order they were resolved
+        """
+        self._io = self._given_io if self._given_io is not None else self._open_io()
+        stop = threading.Event()
+        receiver = threading.Thread(target=self._receive, args=(stop,), daemon=True)
+        sender = threading.Thread(target=self._send_all, args=(keys, stop), daemon=True)
+        receiver.start()
+        sender.start()
+        try:
+            while (result := self._results.get()) is not None:
+                yield result
+            if self._error is not None:
+                raise self._error
+        finally:
+            stop.set()
+            sender.join()
+            receiver.join()
+            if self._given_io is None:
+                self._io.close()
+
+    def _send_all(self, keys: Iterable[K], stop: threading.Event) -> None:
+        """Sender thread: stream every probe, then retransmit until nothing is pending."""
+        self._pending.clear()
+        self._deadlines.clear()
+        self._error = None
+        try:
+            for key in keys:
+                if stop.is_set():
+                    return
+                self._retransmit_overdue()
+                self._send(key, 0)
+            while self._pending and not stop.is_set():
+                self._retransmit_overdue()
+                time.sleep(0.005)
+        except Exception as e:
+            self._error = e
+        finally:
+            self._results.put(None)
+
+    def _send(self, key: K, tries: int) -> None:
+        host = self._host(key)
+        waited = time.perf_counter()
+        self.limiter.acquire(host)
+        _RATE_LIMIT.observe(time.perf_counter() - waited)
+        timeout = self.timeout if self.timings is None else self.timings.timeout(host)
+        with self._lock:
+            sent_at = time.monotonic()
+            self._pending[key] = (sent_at, tries)
+            heapq.heappush(self._deadlines, (sent_at + timeout, sent_at, next(self._counter), key))
+            _PENDING.set(len(self._pending))
+        transmitting = time.perf_counter()
+        self._transmit(key)
+        _TRANSMIT.observe(time.perf_counter() - transmitting)
+        PROBES_SENT.inc()
+        if tries:
+            RETRIES.inc()
+
+    def _retransmit_overdue(self) -> None:
+        now = time.monotonic()
+        overdue = []
+        with self._lock:
+            while self._deadlines and self._deadlines[0][0] <= now:
+                _, sent_at, _, key = heapq.heappop(self._deadlines)
+                pending = self._pending.get(key)
+                if pending is None or pending[0] != sent_at:
+                    # answered, or retransmitted since
+                    continue
+                del self._pending[key]
+                TIMEOUTS.inc()
+                tries = pending[1]
+                overdue.append((key, tries))
+                if tries >= self.retries:
+                    # results are queued under the lock so the sender can't finish before they are
+                    result = self._expired(key, now - sent_at)
+                    if result is not None:
+                        self._results.put(result)
+        for key, tries in overdue:
+            if tries < self.retries:
+                self._send(key, tries + 1)
+
+    def _receive(self, stop: threading.Event) -> None:
+        """Receiver thread: match replies to probes until told to stop."""
+        receive, handle_reply = self._io.receive, self.handle_reply
+        while not stop.is_set():
+            try:
+                for packet, source in receive():
+                    handle_reply(packet, source)
+            except OSError:
+                return
+
+    def _answered(self, key: K, result: Callable[[float], R | None]) -> bool:
+        """Report the reply to the probe for `key`, unless it was already answered or given up on.
+
+        Args:
+            key (K): the probe that was answered
+            result (Callable[[float], R | None]): builds the result from the round trip time
+
+        Returns:
+            bool: whether the reply was the first one for a pending probe
+        """
+        with self._lock:
+            # results are queued under the lock so the sender can't finish between the pop and the put
+            pending = self._pending.pop(key, None)
+            if pending is None:
+                return False
+            rtt = time.monotonic() - pending[0]
+            REPLIES.inc()
+            _REPLY.observe(rtt)
+            value = result(rtt)
+            if value is not None:
+                self._results.put(value)
+        # by karn's algorithm, replies to retransmissions are ambiguous and don't count as rtt samples
+        if pending[1] == 0 and self.timings is not None:
+            self.timings.update(self._host(key), rtt)
+        return True
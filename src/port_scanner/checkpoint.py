@@ -0,0 +1,158 @@
+"""On-disk progress of a scan, to resume it after an interruption.
+
+A checkpoint file holds the targets and the order they are visited in, followed by a bitmap with a bit for every
+(host, port) target, set once its result is in. Every host owns a contiguous run of bits, one per port. The bitmap is
+memory-mapped, so marking a target costs a single in-memory write and the kernel writes the pages back: a scan that
+is killed, even with SIGKILL, leaves a checkpoint that is up to date.
+
+Probes that were in flight or waiting for a retransmission have no bit set yet, so they are probed again on resume.
+"""
+
+import json
+import mmap
+import struct
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from types import TracebackType
+from typing import Any
+
+from port_scanner.targets import TargetSpec, cached_host_index
+
+MAGIC = b"PSCK"
+VERSION = 1
+# magic, version, length of the json settings that follow, number of targets
+HEADER = struct.Struct("!4sB3xIQ")
+COUNT_CHUNK = 1 << 20  # bytes of the bitmap counted at once when it is opened
+
+
+class Checkpoint:
+    """Which targets of a scan are done, kept in a memory-mapped file.
+
+    Create one for a new scan with `create`, or continue an interrupted one with `open`.
+    """
+
+    def __init__(
+        self, path: Path, targets: TargetSpec, settings: dict[str, Any], mapped: mmap.mmap, offset: int
+    ) -> None:
+        """Use the bitmap at `offset` of `mapped`, see `create` and `open`."""
+        self.path = path
+        self.targets = targets
+        self.settings = settings
+        self._mapped = mapped
+        self._offset = offset
+        self._ports = targets.port_count
+        self._host_index = cached_host_index(targets)
+        self.completed = sum(
+            int.from_bytes(mapped[start : start + COUNT_CHUNK]).bit_count()
+            for start in range(offset, len(mapped), COUNT_CHUNK)
+        )
+
+    @classmethod
+    def create(cls, path: str | Path, targets: TargetSpec, **settings) -> "Checkpoint":
+        """Start a new checkpoint file, replacing `path` if it exists.
+
+        Args:
+            path (str | Path): the checkpoint file
+            targets (TargetSpec): every target of the scan
+            settings: how the targets are visited, like the seed of the order, stored as json
+
+        Returns:
+            Checkpoint: the checkpoint, with no target done
+        """
+        path = Path(path)
+        meta = json.dumps(
+            {"hosts": targets.host_ranges, "ports": targets.port_ranges, "settings": settings}, separators=(",", ":")
+        ).encode()
+        with open(path, "wb") as file:
+            file.write(HEADER.pack(MAGIC, VERSION, len(meta), len(targets)))
+            file.write(meta)
+            # sparse on most file systems, so a huge scan doesn't write its whole bitmap up front
+            file.truncate(HEADER.size + len(meta) + _bitmap_size(len(targets)))
+        return cls.open(path)
+
+    @classmethod
+    def open(cls, path: str | Path) -> "Checkpoint":
+        """Open an existing checkpoint file, to resume the scan it belongs to.
+
+        Args:
+            path (str | Path): the checkpoint file
+
+        Raises:
+            ValueError: if path isn't a checkpoint file of a known version, or it was cut short
+
+        Returns:
+            Checkpoint: the checkpoint, with the targets that were done before
+        """
+        path = Path(path)
+        with open(path, "r+b") as file:
+            header = file.read(HEADER.size)
+            if len(header) < HEADER.size:
+                msg = f"{path} is not a checkpoint file"
+                raise ValueError(msg)
+            magic, version, meta_size, count = HEADER.unpack(header)
+            if magic != MAGIC or version != VERSION:
+                msg = f"{path} is not a checkpoint file, or one of an unknown version"
+                raise ValueError(msg)
+            meta = json.loads(file.read(meta_size))
+            offset = HEADER.size + meta_size
+            if path.stat().st_size < offset + _bitmap_size(count):
+                msg = f"checkpoint {path} is truncated"
+                raise ValueError(msg)
+            # the mapping stays valid after the file is closed
+            mapped = mmap.mmap(file.fileno(), 0)
+        targets = TargetSpec(
+            [(first, last) for first, last in meta["hosts"]], [(first, last) for first, last in meta["ports"]]
+        )
+        return cls(path, targets, meta["settings"], mapped, offset)
+
+    def _bit(self, host: str, port: int) -> tuple[int, int]:
+        index = self._host_index(host) * self._ports + self.targets.port_index(port)
+        return self._offset + (index >> 3), 1 << (index & 7)
+
+    def mark(self, host: str, port: int) -> None:
+        """Record that the result of probing `port` on `host` is in."""
+        position, bit = self._bit(host, port)
+        mapped = self._mapped
+        if not mapped[position] & bit:
+            mapped[position] |= bit
+            self.completed += 1
+
+    def done(self, host: str, port: int) -> bool:
+        """Whether the result of probing `port` on `host` was recorded."""
+        position, bit = self._bit(host, port)
+        return bool(self._mapped[position] & bit)
+
+    def pending(self, targets: Iterable[tuple[str, int]]) -> Iterator[tuple[str, int]]:
+        """Leave out the targets that are done.
+
+        Args:
+            targets (Iterable[tuple[str, int]]): (host, port) targets of the checkpoint, in scan order
+
+        Yields:
+            tuple[str, int]: the targets that still need to be probed
+        """
+        done = self.done
+        for host, port in targets:
+            if not done(host, port):
+                yield host, port
+
+    def close(self) -> None:
+        """Write the bitmap back to the file and unmap it."""
+        if not self._mapped.closed:
+            self._mapped.flush()
+            self._mapped.close()
+
+    def __enter__(self) -> "Checkpoint":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.close()
+
+
+def _bitmap_size(count: int) -> int:
+    return (count + 7) // 8
@@ -1,13 +1,17 @@
 """Collection of decorator functions."""
 
-import time
+import inspect
 from collections.abc import Callable
 from functools import wraps
 
+from port_scanner.ratelimit import TokenBucket
+
 
 def rate_limit(interval: float) -> Callable:
     """Rate limit a function.
 
+    Safe to use from several threads, and coroutine functions wait without blocking the event loop.
+
     Args:
     ----
         interval (int): decorated function will only be called at most once every `interval` seconds
@@ -15,23 +19,23 @@ def rate_limit(interval: float) -> Callable:
     """
 
     def decorator(func: Callable):
-        last_call_times = {}
+        if interval <= 0:
+            return func
+        # every decorated function gets its own bucket, holding a single call
+        bucket = TokenBucket(1 / interval, burst=1)
+
+        if inspect.iscoroutinefunction(func):
+
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                await bucket.acquire_async()
+                return await func(*args, **kwargs)
+
+            return async_wrapper
 
         @wraps(func)
         def wrapper(*args, **kwargs):
-            # Check if the function has been called before
-            if func.__name__ not in last_call_times:
-                last_call_times[func.__name__] = time.time()
-            else:
-                # Check if enough time has passed since the last call
-                elapsed_time = time.time() - last_call_times[func.__name__]
-                if elapsed_time < interval:
-                    time.sleep(interval - elapsed_time)
-
-            # Update the last call time
-            last_call_times[func.__name__] = time.time()
-
-            # Call the function and return the result
+            bucket.acquire()
             return func(*args, **kwargs)
 
         return wrapper
@@ -0,0 +1,249 @@
+"""Concurrent host discovery.
+
+ICMP echo requests to every host are streamed over a single socket and replies are matched by identifier and
+sequence number, so a whole network is pinged in the time a handful of `ping` processes would take. Hosts that
+drop ICMP can be found with TCP SYN or ACK pings to a few common ports instead.
+"""
+
+import hashlib
+import os
+import random
+import socket
+import struct
+from collections.abc import Iterable, Iterator
+
+from port_scanner.batch import DEFAULT_RETRIES, DEFAULT_TIMEOUT, BatchProber
+from port_scanner.networking import PortState
+from port_scanner.packetio import Packet, PacketIO, RawIO
+from port_scanner.ratelimit import RateLimiter
+from port_scanner.syn_scanner import TCP_ACK, TCP_SYN, SynScanner, checksum
+from port_scanner.timing import HostTimings
+
+ICMP_ECHO_REPLY = 0
+ICMP_ECHO_REQUEST = 8
+ICMP_HEADER = struct.Struct("!BBHHH")
+DISCOVERY_PORTS = (80, 443)  # ports probed by the tcp pings, like nmap's defaults
+
+
+def echo_request(ident: int, seq: int) -> bytes:
+    """Build an ICMP echo request.
+
+    Args:
+        ident (int): 16 bit identifier
+        seq (int): 16 bit sequence number
+
+    Returns:
+        bytes: the ICMP message, without an ip header
+    """
+    header = ICMP_HEADER.pack(ICMP_ECHO_REQUEST, 0, 0, ident, seq)
+    return ICMP_HEADER.pack(ICMP_ECHO_REQUEST, 0, checksum(header), ident, seq)
+
+
+def parse_echo_reply(packet: Packet) -> tuple[int, int, bool] | None:
+    """Extract the identifier and sequence number of an ICMP echo reply.
+
+    Raw sockets deliver the ip header as well, datagram ICMP sockets only the ICMP message. The two are told apart
+    by the first byte, which is 0 for an echo reply and holds the ip version otherwise.
+
+    Args:
+        packet (Packet): a packet as read from an ICMP socket, or a view of one
+
+    Returns:
+        tuple[int, int, bool] | None: identifier, sequence number and whether the packet had an ip header, or None if
+      it isn't an echo reply
+    """
+    offset = 0
+    if packet and packet[0] >> 4 == 4:  # noqa: PLR2004
+        offset = (packet[0] & 0x0F) * 4
+    if len(packet) < offset + ICMP_HEADER.size:
+        return None
+    kind, _, _, ident, seq = ICMP_HEADER.unpack_from(packet, offset)
+    if kind != ICMP_ECHO_REPLY:
+        return None
+    return ident, seq, offset > 0
+
+
+class IcmpPinger(BatchProber[str, tuple[str, float | None]]):
+    """Ping many hosts at once over a single ICMP socket.
+
+    A raw socket is used when the process may open one, otherwise an unprivileged datagram ICMP socket (see the
+    `net.ipv4.ping_group_range` sysctl on linux).
+    """
+
+    def __init__(
+        self,
+        *,
+        retries: int = DEFAULT_RETRIES,
+        timeout: float = DEFAULT_TIMEOUT,
+        timings: HostTimings | None = None,
+        limiter: RateLimiter | None = None,
+        sock: socket.socket | None = None,
+        io: PacketIO | None = None,
+    ) -> None:
+        """Configure the pinger.
+
+        Args:
+            retries (int): how often an unanswered echo request is retransmitted before the host is reported down
+            timeout (float): seconds to wait for a reply before retransmitting, unless `timings` is given
+            timings (HostTimings | None): derive timeouts from the round trip times of every host, and update them
+            limiter (RateLimiter | None): global and per host packet budgets, shared with other scanners
+            sock (socket.socket | None): ICMP socket to ping over, opened on every run if not given
+            io (PacketIO | None): backend to ping over instead of the socket
+        """
+        super().__init__(
+            retries=retries,
+            timeout=timeout,
+            timings=timings,
+            limiter=limiter,
+            send_socket=sock,
+            recv_socket=sock,
+            io=io,
+        )
+        # replies to datagram sockets are routed by identifier already, the kernel picks it on those anyway
+        self.ident = random.getrandbits(16)
+        self._key = os.urandom(16)
+
+    def cookie(self, host: str) -> int:
+        """Sequence number used for pinging `host`.
+
+        Args:
+            host (str): ip address of the destination
+
+        Returns:
+            int: a 16 bit sequence number only this pinger can predict
+        """
+        return int.from_bytes(hashlib.blake2b(socket.inet_aton(host), key=self._key, digest_size=2).digest())
+
+    def ping(self, hosts: Iterable[str]) -> Iterator[tuple[str, float | None]]:
+        """Ping every host.
+
+        Results are yielded as replies arrive, hosts that never answer come last.
+
+        Args:
+            hosts (Iterable[str]): ip addresses of the hosts to ping
+
+        Yields:
+            tuple[str, float | None]: every host, with the round trip time of its answer or None if it is down
+        """
+        return self.run(hosts)
+
+    def _open_io(self) -> PacketIO:
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+        except PermissionError:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+        # replies arrive on the socket the requests were sent from
+        return RawIO(sock)
+
+    def _host(self, key: str) -> str:
+        return key
+
+    def _transmit(self, key: str) -> None:
+        self._io.send(echo_request(self.ident, self.cookie(key)), (key, 0))
+
+    def _expired(self, key: str, waited: float) -> tuple[str, None]:  # noqa: ARG002
+        return key, None
+
+    def handle_reply(self, packet: Packet, source: str | None = None) -> None:
+        """Report the host `packet` comes from, if it is a reply to one of our echo requests.
+
+        Args:
+            packet (Packet): a packet as read from the ICMP socket
+            source (str | None): the address the packet came from
+        """
+        reply = parse_echo_reply(packet)
+        if reply is None or source is None:
+            return
+        ident, seq, raw = reply
+        # a raw socket sees the replies to every ping on the machine
+        if (raw and ident != self.ident) or seq != self.cookie(source):
+            return
+        self._answered(source, lambda rtt: (source, rtt))
+
+
+def tcp_ping(
+    hosts: Iterable[str],
+    ports: Iterable[int] = DISCOVERY_PORTS,
+    *,
+    flags: int = TCP_SYN,
+    retries: int = DEFAULT_RETRIES,
+    timings: HostTimings | None = None,
+    limiter: RateLimiter | None = None,
+) -> Iterator[tuple[str, float]]:
+    """Find hosts that answer a TCP SYN or ACK on any of `ports`.
+
+    An open or closed port shows the host is up, only silence counts as down.
+
+    Args:
+        hosts (Iterable[str]): ip addresses of the hosts to probe
+        ports (Iterable[int]): the ports to probe on every host
+        flags (int): TCP_SYN or TCP_ACK
+        retries (int): how often an unanswered probe is retransmitted
+        timings (HostTimings | None): derive timeouts from the round trip times of every host, and update them
+        limiter (RateLimiter | None): global and per host packet budgets, unlimited if not given
+
+    Yields:
+        tuple[str, float]: every live host once, with the round trip time of its first answer
+    """
+    ports = tuple(ports)
+    scanner = SynScanner(
+        flags=flags, retries=retries, timings=timings, limiter=limiter if limiter is not None else RateLimiter()
+    )
+    seen = set()
+    for result in scanner.scan_targets((host, port) for host in hosts for port in ports):
+        if result.state != PortState.FILTERED and result.host not in seen:
+            seen.add(result.host)
+            yield result.host, result.latency
+
+
+def discover(
+    hosts: Iterable[str],
+    *,
+    icmp: bool = True,
+    syn_ports: Iterable[int] = DISCOVERY_PORTS,
+    ack_ports: Iterable[int] = (),
+    retries: int = DEFAULT_RETRIES,
+    timings: HostTimings | None = None,
+    limiter: RateLimiter | None = None,
+    report_down: bool = False,
+) -> Iterator[tuple[str, float | None]]:
+    """Find the live hosts among `hosts`, yielding each as soon as it answers.
+
+    Every host is pinged, then the ones that didn't answer get a TCP SYN ping to `syn_ports` and finally a TCP ACK
+    ping to `ack_ports`. Leave a method out by passing False or no ports.
+
+    Args:
+        hosts (Iterable[str]): ip addresses of the hosts to probe
+        icmp (bool): ping with ICMP echo requests
+        syn_ports (Iterable[int]): ports to send SYNs to
+        ack_ports (Iterable[int]): ports to send ACKs to
+        retries (int): how often an unanswered probe is retransmitted
+        timings (HostTimings | None): derive timeouts from the round trip times of every host, and update them
+        limiter (RateLimiter | None): global and per host packet budgets, unlimited if not given
+        report_down (bool): also yield the hosts that never answered, with None as round trip time
+
+    Yields:
+        tuple[str, float | None]: every live host with the round trip time of its first answer
+
+    Raises:
+        PermissionError: if the process may not open the sockets
+    """
+    down: Iterable[str] = hosts
+    if icmp:
+        down = []
+        for host, rtt in IcmpPinger(retries=retries, timings=timings, limiter=limiter).ping(hosts):
+            if rtt is None:
+                down.append(host)
+            else:
+                yield host, rtt
+    for flags, ports in ((TCP_SYN, tuple(syn_ports)), (TCP_ACK, tuple(ack_ports))):
+        if not ports:
+            continue
+        candidates, answered = list(down), set()
+        for host, rtt in tcp_ping(candidates, ports, flags=flags, retries=retries, timings=timings, limiter=limiter):
+            answered.add(host)
+            yield host, rtt
+        down = [host for host in candidates if host not in answered]
+    if report_down:
+        for host in down:
+            yield host, None
@@ -0,0 +1,92 @@
+"""Live view of a running scan.
+
+Redrawing costs the same however big the scan is: only the most recently found open ports are shown, next to
+counters that every result updates in constant time.
+"""
+
+import datetime as dt
+import threading
+import time
+from collections import deque
+
+from rich.console import Group, RenderableType
+from rich.table import Table
+from rich.text import Text
+
+from port_scanner.metrics import stage
+from port_scanner.networking import PortState, ProbeResult
+
+MAX_ROWS = 20  # open ports shown at once
+RATE_WINDOW = 5.0  # seconds of history the probe rate is measured over
+_RENDER = stage("render")
+
+
+class ScanView:
+    """Counters and the latest open ports of a scan, renderable by rich."""
+
+    def __init__(self, total: int | None = None, max_rows: int = MAX_ROWS) -> None:
+        """Start counting.
+
+        Args:
+            total (int | None): how many probes the scan will make, unknown if not given
+            max_rows (int): how many of the latest open ports to show
+        """
+        self.total = total
+        self.completed = 0
+        self.counts = dict.fromkeys(PortState, 0)
+        self.open_ports: deque[ProbeResult] = deque(maxlen=max_rows)
+        self.started = time.monotonic()
+        # (time, completed) samples of the last RATE_WINDOW seconds, taken whenever the rate is asked for
+        self._samples: deque[tuple[float, int]] = deque([(self.started, 0)])
+        self._lock = threading.Lock()
+
+    def add(self, result: ProbeResult) -> None:
+        """Count `result`, and show it if the port is open."""
+        with self._lock:
+            self.completed += 1
+            self.counts[result.state] += 1
+            if result.state == PortState.OPEN:
+                self.open_ports.append(result)
+
+    def rate(self) -> float:
+        """Probes completed per second, over the last few seconds."""
+        now = time.monotonic()
+        samples = self._samples
+        with self._lock:
+            samples.append((now, self.completed))
+            while len(samples) > 2 and samples[1][0] <= now - RATE_WINDOW:  # noqa: PLR2004
+                samples.popleft()
+        then, completed = samples[0]
+        return (self.completed - completed) / (now - then) if now > then else 0.0
+
+    def eta(self, rate: float) -> float | None:
+        """Seconds until the scan is done at `rate` probes per second, None if that can't be told."""
+        if self.total is None or rate <= 0:
+            return None
+        return max(0, self.total - self.completed) / rate
+
+    def summary(self) -> str:
+        """The counters on a single line."""
+        rate = self.rate()
+        eta = self.eta(rate)
+        total = "?" if self.total is None else f"{self.total}"
+        remaining = "?" if eta is None else f"{dt.timedelta(seconds=round(eta))}"
+        return (
+            f"{self.completed}/{total} probes, {rate:.0f}/s, ETA {remaining} - "
+            f"open {self.counts[PortState.OPEN]}, closed {self.counts[PortState.CLOSED]}, "
+            f"filtered {self.counts[PortState.FILTERED]}"
+        )
+
+    def __rich__(self) -> RenderableType:
+        start = time.perf_counter()
+        table = Table(title="open ports")
+        table.add_column("Host")
+        table.add_column("Port")
+        table.add_column("rtt (ms)")
+        with self._lock:
+            open_ports = list(self.open_ports)
+        for result in open_ports:
+            table.add_row(result.host, f"{result.port}", f"{result.latency * 1000:.1f}")
+        view = Group(table, Text(self.summary()))
+        _RENDER.observe(time.perf_counter() - start)
+        return view
@@ -0,0 +1,424 @@
+"""Scan from several nodes, coordinated over TCP.
+
+A `Coordinator` splits the scan into pieces, see `parallel.shard_jobs`, and leases them to the workers that connect
+to it, `run_worker`. A worker scans its piece with its own engine and streams the results back in batches of binary
+records, followed by what its metrics counted. The lease of a piece lasts as long as its worker keeps talking,
+results and heartbeats alike: when the connection drops or stays silent for `lease` seconds, the piece goes back to
+the queue for the next worker. Workers that hold no piece can wait for one as long as they like.
+
+A worker that reports an error is dropped and its piece handed to another, the error may come from the worker's own
+machine, like missing privileges for raw sockets. The scan only stops when a piece failed on several workers, or
+no other worker is connected to take it over.
+
+A reassigned piece is scanned again from the start, the coordinator drops the results it already has, tracked in a
+`Checkpoint` bitmap, so every target is reported exactly once.
+
+Every message is a frame of a kind byte and a payload length, followed by the payload. Workers aren't
+authenticated, so the coordinator only listens on loopback unless told otherwise, and a connection that sends
+anything malformed is dropped.
+"""
+
+import contextlib
+import json
+import queue
+import socket
+import socketserver
+import struct
+import tempfile
+import threading
+import time
+from collections import deque
+from collections.abc import Iterator
+from pathlib import Path
+from types import TracebackType
+
+from port_scanner.checkpoint import Checkpoint
+from port_scanner.metrics import METRICS
+from port_scanner.networking import ProbeResult
+from port_scanner.parallel import (
+    RESULTS,
+    STATS,
+    BatchSender,
+    ShardJob,
+    export_stats,
+    scan_shard,
+    shard_jobs,
+    unpack_results,
+)
+from port_scanner.ratelimit import RateLimiter
+from port_scanner.targets import TargetSpec
+from port_scanner.timing import DEFAULT_RETRIES, HostTimings
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 7337
+DEFAULT_PIECES = 64  # pieces a scan is split into, more than workers so fast workers take over from slow ones
+DEFAULT_LEASE = 30.0  # seconds a worker can stay silent before its piece is handed to another
+DEFAULT_MAX_FAILURES = 3  # workers a piece can fail on before the scan stops
+WAIT_INTERVAL = 0.5  # seconds a worker waits before asking again when every piece is leased
+FRAME = struct.Struct("!cI")  # kind, payload length
+PIECE = struct.Struct("!I")
+# message kinds, from workers, besides RESULTS and STATS of `parallel`
+HELLO = b"H"  # the name of the worker
+REQUEST = b"Q"  # asks for a piece
+HEARTBEAT = b"B"  # keeps the lease alive
+DONE = b"D"  # the piece is scanned
+ERROR = b"E"  # the piece can't be scanned, and why
+# and from the coordinator
+JOB = b"J"  # a piece, its lease and its ShardJob as json
+WAIT = b"W"  # every remaining piece is leased, ask again later
+FINISHED = b"F"  # the scan is done
+
+
+class _Link:
+    """Framed messages over a stream socket, safe to send from several threads."""
+
+    def __init__(self, sock: socket.socket) -> None:
+        self.sock = sock
+        self._lock = threading.Lock()
+
+    def send(self, kind: bytes, payload: bytes | bytearray | memoryview = b"") -> None:
+        with self._lock:
+            self.sock.sendall(FRAME.pack(kind, len(payload)) + payload)
+
+    def send_bytes(self, message: bytes | bytearray) -> None:
+        """Send a message of a kind byte followed by its payload, like `BatchSender` makes them."""
+        self.send(bytes(message[:1]), memoryview(message)[1:])
+
+    def _read(self, size: int) -> bytes:
+        data = bytearray()
+        while len(data) < size:
+            chunk = self.sock.recv(size - len(data))
+            if not chunk:
+                msg = "connection closed"
+                raise ConnectionError(msg)
+            data += chunk
+        return bytes(data)
+
+    def receive(self) -> tuple[bytes, bytes]:
+        kind, size = FRAME.unpack(self._read(FRAME.size))
+        return kind, self._read(size)
+
+
+def _parse_address(address: str) -> tuple[str, int]:
+    """Split host:port, the host defaults to DEFAULT_HOST and the port to DEFAULT_PORT."""
+    host, _, port = address.rpartition(":") if ":" in address else (address, "", "")
+    try:
+        return host or DEFAULT_HOST, int(port) if port else DEFAULT_PORT
+    except ValueError:
+        msg = f"{address!r} is not of the form host:port"
+        raise ValueError(msg) from None
+
+
+class Coordinator:
+    """Hand out the pieces of a scan to workers and merge their results.
+
+    Use it as a context manager to start and stop listening, and iterate over it to get the results as they come in.
+    The iteration ends once every piece is scanned.
+    """
+
+    def __init__(
+        self,
+        targets: TargetSpec,
+        *,
+        address: str | tuple[str, int] = (DEFAULT_HOST, DEFAULT_PORT),
+        pieces: int = DEFAULT_PIECES,
+        lease: float = DEFAULT_LEASE,
+        max_failures: int = DEFAULT_MAX_FAILURES,
+        seed: int | None = None,
+        randomize: bool = False,
+        use_tcp_syn: bool = False,
+        concurrency: int = 1,
+        retries: int = DEFAULT_RETRIES,
+        timings: HostTimings | None = None,
+        limiter: RateLimiter | None = None,
+    ) -> None:
+        """Split the scan.
+
+        Args:
+            targets (TargetSpec): the targets of the scan
+            address (str | tuple[str, int]): where to listen for workers, host:port or a (host, port) pair, only
+          loopback by default
+            pieces (int): number of pieces the scan is split into
+            lease (float): seconds a worker can stay silent before its piece is handed to another
+            max_failures (int): workers a piece can fail on before the scan stops
+            seed (int | None): seed of the pseudo-random order, see `walk`
+            randomize (bool): visit the targets in pseudo-random order
+            use_tcp_syn (bool): workers scan with `SynScanner` instead of connects
+            concurrency (int): connects in flight in every worker, above 1 uses the asyncio engine
+            retries (int): retransmissions of unanswered probes
+            timings (HostTimings | None): the timeout bounds every worker uses, the defaults if not given
+            limiter (RateLimiter | None): the budgets of every single worker, unlimited if not given
+
+        Raises:
+            ValueError: if pieces, lease or max_failures isn't positive, or address isn't of the form host:port
+        """
+        if pieces < 1:
+            msg = "pieces needs to be at least 1"
+            raise ValueError(msg)
+        if lease <= 0:
+            msg = "lease needs to be positive"
+            raise ValueError(msg)
+        if max_failures < 1:
+            msg = "max_failures needs to be at least 1"
+            raise ValueError(msg)
+        self.address = _parse_address(address) if isinstance(address, str) else address
+        self.lease = lease
+        self.max_failures = max_failures
+        self.jobs = shard_jobs(
+            targets,
+            min(pieces, max(1, len(targets))),
+            seed=seed,
+            randomize=randomize,
+            use_tcp_syn=use_tcp_syn,
+            concurrency=concurrency,
+            retries=retries,
+            timings=timings,
+            limiter=limiter,
+        )
+        # piece -> name of the worker that holds its lease
+        self.leases: dict[int, str] = {}
+        self.reassigned = 0
+        # worker -> the error it was dropped for
+        self.failed: dict[str, str] = {}
+        # piece -> workers it failed on
+        self._failures: dict[int, int] = {}
+        self._workers = 0  # connected workers
+        self._pending = deque(range(len(self.jobs)))
+        self._done: set[int] = set()
+        self._lock = threading.Lock()
+        # results, and a None once the scan is done or failed
+        self._results: queue.SimpleQueue[ProbeResult | None] = queue.SimpleQueue()
+        self._error: str | None = None
+        self._directory = tempfile.TemporaryDirectory()
+        # targets that were reported, to drop the results of a reassigned piece that came in before
+        self._reported = Checkpoint.create(Path(self._directory.name) / "reported", targets)
+        self._server = _Server(self.address, _WorkerHandler)
+        self._server.coordinator = self
+        self._thread = threading.Thread(target=self._server.serve_forever, name="coordinator", daemon=True)
+
+    @property
+    def listening(self) -> tuple[str, int]:
+        """The address workers connect to, with the actual port when listening on port 0."""
+        return self._server.server_address[:2]  # type: ignore
+
+    @property
+    def finished(self) -> bool:
+        return len(self._done) == len(self.jobs) or self._error is not None
+
+    def __enter__(self) -> "Coordinator":
+        self._thread.start()
+        if not self.jobs or not len(self._reported.targets):
+            self._results.put(None)
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Stop listening."""
+        if self._thread.is_alive():
+            self._server.shutdown()
+        self._server.server_close()
+        self._reported.close()
+        self._directory.cleanup()
+
+    def __iter__(self) -> Iterator[ProbeResult]:
+        while (result := self._results.get()) is not None:
+            yield result
+        if self._error is not None:
+            msg = self._error
+            raise RuntimeError(msg)
+
+    def lease_piece(self, worker: str) -> int | None:
+        """Lease the next piece to `worker`, None if there is none left to lease."""
+        with self._lock:
+            while self._pending and self._error is None:
+                piece = self._pending.popleft()
+                if piece not in self._done:
+                    self.leases[piece] = worker
+                    return piece
+            return None
+
+    def release(self, piece: int) -> None:
+        """Put a piece whose worker went away back in front of the queue."""
+        with self._lock:
+            if self.leases.pop(piece, None) is not None and piece not in self._done:
+                self._pending.appendleft(piece)
+                self.reassigned += 1
+
+    def merge(self, records: bytes) -> None:
+        """Report the results in `records` that weren't reported yet.
+
+        Raises:
+            struct.error: if `records` isn't a whole number of records
+            KeyError: if a record has an unknown state
+            ValueError: if a record isn't one of the targets
+        """
+        results = list(unpack_results(records))
+        with self._lock:
+            reported = self._reported
+            # every record is checked before any is reported, a malformed message reports nothing
+            for result in results:
+                reported.done(result.host, result.port)
+            for result in results:
+                if not reported.done(result.host, result.port):
+                    reported.mark(result.host, result.port)
+                    self._results.put(result)
+
+    def complete(self, piece: int) -> None:
+        """Record that `piece` is scanned, and end the results once every piece is."""
+        with self._lock:
+            self.leases.pop(piece, None)
+            self._done.add(piece)
+            if len(self._done) == len(self.jobs):
+                self._results.put(None)
+
+    def connect(self) -> None:
+        """Count a worker that connected."""
+        with self._lock:
+            self._workers += 1
+
+    def disconnect(self) -> None:
+        """Count a worker that went away."""
+        with self._lock:
+            self._workers -= 1
+
+    def fail(self, worker: str, piece: int, reason: str) -> None:
+        """Hand the piece of a worker that can't scan it to another, or stop the scan.
+
+        The scan stops once the piece failed on `max_failures` workers, or when `worker` is the only one connected.
+        """
+        with self._lock:
+            self.leases.pop(piece, None)
+            self.failed[worker] = reason
+            failures = self._failures[piece] = self._failures.get(piece, 0) + 1
+            if failures < self.max_failures and self._workers > 1:
+                if piece not in self._done:
+                    self._pending.appendleft(piece)
+                    self.reassigned += 1
+                return
+            if self._error is None:
+                self._error = f"{worker} failed: {reason}"
+                self._results.put(None)
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+    coordinator: Coordinator
+
+
+class _WorkerHandler(socketserver.BaseRequestHandler):
+    """Serve a single worker, until it goes away, goes silent for longer than its lease or sends garbage."""
+
+    server: _Server
+
+    def handle(self) -> None:
+        coordinator = self.server.coordinator
+        link = _Link(self.request)
+        worker = f"{self.client_address[0]}:{self.client_address[1]}"
+        piece = None
+        coordinator.connect()
+        try:
+            while True:
+                # only a leased piece has to be kept alive, an idle worker can take its time to ask again
+                self.request.settimeout(coordinator.lease if piece is not None else None)
+                kind, payload = link.receive()
+                if kind == RESULTS and piece is not None:
+                    coordinator.merge(payload)
+                elif kind == STATS and piece is not None:
+                    METRICS.merge(json.loads(payload))
+                elif kind == REQUEST:
+                    if piece is not None:
+                        # asking for another piece gives this one up, it would never be completed otherwise
+                        coordinator.release(piece)
+                    piece = coordinator.lease_piece(worker)
+                    if piece is None:
+                        link.send(FINISHED if coordinator.finished else WAIT)
+                    else:
+                        job = coordinator.jobs[piece]._asdict()
+                        link.send(JOB, json.dumps({"piece": piece, "lease": coordinator.lease, "job": job}).encode())
+                elif kind == DONE and piece == PIECE.unpack(payload)[0]:
+                    coordinator.complete(piece)
+                    piece = None
+                elif kind == ERROR and piece is not None:
+                    coordinator.fail(worker, piece, payload.decode(errors="replace"))
+                    piece = None
+                    # whatever it can't scan, it couldn't scan the next piece either
+                    return
+                elif kind == HELLO:
+                    worker = f"{payload.decode(errors='replace')} ({worker})"
+        except (OSError, ConnectionError, struct.error, KeyError, ValueError):
+            # gone, silent for too long, which includes timeouts, or sent a malformed message
+            pass
+        finally:
+            if piece is not None:
+                coordinator.release(piece)
+            coordinator.disconnect()
+
+
+def _decode_job(job: dict) -> ShardJob:
+    # json turns the range tuples into lists
+    return ShardJob(**job | {"hosts": [tuple(r) for r in job["hosts"]], "ports": [tuple(r) for r in job["ports"]]})
+
+
+def _heartbeat(link: _Link, interval: float, stop: threading.Event) -> None:
+    while not stop.wait(interval):
+        link.send(HEARTBEAT)
+
+
+def run_worker(address: str | tuple[str, int], *, name: str | None = None) -> int:
+    """Scan pieces handed out by a coordinator until the scan is done.
+
+    Args:
+        address (str | tuple[str, int]): the coordinator, host:port or a (host, port) pair
+        name (str | None): how the coordinator calls this worker, the host name if not given
+
+    Raises:
+        ValueError: if address isn't of the form host:port
+        ConnectionError: if the coordinator goes away before the scan is done
+
+    Returns:
+        int: the number of pieces this worker scanned
+    """
+    address = _parse_address(address) if isinstance(address, str) else address
+    scanned = 0
+    with socket.create_connection(address) as sock:
+        link = _Link(sock)
+        link.send(HELLO, (name or socket.gethostname()).encode())
+        while True:
+            link.send(REQUEST)
+            kind, payload = link.receive()
+            if kind == FINISHED:
+                return scanned
+            if kind == WAIT:
+                time.sleep(WAIT_INTERVAL)
+                continue
+            message = json.loads(payload)
+            piece = PIECE.pack(message["piece"])
+            stop = threading.Event()
+            heartbeat = threading.Thread(
+                target=_heartbeat, args=(link, message["lease"] / 3, stop), name="heartbeat", daemon=True
+            )
+            heartbeat.start()
+            try:
+                sender = BatchSender(link)  # type: ignore
+                scan_shard(_decode_job(message["job"]), sender)
+                sender.flush()
+            except Exception as e:
+                with contextlib.suppress(OSError):
+                    link.send_bytes(export_stats(reset=True))
+                    link.send(ERROR, f"{type(e).__name__}: {e}".encode())
+                raise
+            finally:
+                stop.set()
+                heartbeat.join()
+            # what was counted since the last piece, the coordinator adds it up
+            link.send_bytes(export_stats(reset=True))
+            link.send(DONE, piece)
+            scanned += 1
@@ -1,14 +1,162 @@
 """functions related to logging."""
 
+import atexit
+import contextlib
+import enum
 import logging
+import logging.handlers
+import queue
+import threading
+import time
+from collections.abc import Callable
+from typing import TextIO
 
+from port_scanner.metrics import queue_depth, stage
+from port_scanner.networking import PortState, ProbeResult
 
-def get_logger(filename: str) -> logging.Logger:
+LOG_FORMAT = "%(levelname)s %(asctime)s [%(filename)s:%(funcName)s:%(lineno)d] %(message)s"
+QUEUE_SIZE = 100_000  # records waiting to be written before new ones are dropped
+FLUSH_INTERVAL = 0.1  # seconds records wait to be written together
+SUMMARY_INTERVAL = 10.0  # seconds between two summaries when results are sampled
+_QUEUED = queue_depth("log")
+_LOG = stage("log")
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue records as they are for a `LogWriter`, leaving all formatting to its thread."""
+
+    def __init__(self, writer: "LogWriter") -> None:
+        super().__init__(writer.queue)  # type: ignore
+        self.writer = writer
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        self.writer.put(record)
+
+
+class LogWriter:
+    """Format and write log records to a file on a background thread, in batches.
+
+    Logging through `handler` only costs the caller the creation of the record and a queue put, `write_result` skips
+    the record as well. The writer wakes up every FLUSH_INTERVAL seconds at most, so it doesn't compete with the scan
+    for every single record.
+    """
+
+    def __init__(self, filename: str, formatter: logging.Formatter, maxsize: int = QUEUE_SIZE) -> None:
+        """Configure the writer.
+
+        Args:
+            filename (str): the file to append the records to
+            formatter (logging.Formatter): formats every record
+            maxsize (int): records waiting to be written before new ones are dropped
+        """
+        self.filename = filename
+        self.formatter = formatter
+        self.maxsize = maxsize
+        self._dropped = 0
+        # scanning threads drop records concurrently
+        self._dropped_lock = threading.Lock()
+        # records, (time, result) pairs, and a `None` to stop the writer
+        self.queue: queue.SimpleQueue[logging.LogRecord | tuple[float, ProbeResult] | None] = queue.SimpleQueue()
+        self.handler = _DeferredQueueHandler(self)
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._stopping = threading.Event()
+        self._stream: TextIO | None = None
+        # the formatted time of the last second a result was written in
+        self._second = 0
+        self._stamp = ""
+
+    def put(self, item: logging.LogRecord | tuple[float, ProbeResult]) -> None:
+        """Queue a record or a (time, result) pair, unless the queue is full."""
+        queued = self.queue.qsize()
+        _QUEUED.set(queued)
+        if queued >= self.maxsize:
+            # a slow disk must never stall a scan
+            with self._dropped_lock:
+                self._dropped += 1
+        else:
+            self.queue.put_nowait(item)
+
+    @property
+    def dropped(self) -> int:
+        """Records that didn't fit in the queue."""
+        with self._dropped_lock:
+            return self._dropped
+
+    def write_result(self, result: ProbeResult) -> None:
+        """Log the state of a probed port at INFO level, without creating a log record."""
+        self.put((time.time(), result))
+
+    def _format_result(self, created: float, result: ProbeResult) -> str:
+        second = int(created)
+        if second != self._second:
+            self._second = second
+            self._stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(second))
+        milliseconds = int((created - second) * 1000)
+        return (
+            f"INFO {self._stamp},{milliseconds:03d} [results] port {result.port} on {result.host} is "
+            f"{result.state.name.lower()}\n"
+        )
+
+    def start(self) -> None:
+        """Start writing, the file is only created once there is something to write."""
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Write every queued record and close the file."""
+        if not self._thread.is_alive():
+            return
+        self._stopping.set()
+        self.queue.put(None)
+        self._thread.join()
+        dropped = self.dropped
+        if dropped:
+            self._write(f"WARNING {dropped} log records were dropped\n")
+        if self._stream is not None:
+            self._stream.close()
+
+    def _write(self, text: str) -> None:
+        if self._stream is None:
+            self._stream = open(self.filename, "a", encoding="utf-8")
+        self._stream.write(text)
+        self._stream.flush()
+
+    def _run(self) -> None:
+        """Writer thread: write whatever was queued in the last FLUSH_INTERVAL seconds at once, until stopped."""
+        format_record = self.formatter.format
+        while True:
+            batch = [self.queue.get()]
+            if batch[0] is not None:
+                # let records pile up, unless told to stop
+                self._stopping.wait(FLUSH_INTERVAL)
+            with contextlib.suppress(queue.Empty):
+                while True:
+                    batch.append(self.queue.get_nowait())
+            stopped = batch[-1] is None
+            if stopped:
+                batch.pop()
+            if batch:
+                self._write(
+                    "".join(
+                        [
+                            self._format_result(*item) if type(item) is tuple else format_record(item) + "\n"  # type: ignore
+                            for item in batch
+                        ]
+                    )
+                )
+            if stopped:
+                return
+
+
+def get_logger(filename: str, *, background: bool = True) -> logging.Logger:
     """Get the program logger.
 
     Args:
     ----
         filename (str): The file to log to
+        background (bool): format and write records on a background thread instead of in the calling thread
 
     Returns:
     -------
@@ -16,18 +164,85 @@ def get_logger(filename: str) -> logging.Logger:
 
     """
     logger = logging.getLogger(__name__)
-
-    # the handler determines where the logs go: stdout/file
-    file_handler = logging.FileHandler(filename)
-
     logger.setLevel(logging.DEBUG)
-    file_handler.setLevel(logging.DEBUG)
 
     # the formatter determines what our logs will look like
-    fmt_file = "%(levelname)s %(asctime)s [%(filename)s:%(funcName)s:%(lineno)d] %(message)s"
-    file_formatter = logging.Formatter(fmt_file)
+    file_formatter = logging.Formatter(LOG_FORMAT)
+
+    if background:
+        writer = LogWriter(filename, file_formatter)
+        writer.start()
+        atexit.register(writer.stop)
+        logger.addHandler(writer.handler)
+        return logger
+
+    # the handler determines where the logs go: stdout/file, which is only created on the first record
+    file_handler = logging.FileHandler(filename, delay=True)
+    file_handler.setLevel(logging.DEBUG)
 
     # here we hook everything together
     file_handler.setFormatter(file_formatter)
     logger.addHandler(file_handler)
     return logger
+
+
+class ResultLog(enum.StrEnum):
+    """Which scan results are logged."""
+
+    ALL = "all"  # every probed port
+    OPEN = "open"  # only open ports
+    SUMMARY = "summary"  # the scan counters every SUMMARY_INTERVAL seconds
+    NONE = "none"
+
+
+class ResultLogger:
+    """Log scan results according to a `ResultLog` mode."""
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        mode: ResultLog = ResultLog.ALL,
+        *,
+        summary: Callable[[], str] | None = None,
+        interval: float = SUMMARY_INTERVAL,
+    ) -> None:
+        """Configure what is logged.
+
+        Args:
+            logger (logging.Logger): the logger to log to
+            mode (ResultLog): which results are logged
+            summary (Callable[[], str] | None): describes the progress of the scan, for ResultLog.SUMMARY
+            interval (float): seconds between two summaries
+        """
+        self.logger = logger
+        self.mode = mode
+        self.summary = summary
+        # results skip the logging machinery when they go to a background writer
+        self._writer = next(
+            (handler.writer for handler in logger.handlers if isinstance(handler, _DeferredQueueHandler)), None
+        )
+        self.interval = interval
+        self._next_summary = time.monotonic() + interval
+
+    def __call__(self, result: ProbeResult) -> None:
+        """Log `result` if the mode asks for it."""
+        start = time.perf_counter()
+        mode = self.mode
+        if mode == ResultLog.ALL or (mode == ResultLog.OPEN and result.state == PortState.OPEN):
+            if self._writer is not None:
+                self._writer.write_result(result)
+            else:
+                self.logger.info(
+                    "port %d on %s is %s", result.port, result.host, result.state.name.lower(), stacklevel=2
+                )
+        elif mode == ResultLog.SUMMARY and self.summary is not None:
+            now = time.monotonic()
+            if now >= self._next_summary:
+                self._next_summary = now + self.interval
+                self.logger.info(self.summary(), stacklevel=2)
+        _LOG.observe(time.perf_counter() - start)
+
+    def close(self) -> None:
+        """Log the final summary, when sampling summaries."""
+        if self.mode == ResultLog.SUMMARY and self.summary is not None:
+            self.logger.info(self.summary())
@@ -0,0 +1,394 @@
+"""Counters, gauges and latency histograms of the scan path, cheap enough to always keep.
+
+The engines update the metrics of the default registry, `METRICS`, as they go: probes sent, replies, retries and
+timeouts, how long every stage takes and how deep the queues in between get. An update is a lock and an addition,
+histograms have fixed buckets so observing a value is a bisect on top of that.
+
+The registry can be read at any time: as a table at the end of a scan, as JSON dumped periodically by a
+`StatsDumper`, or in the Prometheus text format served by `serve_metrics`. Worker processes and remote workers
+`export` theirs and the scan that started them `merge`s it into its own.
+"""
+
+import bisect
+import http.server
+import json
+import threading
+import time
+from collections.abc import Iterator
+from pathlib import Path
+from types import TracebackType
+
+PREFIX = "port_scanner_"  # of the metric names in the Prometheus format
+# upper bounds of the histogram buckets in seconds, doubling from a microsecond to over two minutes
+BUCKETS = tuple(1e-6 * 2**i for i in range(28))
+DEFAULT_INTERVAL = 10.0  # seconds in between two dumps of a `StatsDumper`
+
+
+class Counter:
+    """A number that only goes up."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labels: dict[str, str] | None = None) -> None:
+        self.name = name
+        self.description = description
+        self.labels = labels or {}
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: int = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def reset(self) -> None:
+        with self._lock:
+            self.value = 0
+
+    def export(self, *, reset: bool = False) -> int:
+        with self._lock:
+            value = self.value
+            if reset:
+                self.value = 0
+        return value
+
+    def merge(self, value: int) -> None:
+        self.inc(int(value))
+
+    def snapshot(self) -> int:
+        return self.value
+
+    def samples(self) -> Iterator[tuple[str, dict[str, str], float]]:
+        yield self.name, self.labels, self.value
+
+
+class Gauge:
+    """A number that goes up and down, like the depth of a queue, and the highest it went."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, description: str, labels: dict[str, str] | None = None) -> None:
+        self.name = name
+        self.description = description
+        self.labels = labels or {}
+        self.value = 0.0
+        self.peak = 0.0
+
+    def set(self, value: float) -> None:
+        # a single store is atomic, the peak may miss a value set at the very same time, which is fine for a gauge
+        self.value = value
+        self.peak = max(self.peak, value)
+
+    def reset(self) -> None:
+        self.value = self.peak = 0.0
+
+    def export(self, *, reset: bool = False) -> list[float]:
+        value, peak = self.value, self.peak
+        if reset:
+            # the level of a queue isn't used up by reading it, only its peak starts over
+            self.peak = value
+        return [value, peak]
+
+    def merge(self, exported: list[float]) -> None:
+        value, peak = (float(number) for number in exported)
+        self.value = value
+        self.peak = max(self.peak, peak)
+
+    def snapshot(self) -> dict[str, float]:
+        return {"value": self.value, "peak": self.peak}
+
+    def samples(self) -> Iterator[tuple[str, dict[str, str], float]]:
+        yield self.name, self.labels, self.value
+
+
+class Histogram:
+    """The distribution of durations in seconds, in buckets with fixed bounds."""
+
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, description: str, labels: dict[str, str] | None = None, buckets: tuple[float, ...] = BUCKETS
+    ) -> None:
+        self.name = name
+        self.description = description
+        self.labels = labels or {}
+        self.buckets = buckets
+        # the last count is of values above the highest bound
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counts = [0] * (len(self.buckets) + 1)
+            self.count = 0
+            self.sum = 0.0
+
+    def export(self, *, reset: bool = False) -> list:
+        with self._lock:
+            exported = [list(self.counts), self.count, self.sum]
+            if reset:
+                self.counts = [0] * (len(self.buckets) + 1)
+                self.count = 0
+                self.sum = 0.0
+        return exported
+
+    def merge(self, exported: list) -> None:
+        counts, count, total = exported
+        if len(counts) != len(self.counts):
+            msg = f"{self.name} has {len(self.counts)} buckets, not {len(counts)}"
+            raise ValueError(msg)
+        with self._lock:
+            self.counts = [mine + int(theirs) for mine, theirs in zip(self.counts, counts, strict=True)]
+            self.count += int(count)
+            self.sum += float(total)
+
+    def quantile(self, q: float) -> float:
+        """Estimate the `q` quantile, interpolating within the bucket it falls in, 0 without values."""
+        with self._lock:
+            counts, count = list(self.counts), self.count
+        if not count:
+            return 0.0
+        rank = q * count
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            if bucket_count and seen + bucket_count >= rank:
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else lower * 2
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+    def snapshot(self) -> dict[str, float]:
+        return {"count": self.count, "sum": self.sum, "p50": self.quantile(0.5), "p99": self.quantile(0.99)}
+
+    def samples(self) -> Iterator[tuple[str, dict[str, str], float]]:
+        with self._lock:
+            counts, count, total = list(self.counts), self.count, self.sum
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts, strict=False):
+            cumulative += bucket_count
+            yield f"{self.name}_bucket", self.labels | {"le": f"{bound:.6g}"}, cumulative
+        yield f"{self.name}_bucket", self.labels | {"le": "+Inf"}, count
+        yield f"{self.name}_sum", self.labels, total
+        yield f"{self.name}_count", self.labels, count
+
+
+Metric = Counter | Gauge | Histogram
+_KINDS: dict[str, type] = {kind.kind: kind for kind in (Counter, Gauge, Histogram)}
+
+
+def _label_key(labels: dict[str, str]) -> str:
+    return ",".join(f"{key}={value}" for key, value in labels.items())
+
+
+class Metrics:
+    """A registry of metrics, every name and set of labels is registered once."""
+
+    def __init__(self) -> None:
+        self._metrics: dict[tuple[str, str], Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, kind: type, name: str, description: str, labels: dict[str, str]) -> Metric:
+        key = (name, _label_key(labels))
+        with self._lock:
+            metric = self._metrics.get(key)
+            if metric is None:
+                metric = self._metrics[key] = kind(name, description, labels)
+            elif not isinstance(metric, kind):
+                msg = f"{name} is already registered as a {metric.kind}"
+                raise ValueError(msg)
+            return metric
+
+    def counter(self, name: str, description: str, **labels: str) -> Counter:
+        """The counter `name` with `labels`, registered if it wasn't yet."""
+        return self._register(Counter, name, description, labels)  # type: ignore
+
+    def gauge(self, name: str, description: str, **labels: str) -> Gauge:
+        """The gauge `name` with `labels`, registered if it wasn't yet."""
+        return self._register(Gauge, name, description, labels)  # type: ignore
+
+    def histogram(self, name: str, description: str, **labels: str) -> Histogram:
+        """The histogram `name` with `labels`, registered if it wasn't yet."""
+        return self._register(Histogram, name, description, labels)  # type: ignore
+
+    def __iter__(self) -> Iterator[Metric]:
+        with self._lock:
+            return iter(list(self._metrics.values()))
+
+    def reset(self) -> None:
+        """Start counting from zero again."""
+        for metric in self:
+            metric.reset()
+
+    def export(self, *, reset: bool = False) -> list[dict]:
+        """Every metric as JSON-compatible values that `merge` adds to another registry.
+
+        Args:
+            reset (bool): start counting from zero again, without losing what is counted meanwhile
+
+        Returns:
+            list[dict]: the kind, name, description, labels and values of every metric
+        """
+        return [
+            {
+                "kind": metric.kind,
+                "name": metric.name,
+                "description": metric.description,
+                "labels": metric.labels,
+                "values": metric.export(reset=reset),
+            }
+            for metric in self
+        ]
+
+    def merge(self, exported: list[dict]) -> None:
+        """Add what another registry counted, see `export`.
+
+        Raises:
+            KeyError: if a metric is of an unknown kind or misses a field
+            ValueError: if a metric is registered as another kind, or its values don't fit
+        """
+        for entry in exported:
+            try:
+                labels = {str(key): str(value) for key, value in entry["labels"].items()}
+                metric = self._register(_KINDS[entry["kind"]], str(entry["name"]), str(entry["description"]), labels)
+                metric.merge(entry["values"])
+            except (TypeError, AttributeError) as e:
+                msg = f"not an exported metric: {e}"
+                raise ValueError(msg) from None
+
+    def snapshot(self) -> dict:
+        """Every metric as JSON-compatible values, keyed by name and labels like `stage_seconds{stage=connect}`."""
+        return {
+            f"{metric.name}{{{_label_key(metric.labels)}}}" if metric.labels else metric.name: metric.snapshot()
+            for metric in self
+        }
+
+    def prometheus(self) -> str:
+        """Every metric in the Prometheus text exposition format."""
+        lines = []
+        described = set()
+        for metric in sorted(self, key=lambda metric: metric.name):
+            name = PREFIX + metric.name
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {metric.description}")
+                lines.append(f"# TYPE {name} {metric.kind}")
+            for sample, labels, value in metric.samples():
+                rendered = ",".join(f'{key}="{label}"' for key, label in labels.items())
+                lines.append(f"{PREFIX}{sample}{{{rendered}}} {value:g}" if rendered else f"{PREFIX}{sample} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+# the registry the engines report to
+METRICS = Metrics()
+PROBES_SENT = METRICS.counter("probes_sent", "probes sent, retransmissions included")
+REPLIES = METRICS.counter("replies", "probes that were answered")
+RETRIES = METRICS.counter("retries", "retransmissions of unanswered probes")
+TIMEOUTS = METRICS.counter("timeouts", "probes that got no answer in time")
+RESULTS = METRICS.counter("results", "results reported by the scan")
+
+
+def stage(name: str) -> Histogram:
+    """The histogram of how long the stage `name` of the scan path takes."""
+    return METRICS.histogram("stage_seconds", "seconds spent in a stage of the scan path", stage=name)
+
+
+def queue_depth(name: str) -> Gauge:
+    """The gauge of how many items wait in the queue `name`."""
+    return METRICS.gauge("queue_depth", "items waiting in a queue of the scan path", queue=name)
+
+
+class StatsDumper:
+    """Append a JSON snapshot of a registry to a file every `interval` seconds, and once more when stopped.
+
+    Every line is an object with the time and the snapshot, see `Metrics.snapshot`.
+    """
+
+    def __init__(self, path: str | Path, interval: float = DEFAULT_INTERVAL, metrics: Metrics = METRICS) -> None:
+        """Configure the dumps.
+
+        Args:
+            path (str | Path): the file the snapshots are appended to
+            interval (float): seconds in between two snapshots
+            metrics (Metrics): the registry to dump
+
+        Raises:
+            ValueError: if interval isn't positive
+        """
+        if interval <= 0:
+            msg = "interval needs to be positive"
+            raise ValueError(msg)
+        self.path = Path(path)
+        self.interval = interval
+        self.metrics = metrics
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stats-dumper", daemon=True)
+
+    def dump(self) -> None:
+        """Append a snapshot now."""
+        line = json.dumps({"time": time.time(), "metrics": self.metrics.snapshot()})
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(line + "\n")
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.dump()
+
+    def __enter__(self) -> "StatsDumper":
+        self._thread.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.dump()
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    metrics: Metrics
+
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] not in {"/", "/metrics"}:
+            self.send_error(404)
+            return
+        body = self.metrics.prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: object) -> None:  # noqa: A002
+        # scrapes would end up on the console
+        pass
+
+
+def serve_metrics(port: int, host: str = "127.0.0.1", metrics: Metrics = METRICS) -> http.server.ThreadingHTTPServer:
+    """Serve `metrics` in the Prometheus format on /metrics, from a background thread.
+
+    Args:
+        port (int): the port to listen on, 0 for any free port
+        host (str): the address to listen on, only this machine by default
+        metrics (Metrics): the registry to serve
+
+    Returns:
+        http.server.ThreadingHTTPServer: the server, `shutdown` stops it
+    """
+    handler = type("MetricsHandler", (_MetricsHandler,), {"metrics": metrics})
+    server = http.server.ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -1,10 +1,20 @@
-import ipaddress
+import asyncio
+import enum
+import functools
 import platform
 import re
 import socket
 import subprocess
+import time
+from collections import deque
+from collections.abc import AsyncIterable, AsyncIterator, Callable, Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import NamedTuple
 
-from scapy.all import ARP, ICMP, IP, TCP, Ether, sr1, srp  # type: ignore
+from port_scanner.arp import arp_sweep
+from port_scanner.metrics import PROBES_SENT, REPLIES, RETRIES, TIMEOUTS, stage
+from port_scanner.ratelimit import RateLimiter
+from port_scanner.timing import HostTimings
 
 # regex that matches ipv4 addresses
 IPV4_ADDRESS_PATTERN = re.compile(
@@ -25,6 +35,13 @@ IPV4_ADDRESS_PATTERN = re.compile(
 MIN_PORT = 1  # lowest port that can be used
 MAX_PORT = 65535  # highers port that can be used
 
+DEFAULT_TIMEOUT = 0.1  # seconds to wait for a connect before calling the port filtered
+DEFAULT_CONCURRENCY = 1000  # connects in flight for the asyncio engine
+DEFAULT_WORKERS = 32  # threads of the thread pool engine
+SUBMIT_AHEAD = 2  # targets submitted to the thread pool per thread, ahead of the results
+_CONNECT = stage("connect")
+_RATE_LIMIT = stage("rate_limit")
+
 
 def is_ip_address(address: str) -> bool:
     """Check whether `address` represents an ipv4 address.
@@ -43,6 +60,10 @@ def is_ip_address(address: str) -> bool:
     return re.match(IPV4_ADDRESS_PATTERN, address) is not None
 
 
+# round trip time as printed by ping on linux, macos and windows: time=0.045 ms, time<1ms
+PING_TIME_PATTERN = re.compile(r"time[=<]\s*([\d.]+)\s*ms")
+
+
 def ping(host: str) -> bool:
     """Pings a `host`.
     Args:
@@ -55,6 +76,21 @@ def ping(host: str) -> bool:
     -------
         bool: whether ping was successful
     """
+    return ping_rtt(host) is not None
+
+
+def ping_rtt(host: str) -> float | None:
+    """Ping a `host` and measure the round trip time.
+
+    Args:
+        host (str): ip address of the host
+
+    Raises:
+        ValueError: raised when host isn't an ip address
+
+    Returns:
+        float | None: round trip time in seconds, None if the host didn't answer
+    """
     if not is_ip_address(host):
         msg = "Host needs to be an ip address"
         raise ValueError(msg)
@@ -64,7 +100,14 @@ def ping(host: str) -> bool:
     # Building the command. Ex: "ping -c 1 google.com"
     command = ["ping", param, "1", host]
 
-    return subprocess.call(command, stdout=subprocess.DEVNULL) == 0  # noqa: S603
+    started = time.perf_counter()
+    completed = subprocess.run(command, capture_output=True, text=True, check=False)  # noqa: S603
+    elapsed = time.perf_counter() - started
+    if completed.returncode != 0:
+        return None
+    match = PING_TIME_PATTERN.search(completed.stdout)
+    # fall back to timing the whole command if the output can't be parsed
+    return float(match.group(1)) / 1000 if match else elapsed
 
 
 def __ping(host: str) -> bool:  # pragma: no cover
@@ -72,6 +115,9 @@ def __ping(host: str) -> bool:  # pragma: no cover
     if not is_ip_address(host):
         msg = "Host needs to be an ip address"
         raise ValueError(msg)
+    # scapy takes most of a second to import, so only load it when it is needed
+    from scapy.all import ICMP, IP, sr1  # type: ignore  # noqa: PLC0415
+
     # Craft an ICMP Echo Request packet (ping packet)
     icmp_packet = IP(dst=host) / ICMP(type=8)
 
@@ -88,6 +134,170 @@ def __ping(host: str) -> bool:  # pragma: no cover
     return False
 
 
+class PortState(enum.IntEnum):
+    """What a probe found out about a port."""
+
+    OPEN = 1  # the connect succeeded or a SYN-ACK came back
+    CLOSED = 2  # the host answered with a RST
+    FILTERED = 3  # no answer before the timeout
+
+
+class ProbeResult(NamedTuple):
+    """The outcome of probing one port."""
+
+    host: str
+    port: int
+    state: PortState
+    latency: float  # seconds until the probe resolved
+
+    @property
+    def is_open(self) -> bool:
+        return self.state is PortState.OPEN
+
+
+# takes over the connection of an open port, closing it is up to the callable, see `ServiceDetector`
+OnOpen = Callable[[ProbeResult, socket.socket], None]
+
+
+def _check_target(host: str, port: int) -> None:
+    if not is_ip_address(host):
+        msg = "host needs to be a valid ipv4 ip address"
+        raise ValueError(msg)
+    if not isinstance(port, int):
+        msg = "port needs to be an integer"
+        raise TypeError(msg)
+    if port < MIN_PORT or port > MAX_PORT:
+        msg = "port needs to be in between 1 and 65535"
+        raise ValueError(msg)
+
+
+def _account(result: ProbeResult, attempt: int) -> None:
+    """Count a connect in the metrics, `attempt` 0 being the first try."""
+    PROBES_SENT.inc()
+    if attempt:
+        RETRIES.inc()
+    _CONNECT.observe(result.latency)
+    (TIMEOUTS if result.state is PortState.FILTERED else REPLIES).inc()
+
+
+def _connect(host: str, port: int, timeout: float, on_open: OnOpen | None = None) -> ProbeResult:
+    """Probe `port` once with a blocking connect, handing the connection to `on_open` if it succeeds."""
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    started = time.perf_counter()
+    try:
+        s.settimeout(timeout)
+        s.connect((host, port))
+    except ConnectionRefusedError:
+        state = PortState.CLOSED
+    except OSError:
+        # timed out, or an icmp unreachable came back
+        state = PortState.FILTERED
+    else:
+        state = PortState.OPEN
+    result = ProbeResult(host, port, state, time.perf_counter() - started)
+    if on_open is not None and state is PortState.OPEN:
+        on_open(result, s)
+    else:
+        s.close()
+    return result
+
+
+def probe(
+    host: str,
+    port: int,
+    timeout: float = DEFAULT_TIMEOUT,
+    *,
+    timings: HostTimings | None = None,
+    retries: int = 0,
+    limiter: RateLimiter | None = None,
+    on_open: OnOpen | None = None,
+) -> ProbeResult:
+    """Connect to `port` on `host` and report whether it is open, closed or filtered.
+
+    The socket is closed again, unless the port is open and `on_open` takes the connection over. A closed port
+    answers the connect with a RST, so it resolves after one round trip instead of waiting out the timeout.
+
+    Args:
+        host (str): the ip address of the host to scan
+        port (int): the port to scan
+        timeout (float): seconds to wait for the connect to complete, unless `timings` is given
+        timings (HostTimings | None): derive the timeout from the round trip times of `host`, and update them
+        retries (int): how often to try again when the port looks filtered
+        limiter (RateLimiter | None): wait for its budgets before every connect
+        on_open (OnOpen | None): gets the connection to an open port, to reuse it instead of connecting again
+
+    Raises:
+        ValueError: if host isn't an ip address or port is out of range
+        TypeError: if port isn't an integer
+
+    Returns:
+        ProbeResult: the state of the port and how long it took to find out
+    """
+    _check_target(host, port)
+    for attempt in range(retries + 1):
+        if limiter is not None:
+            waited = time.perf_counter()
+            limiter.acquire(host)
+            _RATE_LIMIT.observe(time.perf_counter() - waited)
+        result = _connect(host, port, timeout if timings is None else timings.timeout(host), on_open)
+        _account(result, attempt)
+        if result.state is not PortState.FILTERED:
+            if timings is not None:
+                timings.update(host, result.latency)
+            break
+    return result
+
+
+def scan_threads(
+    targets: Iterable[tuple[str, int]],
+    *,
+    workers: int = DEFAULT_WORKERS,
+    timeout: float = DEFAULT_TIMEOUT,
+    timings: HostTimings | None = None,
+    retries: int = 0,
+    limiter: RateLimiter | None = None,
+    on_open: OnOpen | None = None,
+) -> Iterator[ProbeResult]:
+    """Connect-scan (host, port) `targets` with `probe` on a pool of `workers` threads.
+
+    Results are yielded in target order, so the scan reports exactly what probing the targets one by one would.
+    `targets` is consumed lazily: at most `SUBMIT_AHEAD` targets per thread are submitted before their results are
+    yielded, so memory stays flat however many targets there are. Every thread connects its own sockets, and the
+    limiter, timings and `decorators.rate_limit` are safe to share between them.
+
+    Args:
+        targets (Iterable[tuple[str, int]]): the hosts and ports to scan
+        workers (int): connects in flight at most, one per thread
+        timeout (float): seconds to wait for each connect, unless `timings` is given
+        timings (HostTimings | None): derive timeouts from the round trip times of every host, and update them
+        retries (int): how often to try again when a port looks filtered
+        limiter (RateLimiter | None): wait for its budgets before every connect
+        on_open (OnOpen | None): gets the connection to every open port, from the thread that made it
+
+    Raises:
+        ValueError: if workers isn't positive
+
+    Yields:
+        ProbeResult: the result of every probe, in target order
+    """
+    if workers < 1:
+        msg = "workers needs to be at least 1"
+        raise ValueError(msg)
+    scan = functools.partial(probe, timeout=timeout, timings=timings, retries=retries, limiter=limiter, on_open=on_open)
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="probe")
+    in_flight: deque[Future[ProbeResult]] = deque()
+    try:
+        for host, port in targets:
+            if len(in_flight) >= workers * SUBMIT_AHEAD:
+                yield in_flight.popleft().result()
+            in_flight.append(pool.submit(scan, host, port))
+        while in_flight:
+            yield in_flight.popleft().result()
+    finally:
+        # a scan that is stopped early doesn't wait for the targets that weren't probed yet
+        pool.shutdown(cancel_futures=True)
+
+
 def is_port_open(host: str, port: int) -> bool:
     """Determine whether `host` has the `port` open.
 
@@ -101,61 +311,223 @@ def is_port_open(host: str, port: int) -> bool:
         bool: whether the port is open
 
     """
+    return probe(host, port).is_open
+
+
+async def _async_connect(host: str, port: int, timeout: float, on_open: OnOpen | None = None) -> ProbeResult:
+    """Probe `port` once with a non-blocking connect, handing the connection to `on_open` if it succeeds."""
+    loop = asyncio.get_running_loop()
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.setblocking(False)
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(loop.sock_connect(s, (host, port)), timeout)
+    except ConnectionRefusedError:
+        state = PortState.CLOSED
+    except (TimeoutError, OSError):
+        state = PortState.FILTERED
+    except BaseException:
+        # cancelled, by an early stop or a torn down task group, the socket belongs to nobody then
+        s.close()
+        raise
+    else:
+        state = PortState.OPEN
+    result = ProbeResult(host, port, state, time.perf_counter() - started)
+    if on_open is not None and state is PortState.OPEN:
+        on_open(result, s)
+    else:
+        s.close()
+    return result
+
+
+async def async_probe(
+    host: str,
+    port: int,
+    timeout: float = DEFAULT_TIMEOUT,
+    *,
+    timings: HostTimings | None = None,
+    retries: int = 0,
+    limiter: RateLimiter | None = None,
+    on_open: OnOpen | None = None,
+) -> ProbeResult:
+    """Like `probe`, but without blocking the event loop.
+
+    `on_open` has to return right away, it gets a non-blocking socket.
+
+    Args:
+        host (str): the ip address of the host to scan
+        port (int): the port to scan
+        timeout (float): seconds to wait for the connect to complete, unless `timings` is given
+        timings (HostTimings | None): derive the timeout from the round trip times of `host`, and update them
+        retries (int): how often to try again when the port looks filtered
+        limiter (RateLimiter | None): wait for its budgets before every connect
+        on_open (OnOpen | None): gets the connection to an open port, to reuse it instead of connecting again
+
+    Returns:
+        ProbeResult: the state of the port and how long it took to find out
+    """
+    for attempt in range(retries + 1):
+        if limiter is not None:
+            waited = time.perf_counter()
+            await limiter.acquire_async(host)
+            _RATE_LIMIT.observe(time.perf_counter() - waited)
+        result = await _async_connect(host, port, timeout if timings is None else timings.timeout(host), on_open)
+        _account(result, attempt)
+        if result.state is not PortState.FILTERED:
+            if timings is not None:
+                timings.update(host, result.latency)
+            break
+    return result
+
+
+async def async_is_port_open(host: str, port: int, timeout: float = DEFAULT_TIMEOUT) -> bool:
+    """Determine whether `host` has the `port` open without blocking the event loop.
+
+    Args:
+        host (str): the ip address of the host to scan
+        port (int): the port to scan
+        timeout (float): seconds to wait for the connect to complete
+
+    Returns:
+        bool: whether the port is open
+    """
+    return (await async_probe(host, port, timeout)).is_open
+
+
+async def scan_ports(
+    host: str,
+    ports: Iterable[int],
+    *,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    timeout: float = DEFAULT_TIMEOUT,
+) -> AsyncIterator[ProbeResult]:
+    """Connect-scan `ports` on `host` with up to `concurrency` connects in flight.
+
+    See `scan_targets`, which this wraps for a single host.
+
+    Args:
+        host (str): the ip address of the host to scan
+        ports (Iterable[int]): the ports to scan
+        concurrency (int): maximum number of connects in flight
+        timeout (float): seconds to wait for each connect
+
+    Raises:
+        ValueError: if host isn't an ip address or concurrency isn't positive
+
+    Yields:
+        ProbeResult: the result of every probe
+    """
     if not is_ip_address(host):
         msg = "host needs to be a valid ipv4 ip address"
         raise ValueError(msg)
-    if not isinstance(port, int):
-        msg = "port needs to be an integer"
-        raise TypeError(msg)
-    if port < MIN_PORT or port > MAX_PORT:
-        msg = "port needs to be in between 1 and 65535"
+    async for result in scan_targets(((host, port) for port in ports), concurrency=concurrency, timeout=timeout):
+        yield result
+
+
+async def _next_target(targets: Iterator[tuple[str, int]]) -> tuple[str, int] | None:
+    return next(targets, None)
+
+
+async def scan_targets(
+    targets: Iterable[tuple[str, int]] | AsyncIterable[tuple[str, int]],
+    *,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    timeout: float = DEFAULT_TIMEOUT,
+    timings: HostTimings | None = None,
+    retries: int = 0,
+    limiter: RateLimiter | None = None,
+    on_open: OnOpen | None = None,
+) -> AsyncIterator[ProbeResult]:
+    """Connect-scan (host, port) `targets` with up to `concurrency` connects in flight.
+
+    Results are yielded as soon as each connect completes, so they are not in target order.
+    `targets` is consumed lazily: only `concurrency` targets are ever pending at once. It can be an async iterable,
+    for targets that are only discovered while the scan runs.
+
+    Args:
+        targets (Iterable[tuple[str, int]] | AsyncIterable[tuple[str, int]]): the hosts and ports to scan
+        concurrency (int): maximum number of connects in flight
+        timeout (float): seconds to wait for each connect, unless `timings` is given
+        timings (HostTimings | None): derive timeouts from the round trip times of every host, and update them
+        retries (int): how often to try again when a port looks filtered
+        limiter (RateLimiter | None): wait for its budgets before every connect
+        on_open (OnOpen | None): gets the connection to every open port, see `async_probe`
+
+    Raises:
+        ValueError: if concurrency isn't positive
+
+    Yields:
+        ProbeResult: the result of every probe
+    """
+    if concurrency < 1:
+        msg = "concurrency needs to be at least 1"
         raise ValueError(msg)
-    # creates a new socket
-    s = socket.socket()
-    try:
-        s.settimeout(0.1)
-        # tries to connect to host using that port
-        s.connect((host, port))
-    except TimeoutError:
-        # cannot connect, port is closed
-        # return false
-        return False
+
+    if isinstance(targets, AsyncIterable):
+        pending = aiter(targets)
+        # an async iterator can't be advanced by several workers at once
+        lock = asyncio.Lock()
+
+        async def next_target() -> tuple[str, int] | None:
+            async with lock:
+                return await anext(pending, None)
+
     else:
-        # the connection was established, port is open!
-        return True
+        # every worker pulls from the same iterator, which is safe on a single event loop
+        next_target = functools.partial(_next_target, iter(targets))
+
+    # workers push results here and a `None` once they run out of targets
+    results: asyncio.Queue[ProbeResult | None] = asyncio.Queue()
+
+    async def worker() -> None:
+        try:
+            while (target := await next_target()) is not None:
+                host, port = target
+                result = await async_probe(
+                    host, port, timeout, timings=timings, retries=retries, limiter=limiter, on_open=on_open
+                )
+                results.put_nowait(result)
+        finally:
+            results.put_nowait(None)
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    try:
+        running = len(workers)
+        while running:
+            result = await results.get()
+            if result is None:
+                running -= 1
+            else:
+                yield result
+        # surface errors raised inside the workers
+        for task in workers:
+            task.result()
+    finally:
+        for task in workers:
+            task.cancel()
 
 
 def arp_scan(ip_network: str) -> list[str]:
     """Perform an arp scan on `ip_network`
 
+    Use `arp.arp_sweep` to get the hosts as they answer, along with their hardware address and round trip time.
+
     Args:
         ip_network (str): valid ip network for `ip_address.ip_network`
 
     Raises:
-        ValueError: if the string passed isn't either a v4 or a v6
-      address
+        ValueError: if the string passed isn't a v4 network
 
     Returns:
         list[str]: List of ip addresses on the network
     """
-    try:
-        ipaddress.ip_network(ip_network)
-    except ValueError:
-        msg = "Not a valid ip network"
-        raise ValueError(msg) from None
-    arp_request = ARP(pdst=ip_network)
-    ether = Ether(dst="ff:ff:ff:ff:ff:ff")
-    arp_broadcast = ether / arp_request
-    answered_list, _ = srp(arp_broadcast, timeout=1, verbose=False)
-
-    devices = []
-    for _, received in answered_list:
-        devices.append(received.psrc)
-
-    return devices
+    return [reply.ip for reply in arp_sweep(ip_network)]
 
 
 def tcp_syn_scan(target_ip: str, target_port: int) -> bool:
+    # scapy takes most of a second to import, so only load it when it is needed
+    from scapy.all import IP, TCP, sr1  # type: ignore  # noqa: PLC0415
+
     # Craft a TCP SYN packet
     syn_packet = IP(dst=target_ip) / TCP(dport=target_port, flags="S")
 
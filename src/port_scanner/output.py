@@ -0,0 +1,207 @@
+"""Machine-readable, streaming scan output.
+
+Results are written one record each as they complete, in JSON lines, CSV or a compact binary format. Records are
+buffered and written in batches, which keeps the output cheap on multi-million probe sweeps while still showing up
+soon enough to follow a scan through a pipe.
+
+The binary format is a header followed by fixed-width records, see `HEADER` and `RECORD`; `read_binary` reads it back.
+"""
+
+import enum
+import socket
+import struct
+import sys
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Iterator
+from pathlib import Path
+from types import TracebackType
+from typing import BinaryIO
+
+from port_scanner.networking import PortState, ProbeResult
+
+BATCH_SIZE = 4096  # results buffered before they are written
+FLUSH_INTERVAL = 1.0  # seconds a result waits at most before it is written
+
+MAGIC = b"PSCN"
+VERSION = 1
+# magic, version, size of every record
+HEADER = struct.Struct("!4sBB2x")
+# ipv4 address, port, state, latency in seconds
+RECORD = struct.Struct("!4sHBxf")
+READ_SIZE = RECORD.size * 8192  # bytes read at once by `read_binary`
+
+
+class OutputFormat(enum.StrEnum):
+    """Formats the results can be written in."""
+
+    JSONL = "jsonl"
+    CSV = "csv"
+    BIN = "bin"
+
+
+class ResultWriter(ABC):
+    """Buffer results and write them to a binary stream in batches.
+
+    Subclasses encode a single result, and optionally a header written before the first one.
+    """
+
+    def __init__(
+        self,
+        stream: BinaryIO,
+        *,
+        batch_size: int = BATCH_SIZE,
+        flush_interval: float = FLUSH_INTERVAL,
+        close_stream: bool = False,
+    ) -> None:
+        """Start writing to `stream`.
+
+        Args:
+            stream (BinaryIO): where the results go
+            batch_size (int): results buffered before they are written
+            flush_interval (float): seconds a result waits at most before it is written
+            close_stream (bool): close `stream` when the writer is closed
+        """
+        self.stream = stream
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.close_stream = close_stream
+        self.written = 0
+        self._buffer = [self.header()]
+        self._pending = 0  # results in the buffer
+        self._deadline = time.monotonic() + flush_interval
+
+    def header(self) -> bytes:
+        """Bytes written before the first result."""
+        return b""
+
+    @abstractmethod
+    def encode(self, result: ProbeResult) -> bytes:
+        """Bytes written for `result`."""
+
+    def write(self, result: ProbeResult) -> None:
+        """Queue `result` for writing, writing the batch when it is full or old enough."""
+        self._buffer.append(self.encode(result))
+        self.written += 1
+        self._pending += 1
+        if self._pending >= self.batch_size or time.monotonic() >= self._deadline:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write every buffered result."""
+        self.stream.write(b"".join(self._buffer))
+        self.stream.flush()
+        self._buffer.clear()
+        self._pending = 0
+        self._deadline = time.monotonic() + self.flush_interval
+
+    def close(self) -> None:
+        """Write every buffered result and close the stream if the writer owns it."""
+        self.flush()
+        if self.close_stream:
+            self.stream.close()
+
+    def __enter__(self) -> "ResultWriter":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.close()
+
+
+class JsonlWriter(ResultWriter):
+    """One JSON object per line."""
+
+    def encode(self, result: ProbeResult) -> bytes:
+        # hosts are ip addresses, which never need escaping
+        return (
+            f'{{"host": "{result.host}", "port": {result.port}, "state": "{result.state.name.lower()}", '
+            f'"latency": {result.latency:.6f}}}\n'
+        ).encode()
+
+
+class CsvWriter(ResultWriter):
+    """Comma separated values, with a header row."""
+
+    def header(self) -> bytes:
+        return b"host,port,state,latency\n"
+
+    def encode(self, result: ProbeResult) -> bytes:
+        return f"{result.host},{result.port},{result.state.name.lower()},{result.latency:.6f}\n".encode()
+
+
+class BinaryWriter(ResultWriter):
+    """Fixed-width records of 12 bytes, after an 8 byte header."""
+
+    def header(self) -> bytes:
+        return HEADER.pack(MAGIC, VERSION, RECORD.size)
+
+    def encode(self, result: ProbeResult) -> bytes:
+        return RECORD.pack(socket.inet_aton(result.host), result.port, result.state, result.latency)
+
+
+WRITERS: dict[OutputFormat, type[ResultWriter]] = {
+    OutputFormat.JSONL: JsonlWriter,
+    OutputFormat.CSV: CsvWriter,
+    OutputFormat.BIN: BinaryWriter,
+}
+
+
+def open_output(output_format: OutputFormat, path: str | Path | None = None, **kwargs) -> ResultWriter:
+    """Create a writer for `output_format` to a file or stdout.
+
+    Args:
+        output_format (OutputFormat): the format to write
+        path (str | Path | None): the file to write to, stdout if not given or `-`
+        kwargs: passed on to the writer
+
+    Returns:
+        ResultWriter: the writer, which has to be closed to write the last results
+    """
+    if path is None or str(path) == "-":
+        return WRITERS[output_format](sys.stdout.buffer, **kwargs)
+    return WRITERS[output_format](open(path, "wb"), close_stream=True, **kwargs)
+
+
+def _read(stream: BinaryIO, size: int) -> bytes:
+    """Read `size` bytes, fewer only at the end of the stream, however short the reads of a pipe are."""
+    data = stream.read(size)
+    while len(data) < size and (rest := stream.read(size - len(data))):
+        data += rest
+    return data
+
+
+def read_binary(source: str | Path | BinaryIO) -> Iterator[ProbeResult]:
+    """Read results written in the binary format.
+
+    Args:
+        source (str | Path | BinaryIO): a file, or a binary stream positioned at the header
+
+    Raises:
+        ValueError: if the data doesn't start with a header of a known version, or ends halfway a record
+
+    Yields:
+        ProbeResult: every result, in the order it was written
+    """
+    if isinstance(source, str | Path):
+        with open(source, "rb") as stream:
+            yield from read_binary(stream)
+        return
+    magic, version, record_size = HEADER.unpack(_read(source, HEADER.size).ljust(HEADER.size, b"\0"))
+    if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+        msg = "not a binary scan result file, or one of an unknown version"
+        raise ValueError(msg)
+    state_of = {int(state): state for state in PortState}
+    while chunk := source.read(READ_SIZE):
+        if len(chunk) % RECORD.size:
+            # a short read, complete the last record
+            chunk += _read(source, RECORD.size - len(chunk) % RECORD.size)
+        if len(chunk) % RECORD.size:
+            msg = "the data ends halfway a record"
+            raise ValueError(msg)
+        for address, port, state, latency in RECORD.iter_unpack(chunk):
+            yield ProbeResult(socket.inet_ntoa(address), port, state_of[state], latency)
@@ -0,0 +1,300 @@
+"""Where the raw socket engines write probes and read replies.
+
+A `BatchProber` talks to the network through a `PacketIO` backend:
+
+- `RawIO` reads from real raw or packet sockets into a ring of buffers allocated once. After a wait for the first
+  packet it drains whatever else the kernel queued without blocking, so a burst of replies costs one wakeup, like
+  `recvmmsg` would, and no packet is copied before it is parsed.
+- `SocketIO` reads one packet at a time from anything with the socket methods, like stand-ins in tests.
+- `ScapyIO` goes through scapy's sockets, for platforms whose sockets can't send or capture what the engines need,
+  like ARP without packet sockets, or TCP replies on BSDs, whose raw sockets never receive them.
+- `FakeIO` is a network in memory: a function answers every packet sent, so engines run without privileges.
+
+Packets handed out by `receive` are only valid until the next call, the engines parse them right away.
+
+On linux the engines attach a classic BPF program to their receive sockets with `attach_filter`, so the kernel
+drops everything but replies to the scan before it is copied to the process. `RawIO` counts the packets that make
+it through, and for packet sockets what the kernel dropped because the receiver fell behind.
+"""
+
+import ctypes
+import queue
+import select
+import socket
+import struct
+from abc import ABC, abstractmethod
+from collections.abc import Callable, Iterable, Iterator
+from typing import Any
+
+from port_scanner.metrics import METRICS
+
+RECEIVE_TIMEOUT = 0.05  # seconds a receive blocks before the caller checks whether it should stop
+RECEIVE_BATCH = 64  # packets read per wakeup at most
+BUFFER_SIZE = 65535  # bytes of a receive buffer, the largest ip packet
+
+Address = tuple[Any, ...] | None
+Packet = bytes | bytearray | memoryview
+
+# classic BPF opcodes, see linux/filter.h
+BPF_LD = 0x00
+BPF_LDX = 0x01
+BPF_JMP = 0x05
+BPF_RET = 0x06
+BPF_W = 0x00  # 32 bit load
+BPF_H = 0x08  # 16 bit load
+BPF_B = 0x10  # 8 bit load
+BPF_ABS = 0x20  # at a fixed offset
+BPF_IND = 0x40  # at an offset from the index register
+BPF_MSH = 0xA0  # 4 * (byte & 0xf), the length of an ip header
+BPF_JEQ = 0x10
+BPF_JSET = 0x40
+BPF_K = 0x00
+ACCEPT = 0xFFFF  # bytes of an accepted packet to keep
+SO_ATTACH_FILTER = 26
+SOL_PACKET = 263
+PACKET_STATISTICS = 6
+INSTRUCTION = struct.Struct("HBBI")  # code, jump if true, jump if false, constant
+
+Instruction = tuple[int, int, int, int]
+
+CAPTURED = METRICS.counter("packets_captured", "packets the kernel handed to the receiver, after the filter")
+KERNEL_DROPS = METRICS.counter("kernel_drops", "packets the kernel dropped because the receiver fell behind")
+
+
+def attach_filter(sock: socket.socket, program: list[Instruction]) -> None:
+    """Make the kernel drop every packet `program` rejects before `sock` sees it.
+
+    Args:
+        sock (socket.socket): a socket on linux
+        program (list[Instruction]): classic BPF instructions, each a (code, jt, jf, k) tuple
+
+    Raises:
+        ValueError: if the program is empty or longer than the kernel takes
+        OSError: if the kernel rejects the program
+    """
+    if not 0 < len(program) <= 4096:  # noqa: PLR2004
+        msg = "a filter needs between 1 and 4096 instructions"
+        raise ValueError(msg)
+    code = ctypes.create_string_buffer(b"".join(INSTRUCTION.pack(*instruction) for instruction in program))
+    # struct sock_fprog, the kernel copies the instructions while attaching
+    fprog = struct.pack("HL", len(program), ctypes.addressof(code))
+    sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+
+
+def kernel_statistics(sock: socket.socket) -> tuple[int, int] | None:
+    """The packets a packet socket received and dropped since the last call, None for other sockets."""
+    if sock.family != getattr(socket, "AF_PACKET", None):
+        return None
+    return struct.unpack("II", sock.getsockopt(SOL_PACKET, PACKET_STATISTICS, 8))
+
+
+class PacketIO(ABC):
+    """Sends packets and receives batches of them."""
+
+    @abstractmethod
+    def send(self, packet: Packet, address: Address = None) -> None:
+        """Write `packet`, to `address` on sockets that aren't connected or bound to an interface.
+
+        Args:
+            packet (Packet): the packet, its buffer can be reused as soon as this returns
+            address (Address): where the packet goes, None to send on the bound interface
+        """
+
+    @abstractmethod
+    def receive(self) -> Iterator[tuple[Packet, str | None]]:
+        """Wait up to `RECEIVE_TIMEOUT` for packets and yield the ones that arrived.
+
+        Yields:
+            tuple[Packet, str | None]: every packet and the address it came from, if the backend knows it
+        """
+
+    def close(self) -> None:
+        """Release the sockets of the backend."""
+
+
+class SocketIO(PacketIO):
+    """One packet per receive from objects with the socket methods, so stand-ins work as well as sockets."""
+
+    def __init__(self, send_socket: socket.socket, recv_socket: socket.socket | None = None) -> None:
+        """Wrap the sockets.
+
+        Args:
+            send_socket (socket.socket): written to with `sendto`, or `send` without an address
+            recv_socket (socket.socket | None): read from with `recvfrom`, the send socket if not given
+        """
+        self.send_socket = send_socket
+        self.recv_socket = recv_socket if recv_socket is not None else send_socket
+        self.recv_socket.settimeout(RECEIVE_TIMEOUT)
+
+    def send(self, packet: Packet, address: Address = None) -> None:
+        if address is None:
+            self.send_socket.send(packet)
+        else:
+            self.send_socket.sendto(packet, address)
+
+    def receive(self) -> Iterator[tuple[Packet, str | None]]:
+        try:
+            packet, address = self.recv_socket.recvfrom(BUFFER_SIZE)
+        except TimeoutError:
+            return
+        yield packet, address[0] if address else None
+
+    def close(self) -> None:
+        self.send_socket.close()
+        if self.recv_socket is not self.send_socket:
+            self.recv_socket.close()
+
+
+class RawIO(SocketIO):
+    """Batched receives into buffers that are allocated once, from real sockets."""
+
+    def __init__(
+        self, send_socket: socket.socket, recv_socket: socket.socket | None = None, *, batch: int = RECEIVE_BATCH
+    ) -> None:
+        """Wrap the sockets and allocate the receive buffers.
+
+        Args:
+            send_socket (socket.socket): the socket probes are written to
+            recv_socket (socket.socket | None): the socket replies are read from, the send socket if not given
+            batch (int): packets read per wakeup at most
+
+        Raises:
+            ValueError: if batch isn't positive
+        """
+        if batch < 1:
+            msg = "batch needs to be at least 1"
+            raise ValueError(msg)
+        super().__init__(send_socket, recv_socket)
+        # waiting is left to select, so draining what is queued never blocks
+        self.recv_socket.setblocking(False)
+        self._buffers = [memoryview(bytearray(BUFFER_SIZE)) for _ in range(batch)]
+
+    def send(self, packet: Packet, address: Address = None) -> None:
+        while True:
+            try:
+                super().send(packet, address)
+            except BlockingIOError:
+                # a socket that sends and receives is non-blocking too, wait for room in its buffer
+                select.select([], [self.send_socket], [])
+            else:
+                return
+
+    def receive(self) -> Iterator[tuple[Packet, str | None]]:
+        if not select.select([self.recv_socket], [], [], RECEIVE_TIMEOUT)[0]:
+            return
+        recv_into = self.recv_socket.recvfrom_into
+        for buffer in self._buffers:
+            try:
+                size, address = recv_into(buffer)
+            except BlockingIOError:
+                return
+            CAPTURED.inc()
+            yield buffer[:size], address[0] if address else None
+
+    def close(self) -> None:
+        if isinstance(self.recv_socket, socket.socket):
+            statistics = kernel_statistics(self.recv_socket)
+            if statistics is not None:
+                KERNEL_DROPS.inc(statistics[1])
+        super().close()
+
+
+class ScapyIO(PacketIO):
+    """Send and capture through scapy, slower but available wherever scapy can capture."""
+
+    def __init__(
+        self,
+        *,
+        interface: str | None = None,
+        capture_filter: str | None = None,
+        link_layer: bool = True,
+        send_socket: socket.socket | None = None,
+    ) -> None:
+        """Open the scapy sockets.
+
+        Args:
+            interface (str | None): the interface to capture on, and to send on at the link layer, scapy's default
+          if not given
+            capture_filter (str | None): a tcpdump expression the captured packets have to match
+            link_layer (bool): whether packets are sent and received as frames, or as ip packets
+            send_socket (socket.socket | None): socket ip packets are written to instead of a scapy socket
+        """
+        # scapy takes most of a second to import, so only load it when it is needed
+        from scapy.all import IP, conf  # type: ignore  # noqa: PLC0415
+
+        self._ip = IP
+        self.link_layer = link_layer
+        self._listen = conf.L2listen(iface=interface, filter=capture_filter)
+        if send_socket is not None:
+            self._send = send_socket
+        elif link_layer:
+            self._send = conf.L2socket(iface=interface)
+        else:
+            self._send = conf.L3socket()
+
+    def send(self, packet: Packet, address: Address = None) -> None:
+        if isinstance(self._send, socket.socket):
+            self._send.sendto(packet, address)  # type: ignore
+        elif self.link_layer:
+            self._send.send(bytes(packet))
+        else:
+            self._send.send(self._ip(bytes(packet)))
+
+    def receive(self) -> Iterator[tuple[Packet, str | None]]:
+        if not type(self._listen).select([self._listen], RECEIVE_TIMEOUT):
+            return
+        kind, data, _ = self._listen.recv_raw()
+        if data is None:
+            return
+        if self.link_layer:
+            yield data, None
+            return
+        # the link layer header differs per interface type, only this fallback dissects it
+        ip = kind(data).getlayer(self._ip)
+        if ip is not None:
+            yield bytes(ip), None
+
+    def close(self) -> None:
+        self._listen.close()
+        self._send.close()
+
+
+class FakeIO(PacketIO):
+    """A network in memory, for running engines without privileges.
+
+    `answer` is called with every packet sent and where it went, and returns the replies with the address they come
+    from. Replies can also be added with `inject`.
+    """
+
+    def __init__(self, answer: Callable[[bytes, Address], Iterable[tuple[Packet, str | None]]] | None = None) -> None:
+        self.answer = answer
+        self.sent: list[tuple[bytes, Address]] = []
+        self.closed = False
+        self._replies: queue.SimpleQueue[tuple[Packet, str | None]] = queue.SimpleQueue()
+
+    def send(self, packet: Packet, address: Address = None) -> None:
+        # the engines patch their buffers in place, so what was sent is copied
+        data = bytes(packet)
+        self.sent.append((data, address))
+        if self.answer is not None:
+            for reply in self.answer(data, address):
+                self._replies.put(reply)
+
+    def inject(self, packet: Packet, source: str | None = None) -> None:
+        """Deliver `packet` from `source` as if it arrived on the wire."""
+        self._replies.put((packet, source))
+
+    def receive(self) -> Iterator[tuple[Packet, str | None]]:
+        try:
+            reply = self._replies.get(timeout=RECEIVE_TIMEOUT)
+        except queue.Empty:
+            return
+        yield reply
+        for _ in range(RECEIVE_BATCH - 1):
+            try:
+                yield self._replies.get_nowait()
+            except queue.Empty:
+                return
+
+    def close(self) -> None:
+        self.closed = True
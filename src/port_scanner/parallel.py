@@ -0,0 +1,301 @@
+"""Scan on several cores at once.
+
+The targets are split into disjoint shards, see `permutation.walk`, and every shard is scanned by a worker process
+with its own engine and an equal share of the rate budgets. Workers send their results back in batches of
+fixed-width binary records over a pipe, so the parent only unpacks bytes instead of unpickling objects. Before
+they finish they send what their metrics counted, which the parent adds to its own.
+"""
+
+import asyncio
+import functools
+import json
+import multiprocessing
+import multiprocessing.connection
+import random
+import socket
+import time
+from collections.abc import Callable, Iterator
+from pathlib import Path
+from typing import NamedTuple
+
+from port_scanner.checkpoint import Checkpoint
+from port_scanner.metrics import METRICS
+from port_scanner.networking import PortState, ProbeResult, probe, scan_targets
+from port_scanner.output import RECORD
+from port_scanner.permutation import walk
+from port_scanner.ratelimit import RateLimiter
+from port_scanner.syn_scanner import SynScanner
+from port_scanner.targets import Ranges, TargetSpec
+from port_scanner.timing import DEFAULT_RETRIES, HostTimings
+
+BATCH_SIZE = 1024  # results a worker sends at once
+FLUSH_INTERVAL = 0.05  # seconds a result waits at most before a worker sends it
+# first byte of every message from a worker
+RESULTS = b"R"
+STATS = b"S"  # the metrics of the worker as json, see `Metrics.export`
+ERROR = b"E"
+DONE = b"D"
+_STATES = {int(state): state for state in PortState}
+
+
+class ShardJob(NamedTuple):
+    """Everything a worker process needs to scan its shard, picklable."""
+
+    hosts: Ranges
+    ports: Ranges
+    seed: int | None
+    randomize: bool
+    shard: int
+    shards: int
+    start: int
+    use_tcp_syn: bool
+    concurrency: int
+    retries: int
+    initial_timeout: float
+    min_timeout: float
+    max_timeout: float
+    rate: float | None
+    burst: float | None
+    host_rate: float | None
+    host_burst: float | None
+    checkpoint: str | None
+
+
+class BatchSender:
+    """Pack results into records and send them over `connection` in batches.
+
+    A message is RESULTS followed by the records, `connection` only needs a `send_bytes` method.
+    """
+
+    def __init__(self, connection: multiprocessing.connection.Connection) -> None:
+        self.connection = connection
+        self._records = bytearray(RESULTS)
+        self._pending = 0
+        self._deadline = time.monotonic() + FLUSH_INTERVAL
+
+    def __call__(self, result: ProbeResult) -> None:
+        host, port, state, latency = result
+        self._records += RECORD.pack(socket.inet_aton(host), port, state, latency)
+        self._pending += 1
+        if self._pending >= BATCH_SIZE or time.monotonic() >= self._deadline:
+            self.flush()
+
+    def flush(self) -> None:
+        """Send the records that are waiting."""
+        if self._pending:
+            self.connection.send_bytes(self._records)
+        del self._records[1:]
+        self._pending = 0
+        self._deadline = time.monotonic() + FLUSH_INTERVAL
+
+
+def scan_shard(job: ShardJob, send: Callable[[ProbeResult], None]) -> None:
+    """Scan the shard of `job` with the engine it asks for, passing every result to `send`."""
+    targets = walk(
+        TargetSpec(job.hosts, job.ports),
+        seed=job.seed,
+        randomize=job.randomize,
+        shard=job.shard,
+        shards=job.shards,
+        start=job.start,
+    )
+    if job.checkpoint is not None:
+        targets = Checkpoint.open(job.checkpoint).pending(targets)
+    timings = HostTimings(initial_timeout=job.initial_timeout, min_timeout=job.min_timeout, max_timeout=job.max_timeout)
+    limiter = RateLimiter(job.rate, job.host_rate, burst=job.burst, host_burst=job.host_burst)
+    if job.use_tcp_syn:
+        for result in SynScanner(retries=job.retries, timings=timings, limiter=limiter).scan_targets(targets):
+            send(result)
+    elif job.concurrency > 1:
+
+        async def _scan() -> None:
+            async for result in scan_targets(
+                targets, concurrency=job.concurrency, timings=timings, retries=job.retries, limiter=limiter
+            ):
+                send(result)
+
+        asyncio.run(_scan())
+    else:
+        scan = functools.partial(probe, timings=timings, retries=job.retries, limiter=limiter)
+        for host, port in targets:
+            send(scan(host, port))
+
+
+def export_stats(*, reset: bool = False) -> bytes:
+    """A STATS message with what the metrics of this process counted, see `Metrics.export`."""
+    return STATS + json.dumps(METRICS.export(reset=reset), separators=(",", ":")).encode()
+
+
+def _worker(job: ShardJob, connection: multiprocessing.connection.Connection) -> None:
+    """Worker process: scan a shard and report back, errors and metrics included."""
+    sender = BatchSender(connection)
+    try:
+        scan_shard(job, sender)
+        sender.flush()
+    except Exception as e:
+        connection.send_bytes(export_stats())
+        connection.send_bytes(ERROR + f"{type(e).__name__}: {e}".encode())
+    else:
+        connection.send_bytes(export_stats())
+        connection.send_bytes(DONE)
+    finally:
+        connection.close()
+
+
+def shard_jobs(
+    targets: TargetSpec,
+    parts: int,
+    *,
+    seed: int | None = None,
+    randomize: bool = False,
+    shard: int = 0,
+    shards: int = 1,
+    start: int = 0,
+    use_tcp_syn: bool = False,
+    concurrency: int = 1,
+    retries: int = DEFAULT_RETRIES,
+    timings: HostTimings | None = None,
+    limiter: RateLimiter | None = None,
+    checkpoint: str | Path | None = None,
+) -> list[ShardJob]:
+    """Split a shard of `targets` into `parts` jobs, see `scan_processes` for the arguments.
+
+    Job `index` takes every `parts`-th target of the shard, starting at target `index`. `limiter` holds the budgets
+    of a single job.
+    """
+    if randomize and seed is None:
+        # every job has to walk the same order
+        seed = random.getrandbits(32)
+    timings = timings if timings is not None else HostTimings()
+    limiter = limiter if limiter is not None else RateLimiter()
+    bucket = limiter.bucket
+    return [
+        ShardJob(
+            hosts=targets.host_ranges,
+            ports=targets.port_ranges,
+            seed=seed,
+            randomize=randomize,
+            shard=shard + index * shards,
+            shards=shards * parts,
+            start=max(0, -(-(start - index) // parts)),
+            use_tcp_syn=use_tcp_syn,
+            concurrency=concurrency,
+            retries=retries,
+            initial_timeout=timings.initial_timeout,
+            min_timeout=timings.min_timeout,
+            max_timeout=timings.max_timeout,
+            rate=bucket.rate if bucket is not None else None,
+            burst=bucket.burst if bucket is not None else None,
+            host_rate=limiter.host_rate,
+            host_burst=limiter.host_burst,
+            checkpoint=str(checkpoint) if checkpoint is not None else None,
+        )
+        for index in range(parts)
+    ]
+
+
+def unpack_results(records: bytes | memoryview) -> Iterator[ProbeResult]:
+    """Unpack the records of a RESULTS message."""
+    inet_ntoa = socket.inet_ntoa
+    for address, port, state, latency in RECORD.iter_unpack(records):
+        yield ProbeResult(inet_ntoa(address), port, _STATES[state], latency)
+
+
+def scan_processes(
+    targets: TargetSpec,
+    *,
+    processes: int,
+    seed: int | None = None,
+    randomize: bool = False,
+    shard: int = 0,
+    shards: int = 1,
+    start: int = 0,
+    use_tcp_syn: bool = False,
+    concurrency: int = 1,
+    retries: int = DEFAULT_RETRIES,
+    timings: HostTimings | None = None,
+    limiter: RateLimiter | None = None,
+    checkpoint: str | Path | None = None,
+) -> Iterator[ProbeResult]:
+    """Scan a shard of `targets` with several worker processes, each scanning a shard of it.
+
+    Args:
+        targets (TargetSpec): the targets of the whole scan
+        processes (int): number of worker processes
+        seed (int | None): seed of the pseudo-random order, see `walk`, random if not given
+        randomize (bool): visit the targets in pseudo-random order
+        shard (int): which shard of the whole scan to scan, counting from 0
+        shards (int): number of shards the whole scan is split into
+        start (int): number of targets of the shard that were already scanned, see `walk`
+        use_tcp_syn (bool): scan with `SynScanner` instead of connects
+        concurrency (int): connects in flight in every worker, above 1 uses the asyncio engine
+        retries (int): retransmissions of unanswered probes
+        timings (HostTimings | None): the timeout bounds every worker uses, the defaults if not given
+        limiter (RateLimiter | None): budgets split evenly over the workers, unlimited if not given
+        checkpoint (str | Path | None): checkpoint file whose finished targets are skipped
+
+    Raises:
+        ValueError: if processes isn't positive
+        RuntimeError: if a worker fails or dies
+
+    Yields:
+        ProbeResult: the results of all workers, as they come in
+    """
+    if processes < 1:
+        msg = "processes needs to be at least 1"
+        raise ValueError(msg)
+    jobs = shard_jobs(
+        targets,
+        processes,
+        seed=seed,
+        randomize=randomize,
+        shard=shard,
+        shards=shards,
+        start=start,
+        use_tcp_syn=use_tcp_syn,
+        concurrency=concurrency,
+        retries=retries,
+        timings=timings,
+        limiter=(limiter if limiter is not None else RateLimiter()).split(processes),
+        checkpoint=checkpoint,
+    )
+    context = multiprocessing.get_context("spawn")
+    workers: dict[multiprocessing.connection.Connection, multiprocessing.process.BaseProcess] = {}
+    try:
+        for index, job in enumerate(jobs):
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(target=_worker, args=(job, sender), name=f"scan-worker-{index}", daemon=True)
+            process.start()
+            sender.close()
+            workers[receiver] = process
+        yield from _collect(workers)
+    finally:
+        for receiver, process in workers.items():
+            if process.is_alive():
+                process.terminate()
+            process.join()
+            receiver.close()
+
+
+def _collect(
+    workers: dict[multiprocessing.connection.Connection, multiprocessing.process.BaseProcess],
+) -> Iterator[ProbeResult]:
+    """Unpack the results of every worker until all of them are done, and add up their metrics."""
+    running = list(workers)
+    while running:
+        for receiver in multiprocessing.connection.wait(running):
+            try:
+                message = receiver.recv_bytes()  # type: ignore
+            except EOFError:
+                msg = f"{workers[receiver].name} died"  # type: ignore
+                raise RuntimeError(msg) from None
+            kind, body = message[:1], memoryview(message)[1:]
+            if kind == RESULTS:
+                yield from unpack_results(body)
+            elif kind == STATS:
+                METRICS.merge(json.loads(bytes(body)))
+            elif kind == ERROR:
+                msg = f"{workers[receiver].name} failed: {bytes(body).decode()}"  # type: ignore
+                raise RuntimeError(msg)
+            else:
+                running.remove(receiver)  # type: ignore
@@ -0,0 +1,116 @@
+"""Pseudo-random, memory-constant ordering of scan targets.
+
+`Permutation` is a keyed Feistel network over the smallest even-bit domain that holds every index, made to fit the
+exact number of targets by cycle walking. Any position can be computed on its own, so a scan can start anywhere in
+the order and several scanners can split it into disjoint shards without sharing state.
+"""
+
+import random
+from collections.abc import Iterator, Sequence
+from typing import TypeVar
+
+T = TypeVar("T")
+
+DEFAULT_ROUNDS = 4
+_MULTIPLIER = 0x9E3779B97F4A7C15  # 2**64 / golden ratio, spreads bits across the word
+_MASK64 = (1 << 64) - 1
+
+
+class Permutation:
+    """A bijection of ``range(size)`` onto itself that looks random and needs O(1) memory."""
+
+    def __init__(self, size: int, seed: int | None = None, rounds: int = DEFAULT_ROUNDS) -> None:
+        """Set up the permutation.
+
+        Args:
+            size (int): number of elements to permute
+            seed (int | None): the same seed always gives the same order, random if not given
+            rounds (int): number of feistel rounds
+
+        Raises:
+            ValueError: if size is negative or rounds isn't positive
+        """
+        if size < 0:
+            msg = "size can't be negative"
+            raise ValueError(msg)
+        if rounds < 1:
+            msg = "rounds needs to be at least 1"
+            raise ValueError(msg)
+        self.size = size
+        self.seed = seed if seed is not None else random.getrandbits(64)
+        # each feistel half gets half the bits of the smallest power of four holding `size`
+        self._half_bits = max(1, ((size - 1).bit_length() + 1) // 2)
+        self._half_mask = (1 << self._half_bits) - 1
+        keys = random.Random(self.seed)  # noqa: S311
+        self._keys = [keys.getrandbits(64) for _ in range(rounds)]
+
+    def _round(self, half: int, key: int) -> int:
+        mixed = ((half ^ key) * _MULTIPLIER) & _MASK64
+        return (mixed ^ (mixed >> 29)) & self._half_mask
+
+    def _encrypt(self, value: int) -> int:
+        left, right = value >> self._half_bits, value & self._half_mask
+        for key in self._keys:
+            left, right = right, left ^ self._round(right, key)
+        return (left << self._half_bits) | right
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, position: int) -> int:
+        if not 0 <= position < self.size:
+            raise IndexError(position)
+        value = self._encrypt(position)
+        # the domain is at most four times too big, so this walks a few steps at most on average
+        while value >= self.size:
+            value = self._encrypt(value)
+        return value
+
+    def __iter__(self) -> Iterator[int]:
+        return (self[position] for position in range(self.size))
+
+
+def walk(
+    targets: Sequence[T],
+    *,
+    seed: int | None = None,
+    randomize: bool = False,
+    shard: int = 0,
+    shards: int = 1,
+    start: int = 0,
+) -> Iterator[T]:
+    """Iterate over one shard of `targets`, optionally in pseudo-random order.
+
+    Shard `shard` of `shards` gets every `shards`-th position of the (shuffled) order, so shards are disjoint and
+    together cover every target as long as every scanner uses the same seed.
+
+    Args:
+        targets (Sequence[T]): the targets, only indexed as needed
+        seed (int | None): seed of the pseudo-random order, see `Permutation`
+        randomize (bool): visit the targets in pseudo-random instead of sequential order
+        shard (int): which shard to visit, counting from 0
+        shards (int): number of shards the targets are split into
+        start (int): number of targets of this shard that were already visited, to resume a scan
+
+    Raises:
+        ValueError: if shard isn't in between 0 and shards or start is negative
+
+    Yields:
+        T: the targets of the shard
+    """
+    if shards < 1 or not 0 <= shard < shards:
+        msg = f"shard needs to be in between 0 and {shards - 1}"
+        raise ValueError(msg)
+    if start < 0:
+        msg = "start can't be negative"
+        raise ValueError(msg)
+    positions = range(shard + start * shards, len(targets), shards)
+    if randomize:
+        order = Permutation(len(targets), seed)
+        for position in positions:
+            yield targets[order[position]]
+    elif shards == 1 and start == 0:
+        yield from targets
+    else:
+        for position in positions:
+            yield targets[position]
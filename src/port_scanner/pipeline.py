@@ -0,0 +1,143 @@
+"""Overlap host discovery with port scanning.
+
+Discovery runs on its own thread and hands live hosts to the scan engine through a bounded queue. When the engine
+falls behind, the queue fills up and discovery blocks, so a large network never piles up more than `maxsize` hosts
+that are waiting to be scanned.
+"""
+
+import asyncio
+import queue
+import threading
+from collections.abc import AsyncIterable, AsyncIterator, Iterable, Iterator
+from types import TracebackType
+
+from port_scanner.metrics import queue_depth
+from port_scanner.targets import Ranges
+
+DEFAULT_QUEUE_SIZE = 64  # discovered hosts waiting to be scanned
+POLL_INTERVAL = 0.01  # seconds between checks whether the pipe was closed, and between async polls
+_WAITING = queue_depth("hosts")
+
+
+class HostPipe:
+    """Bounded hand-off of hosts from a discovery thread to a scan engine.
+
+    Use it as a context manager to start and stop the discovery thread, and iterate over it, with a regular or an
+    async for loop, to get the hosts in the order they were discovered.
+    """
+
+    def __init__(self, hosts: Iterable[str], maxsize: int = DEFAULT_QUEUE_SIZE) -> None:
+        """Configure the pipe.
+
+        Args:
+            hosts (Iterable[str]): the discovered hosts, consumed on the discovery thread
+            maxsize (int): how many hosts can wait to be scanned before discovery blocks
+
+        Raises:
+            ValueError: if maxsize isn't positive
+        """
+        if maxsize < 1:
+            msg = "maxsize needs to be at least 1"
+            raise ValueError(msg)
+        self._hosts = hosts
+        # discovered hosts, and a `None` once discovery is done
+        self._queue: queue.Queue[str | None] = queue.Queue(maxsize)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._produce, daemon=True)
+        self._error: BaseException | None = None
+        self.discovered = 0
+
+    def __enter__(self) -> "HostPipe":
+        self._thread.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Stop discovery, even when it is blocked on a full queue."""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _produce(self) -> None:
+        """Discovery thread: queue every host, blocking while the queue is full."""
+        hosts = iter(self._hosts)
+        try:
+            for host in hosts:
+                if not self._put(host):
+                    return
+                self.discovered += 1
+        except Exception as e:
+            self._error = e
+        finally:
+            # let a discovery generator that was cut short close its sockets
+            close = getattr(hosts, "close", None)
+            if close is not None:
+                close()
+            self._put(None)
+
+    def _put(self, host: str | None) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._queue.put(host, timeout=POLL_INTERVAL)
+            except queue.Full:
+                continue
+            _WAITING.set(self._queue.qsize())
+            return True
+        return False
+
+    def _done(self) -> None:
+        # surface errors raised during discovery
+        if self._error is not None:
+            raise self._error
+
+    def __iter__(self) -> Iterator[str]:
+        while (host := self._queue.get()) is not None:
+            yield host
+        self._done()
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        while True:
+            try:
+                host = self._queue.get_nowait()
+            except queue.Empty:
+                # polling keeps the event loop free, unlike a blocking get
+                await asyncio.sleep(POLL_INTERVAL)
+                continue
+            if host is None:
+                break
+            yield host
+        self._done()
+
+
+def _ports(ports: Ranges) -> Iterator[int]:
+    for start, end in ports:
+        yield from range(start, end + 1)
+
+
+def expand(hosts: Iterable[str], ports: Ranges) -> Iterator[tuple[str, int]]:
+    """Pair every host with every port, as hosts come in.
+
+    Args:
+        hosts (Iterable[str]): the hosts to scan
+        ports (Ranges): the ports to scan on every host
+
+    Yields:
+        tuple[str, int]: the (host, port) targets, host by host
+    """
+    for host in hosts:
+        for port in _ports(ports):
+            yield host, port
+
+
+async def aexpand(hosts: AsyncIterable[str], ports: Ranges) -> AsyncIterator[tuple[str, int]]:
+    """Like `expand`, for hosts that come in asynchronously."""
+    async for host in hosts:
+        for port in _ports(ports):
+            yield host, port
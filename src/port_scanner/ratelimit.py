@@ -0,0 +1,156 @@
+"""Token bucket rate limiting shared by every scan engine.
+
+Acquiring never sleeps while holding a lock: the caller reserves its tokens, possibly driving the bucket into debt,
+and is told how long to wait before the reservation is honoured. That makes the same bucket usable from threads and
+from coroutines, and keeps an acquisition down to a few arithmetic operations.
+"""
+
+import asyncio
+import threading
+import time
+
+
+class TokenBucket:
+    """Allow `rate` acquisitions per second on average, and bursts of up to `burst` at once."""
+
+    __slots__ = ("_lock", "_tokens", "_updated", "burst", "rate")
+
+    def __init__(self, rate: float, burst: float | None = None) -> None:
+        """Create a full bucket.
+
+        Args:
+            rate (float): tokens added per second
+            burst (float | None): capacity of the bucket, a hundredth of a second worth of tokens (at least one) if
+          not given
+
+        Raises:
+            ValueError: if rate or burst isn't positive
+        """
+        if rate <= 0:
+            msg = "rate needs to be positive"
+            raise ValueError(msg)
+        if burst is None:
+            burst = max(1.0, rate / 100)
+        if burst <= 0:
+            msg = "burst needs to be positive"
+            raise ValueError(msg)
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: float = 1) -> float:
+        """Take `tokens` out of the bucket.
+
+        Args:
+            tokens (float): how many tokens to take
+
+        Returns:
+            float: seconds to wait before using them, 0 if they are available right away
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate) - tokens
+            self._updated = now
+            return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+    def acquire(self, tokens: float = 1) -> None:
+        """Take `tokens` out of the bucket, sleeping until they are available."""
+        delay = self.reserve(tokens)
+        if delay:
+            time.sleep(delay)
+
+    async def acquire_async(self, tokens: float = 1) -> None:
+        """Take `tokens` out of the bucket, suspending the coroutine until they are available."""
+        delay = self.reserve(tokens)
+        if delay:
+            await asyncio.sleep(delay)
+
+
+class RateLimiter:
+    """A global packets-per-second budget combined with a budget per target host.
+
+    Either budget can be left out. Buckets for hosts are created the first time a host is probed.
+    """
+
+    def __init__(
+        self,
+        rate: float | None = None,
+        host_rate: float | None = None,
+        *,
+        burst: float | None = None,
+        host_burst: float | None = None,
+    ) -> None:
+        """Configure the budgets.
+
+        Args:
+            rate (float | None): probes per second over all hosts, unlimited if not given
+            host_rate (float | None): probes per second to a single host, unlimited if not given
+            burst (float | None): burst size of the global budget, see `TokenBucket`
+            host_burst (float | None): burst size of every host budget, see `TokenBucket`
+        """
+        self.bucket = TokenBucket(rate, burst) if rate is not None else None
+        self.host_rate = host_rate
+        self.host_burst = host_burst
+        if host_rate is not None:
+            # fail early on an invalid host budget instead of on the first probe
+            TokenBucket(host_rate, host_burst)
+        self._hosts: dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def split(self, parts: int) -> "RateLimiter":
+        """A limiter with an equal share of both budgets, for one of `parts` scanners that split a scan.
+
+        Args:
+            parts (int): number of scanners sharing the budgets
+
+        Raises:
+            ValueError: if parts isn't positive
+
+        Returns:
+            RateLimiter: the limiter of a single scanner
+        """
+        if parts < 1:
+            msg = "parts needs to be at least 1"
+            raise ValueError(msg)
+        bucket = self.bucket
+        return RateLimiter(
+            bucket.rate / parts if bucket is not None else None,
+            self.host_rate / parts if self.host_rate is not None else None,
+            burst=max(1.0, bucket.burst / parts) if bucket is not None else None,
+            host_burst=max(1.0, self.host_burst / parts) if self.host_burst is not None else None,
+        )
+
+    def _host_bucket(self, host: str) -> TokenBucket:
+        bucket = self._hosts.get(host)
+        if bucket is None:
+            with self._lock:
+                bucket = self._hosts.setdefault(host, TokenBucket(self.host_rate, self.host_burst))  # type: ignore
+        return bucket
+
+    def reserve(self, host: str) -> float:
+        """Reserve one probe to `host` in every budget.
+
+        Args:
+            host (str): the host that is about to be probed
+
+        Returns:
+            float: seconds to wait before sending the probe
+        """
+        delay = self.bucket.reserve() if self.bucket is not None else 0.0
+        if self.host_rate is not None:
+            delay = max(delay, self._host_bucket(host).reserve())
+        return delay
+
+    def acquire(self, host: str) -> None:
+        """Wait until a probe to `host` fits in every budget."""
+        delay = self.reserve(host)
+        if delay:
+            time.sleep(delay)
+
+    async def acquire_async(self, host: str) -> None:
+        """Like `acquire`, but suspends the coroutine instead of blocking the thread."""
+        delay = self.reserve(host)
+        if delay:
+            await asyncio.sleep(delay)
@@ -0,0 +1,236 @@
+"""Find out which service listens on an open port, over the connection the connect scan made.
+
+A `ServiceDetector` takes over the connection to an open port, see `probe` and `scan_targets`, reads what the service
+says and matches it with `SIGNATURES`. Services like SSH, SMTP and FTP greet first, so the detector waits a moment for
+a banner before it sends anything. Silent services get an HTTP request, and ports that usually speak TLS get a
+ClientHello right away. Reads stop at `read_size` bytes and a deadline, whichever comes first.
+
+Detection runs on a pool of its own threads, so slow services never hold up the scan. When every thread is busy and
+the backlog of waiting connections is full, further connections are closed without detection and counted as skipped.
+"""
+
+import os
+import re
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import TracebackType
+from typing import NamedTuple
+
+from port_scanner.metrics import stage
+from port_scanner.networking import ProbeResult
+
+DEFAULT_CONCURRENCY = 32  # connections read at once
+DEFAULT_BACKLOG = 256  # connections waiting for a thread before they are skipped
+DEFAULT_READ_SIZE = 4096  # bytes read from a service at most
+DEFAULT_TIMEOUT = 3.0  # seconds spent on a service at most
+BANNER_WAIT = 0.5  # seconds to wait for a service to greet before sending a probe
+_DETECT = stage("service")
+
+
+def _client_hello() -> bytes:
+    """A TLS 1.2 ClientHello most servers answer, with a ServerHello or at least an alert."""
+
+    def extension(kind: int, data: bytes) -> bytes:
+        return struct.pack("!HH", kind, len(data)) + data
+
+    def u16s(*values: int) -> bytes:
+        return struct.pack(f"!H{len(values)}H", 2 * len(values), *values)
+
+    ciphers = u16s(0x1301, 0x1302, 0x1303, 0xC02B, 0xC02F, 0xC02C, 0xC030, 0xCCA9, 0xCCA8, 0xC013, 0xC014, 0x009C)
+    extensions = (
+        extension(10, u16s(0x001D, 0x0017, 0x0018))  # supported groups: x25519, secp256r1, secp384r1
+        + extension(11, b"\x01\x00")  # uncompressed ec points
+        + extension(13, u16s(0x0403, 0x0804, 0x0401, 0x0503, 0x0805, 0x0501, 0x0806, 0x0601, 0x0201))  # signatures
+    )
+    # version, random, no session id, cipher suites, no compression, extensions
+    body = b"\x03\x03" + os.urandom(32) + b"\x00" + ciphers + b"\x01\x00" + struct.pack("!H", len(extensions))
+    body += extensions
+    handshake = b"\x01" + len(body).to_bytes(3) + body
+    return b"\x16\x03\x01" + struct.pack("!H", len(handshake)) + handshake
+
+
+# what is sent to a service that doesn't greet
+PROBES = {
+    "http": b"GET / HTTP/1.0\r\n\r\n",
+    "tls": _client_hello(),
+}
+# ports whose services wait for the client, and the probe to send them right away
+PORT_PROBES = dict.fromkeys((80, 8000, 8008, 8080, 8888), "http") | dict.fromkeys(
+    (443, 465, 636, 853, 993, 995, 8443), "tls"
+)
+# service name and the pattern its first bytes match, the version group is optional, the first match wins
+SIGNATURES = tuple(
+    (name, re.compile(pattern, re.DOTALL))
+    for name, pattern in (
+        ("ssh", rb"^SSH-[\d.]+-(?P<version>[^\s]+)"),
+        ("smtp", rb"^220[ -][^\r\n]*?E?SMTP ?(?P<version>[^\r\n]*)"),
+        ("ftp", rb"^220[ -](?P<version>[^\r\n]*FTP[^\r\n]*)"),
+        ("pop3", rb"^\+OK ?(?P<version>[^\r\n]*)"),
+        ("imap", rb"^\* OK ?(?P<version>[^\r\n]*)"),
+        ("http", rb"^HTTP/\d(?:\.\d)? \d{3}(?:.*?\r\n(?i:server): *(?P<version>[^\r\n]*))?"),
+        ("tls", rb"^[\x15\x16]\x03[\x00-\x04]"),
+    )
+)
+
+
+class Service(NamedTuple):
+    """What listens on an open port."""
+
+    host: str
+    port: int
+    name: str | None  # None if no signature matched
+    version: str | None
+    banner: bytes  # what the service sent, up to the read size
+
+
+def match_banner(banner: bytes) -> tuple[str | None, str | None]:
+    """The name and version of the service that sent `banner`, Nones if no signature matches."""
+    for name, pattern in SIGNATURES:
+        if match := pattern.match(banner):
+            version = match.group("version") if "version" in pattern.groupindex else None
+            return name, (version.decode("ascii", "replace").strip() or None) if version else None
+    return None, None
+
+
+def _read(sock: socket.socket, size: int, deadline: float) -> bytes:
+    """Read until `size` bytes, the deadline, the end of the stream or a banner that matches a signature."""
+    data = b""
+    while len(data) < size and (remaining := deadline - time.monotonic()) > 0:
+        sock.settimeout(remaining)
+        try:
+            chunk = sock.recv(size - len(data))
+        except OSError:
+            # timed out or reset
+            break
+        if not chunk:
+            break
+        data += chunk
+        if match_banner(data)[0] is not None:
+            break
+    return data
+
+
+def identify(
+    sock: socket.socket,
+    port: int,
+    *,
+    read_size: int = DEFAULT_READ_SIZE,
+    timeout: float = DEFAULT_TIMEOUT,
+    banner_wait: float = BANNER_WAIT,
+) -> tuple[str | None, str | None, bytes]:
+    """Find out which service `sock` is connected to.
+
+    Args:
+        sock (socket.socket): a connection to the service, blocking or not
+        port (int): the port of the service, to pick a probe
+        read_size (int): bytes to read at most
+        timeout (float): seconds to spend at most
+        banner_wait (float): seconds to wait for a greeting before sending an HTTP request
+
+    Returns:
+        tuple[str | None, str | None, bytes]: the name and version of the service, if known, and what it sent
+    """
+    deadline = time.monotonic() + timeout
+    banner = b""
+    try:
+        probe = PORT_PROBES.get(port)
+        if probe is None:
+            banner = _read(sock, read_size, min(deadline, time.monotonic() + banner_wait))
+            probe = "http" if not banner else None
+        if probe is not None:
+            sock.settimeout(max(0.0, deadline - time.monotonic()))
+            sock.sendall(PROBES[probe])
+            banner = _read(sock, read_size, deadline)
+    except OSError:
+        pass
+    return (*match_banner(banner), banner)
+
+
+class ServiceDetector:
+    """Identify the services behind the connections it is handed, on a pool of threads.
+
+    Pass it as `on_open` to `probe` or `scan_targets`. Use it as a context manager, or `close` it, to wait for the
+    connections that are still being read.
+    """
+
+    def __init__(
+        self,
+        *,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        backlog: int = DEFAULT_BACKLOG,
+        read_size: int = DEFAULT_READ_SIZE,
+        timeout: float = DEFAULT_TIMEOUT,
+        banner_wait: float = BANNER_WAIT,
+    ) -> None:
+        """Start the pool.
+
+        Args:
+            concurrency (int): connections read at once
+            backlog (int): connections that wait for a thread, further connections are skipped
+            read_size (int): bytes to read from a service at most
+            timeout (float): seconds to spend on a service at most
+            banner_wait (float): seconds to wait for a greeting before sending a probe
+
+        Raises:
+            ValueError: if concurrency or read_size isn't positive, or backlog is negative
+        """
+        if concurrency < 1:
+            msg = "concurrency needs to be at least 1"
+            raise ValueError(msg)
+        if backlog < 0:
+            msg = "backlog can't be negative"
+            raise ValueError(msg)
+        if read_size < 1:
+            msg = "read_size needs to be at least 1"
+            raise ValueError(msg)
+        self.read_size = read_size
+        self.timeout = timeout
+        self.banner_wait = banner_wait
+        self.services: list[Service] = []
+        self.skipped = 0
+        self._limit = concurrency + backlog
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="service")
+
+    def __call__(self, result: ProbeResult, sock: socket.socket) -> None:
+        """Take over the connection to the open port of `result`, without waiting."""
+        with self._lock:
+            if self._in_flight >= self._limit:
+                self.skipped += 1
+                sock.close()
+                return
+            self._in_flight += 1
+        self._pool.submit(self._detect, result, sock)
+
+    def _detect(self, result: ProbeResult, sock: socket.socket) -> None:
+        start = time.perf_counter()
+        try:
+            name, version, banner = identify(
+                sock, result.port, read_size=self.read_size, timeout=self.timeout, banner_wait=self.banner_wait
+            )
+        finally:
+            sock.close()
+            with self._lock:
+                self._in_flight -= 1
+        with self._lock:
+            self.services.append(Service(result.host, result.port, name, version, banner))
+        _DETECT.observe(time.perf_counter() - start)
+
+    def close(self) -> None:
+        """Wait for the connections that are being read."""
+        self._pool.shutdown()
+
+    def __enter__(self) -> "ServiceDetector":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.close()
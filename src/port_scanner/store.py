@@ -0,0 +1,251 @@
+"""Compact, memory-mappable storage of the results of huge sweeps.
+
+Every host gets a row of 2 bits for each of the 65536 ports, 16 KiB, holding the `PortState` of the port or 0 if it
+wasn't probed. A /16 swept on every port takes 1 GiB, mapped from a file instead of loaded, so opening a store is
+instant and only the rows that are touched are read. Latencies are optional: a float32 for every port of every host.
+
+Queries work on whole rows and columns with byte-level operations instead of looping over ports in Python.
+"""
+
+import array
+import json
+import mmap
+import re
+import struct
+from collections.abc import Iterator
+from pathlib import Path
+from types import TracebackType
+
+from port_scanner.networking import MAX_PORT, PortState, ProbeResult
+from port_scanner.targets import Ranges, TargetSpec, cached_host_index
+
+MAGIC = b"PSRS"
+VERSION = 1
+# magic, version, whether latencies are stored, length of the json host ranges that follow
+HEADER = struct.Struct("!4sBB2xI")
+PORTS = MAX_PORT + 1
+ROW_SIZE = PORTS // 4  # bytes of states of a host
+LATENCY = struct.Struct("=f")
+CHUNK_ROWS = 4  # rows counted at once by `counts`, small enough to stay in the cpu cache
+
+# for every byte of a row: a mask of its 4 ports that are in a state
+_MASKS = {
+    state: bytes(
+        sum(1 << (shift // 2) for shift in (0, 2, 4, 6) if (byte >> shift) & 3 == state) for byte in range(256)
+    )
+    for state in PortState
+}
+_NONZERO = re.compile(b"[^\x00]")
+
+
+class ResultStore:
+    """Port states, and optionally latencies, of every port of a set of hosts.
+
+    Create a store with `create`, in a file or in anonymous memory, and reopen a file with `open`.
+    """
+
+    def __init__(
+        self, hosts: Ranges, mapped: mmap.mmap, offset: int, *, latency: bool, path: Path | None, writable: bool = True
+    ) -> None:
+        """Use the rows at `offset` of `mapped`, see `create` and `open`."""
+        self.path = path
+        self.writable = writable
+        self.has_latency = latency
+        self._targets = TargetSpec(hosts, [(0, MAX_PORT)])
+        self._host_index = cached_host_index(self._targets)
+        self._mapped = mapped
+        self._offset = offset
+        self._latency_offset = offset + self.host_count * ROW_SIZE
+
+    @staticmethod
+    def _size(hosts: Ranges, *, latency: bool) -> int:
+        count = TargetSpec(hosts, [(0, 0)]).host_count
+        return count * ROW_SIZE + (count * PORTS * LATENCY.size if latency else 0)
+
+    @classmethod
+    def create(cls, hosts: Ranges, path: str | Path | None = None, *, latency: bool = False) -> "ResultStore":
+        """Create an empty store.
+
+        Args:
+            hosts (Ranges): address ranges of the hosts the store has room for, as returned by `parse_hosts`
+            path (str | Path | None): the file to keep the store in, replaced if it exists, in memory if not given
+            latency (bool): store the latency of every result as well
+
+        Returns:
+            ResultStore: the store, without results
+        """
+        meta = json.dumps(hosts, separators=(",", ":")).encode()
+        offset = HEADER.size + len(meta)
+        size = offset + cls._size(hosts, latency=latency)
+        if path is None:
+            mapped = mmap.mmap(-1, size)
+        else:
+            path = Path(path)
+            with open(path, "wb+") as file:
+                file.truncate(size)  # sparse, rows that stay empty don't take up disk space
+                mapped = mmap.mmap(file.fileno(), size)
+        mapped[:offset] = HEADER.pack(MAGIC, VERSION, latency, len(meta)) + meta
+        return cls(hosts, mapped, offset, latency=latency, path=path)
+
+    @classmethod
+    def open(cls, path: str | Path, *, writable: bool = False) -> "ResultStore":
+        """Map a store file.
+
+        Args:
+            path (str | Path): the file the store was created in
+            writable (bool): map it for adding results, read only if not
+
+        Raises:
+            ValueError: if path isn't a store of a known version, or it was cut short
+
+        Returns:
+            ResultStore: the store
+        """
+        path = Path(path)
+        with open(path, "r+b" if writable else "rb") as file:
+            header = file.read(HEADER.size)
+            if len(header) < HEADER.size:
+                msg = f"{path} is not a result store"
+                raise ValueError(msg)
+            magic, version, latency, meta_size = HEADER.unpack(header)
+            if magic != MAGIC or version != VERSION:
+                msg = f"{path} is not a result store, or one of an unknown version"
+                raise ValueError(msg)
+            hosts = [(first, last) for first, last in json.loads(file.read(meta_size))]
+            offset = HEADER.size + meta_size
+            if path.stat().st_size < offset + cls._size(hosts, latency=bool(latency)):
+                msg = f"result store {path} is truncated"
+                raise ValueError(msg)
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+        return cls(hosts, mapped, offset, latency=bool(latency), path=path, writable=writable)
+
+    @property
+    def host_ranges(self) -> Ranges:
+        return self._targets.host_ranges
+
+    @property
+    def host_count(self) -> int:
+        return self._targets.host_count
+
+    def hosts(self) -> Iterator[str]:
+        """Iterate over the hosts the store has room for, in address order."""
+        return self._targets.hosts()
+
+    def __contains__(self, host: object) -> bool:
+        """Whether the store has room for `host`."""
+        try:
+            self._host_index(host)
+        except (ValueError, TypeError):
+            return False
+        return True
+
+    def _row(self, host: str) -> int:
+        return self._offset + self._host_index(host) * ROW_SIZE
+
+    def add(self, result: ProbeResult) -> None:
+        """Store the state, and the latency if the store keeps those, of a probed port.
+
+        Raises:
+            ValueError: if the host of result isn't one of the hosts of the store
+        """
+        host, port, state, latency = result
+        index = self._host_index(host)
+        position = self._offset + index * ROW_SIZE + (port >> 2)
+        shift = (port & 3) * 2
+        mapped = self._mapped
+        mapped[position] = (mapped[position] & ~(3 << shift)) | (state << shift)
+        if self.has_latency:
+            LATENCY.pack_into(mapped, self._latency_offset + (index * PORTS + port) * LATENCY.size, latency)
+
+    def state(self, host: str, port: int) -> PortState | None:
+        """The state of `port` on `host`, None if it wasn't probed."""
+        state = (self._mapped[self._row(host) + (port >> 2)] >> ((port & 3) * 2)) & 3
+        return PortState(state) if state else None
+
+    def latency(self, host: str, port: int) -> float | None:
+        """The latency of the probe of `port` on `host`, None if it wasn't probed or latencies aren't stored."""
+        if not self.has_latency or self.state(host, port) is None:
+            return None
+        index = self._host_index(host)
+        return LATENCY.unpack_from(self._mapped, self._latency_offset + (index * PORTS + port) * LATENCY.size)[0]
+
+    def latencies(self, host: str) -> array.array:
+        """The latencies of every port of `host`, indexed by port, 0 where it wasn't probed.
+
+        Raises:
+            ValueError: if the store doesn't keep latencies
+        """
+        if not self.has_latency:
+            msg = "the store doesn't keep latencies"
+            raise ValueError(msg)
+        start = self._latency_offset + self._host_index(host) * PORTS * LATENCY.size
+        return array.array("f", self._mapped[start : start + PORTS * LATENCY.size])
+
+    def ports(self, host: str, state: PortState = PortState.OPEN) -> list[int]:
+        """The ports of `host` in `state`, in ascending order."""
+        start = self._row(host)
+        masks = self._mapped[start : start + ROW_SIZE].translate(_MASKS[state])
+        return [
+            (match.start() << 2) + bit
+            for match in _NONZERO.finditer(masks)
+            for bit in range(4)
+            if masks[match.start()] & (1 << bit)
+        ]
+
+    def hosts_with(self, port: int, state: PortState = PortState.OPEN) -> list[str]:
+        """The hosts that have `port` in `state`, in address order."""
+        start = self._offset + (port >> 2)
+        column = self._mapped[start : self._latency_offset : ROW_SIZE].translate(_MASKS[state])
+        bit = 1 << (port & 3)
+        targets = self._targets
+        # the first host_count targets are every host on port 0
+        return [targets[index][0] for index, mask in enumerate(column) if mask & bit]
+
+    def counts(self) -> dict[PortState, int]:
+        """The number of ports in every state, over all hosts."""
+        counts = dict.fromkeys(PortState, 0)
+        chunk_size = CHUNK_ROWS * ROW_SIZE
+        low_bits = int.from_bytes(b"\x55" * chunk_size)
+        for start in range(self._offset, self._latency_offset, chunk_size):
+            chunk = self._mapped[start : min(start + chunk_size, self._latency_offset)]
+            if not chunk.strip(b"\x00"):
+                continue
+            # big integer operations count all the 2 bit states of a chunk at once
+            states = int.from_bytes(chunk)
+            low, high = states & low_bits, (states >> 1) & low_bits
+            filtered = (low & high).bit_count()
+            counts[PortState.OPEN] += low.bit_count() - filtered
+            counts[PortState.CLOSED] += high.bit_count() - filtered
+            counts[PortState.FILTERED] += filtered
+        return counts
+
+    def summary(self) -> str:
+        """The counts on a single line."""
+        counts = self.counts()
+        probed = sum(counts.values())
+        return (
+            f"{self.host_count} hosts, {probed} ports probed - open {counts[PortState.OPEN]}, "
+            f"closed {counts[PortState.CLOSED]}, filtered {counts[PortState.FILTERED]}"
+        )
+
+    def flush(self) -> None:
+        """Write the changes back to the file."""
+        if self.path is not None and self.writable:
+            self._mapped.flush()
+
+    def close(self) -> None:
+        """Write the changes back to the file and unmap it."""
+        if not self._mapped.closed:
+            self.flush()
+            self._mapped.close()
+
+    def __enter__(self) -> "ResultStore":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.close()
@@ -0,0 +1,324 @@
+"""Stateless raw-socket SYN scanner.
+
+A sender thread streams SYN segments built from a per-destination template, patching only the destination port,
+sequence number and checksum for each probe. The sequence number is a keyed hash of the destination, so a receiver
+thread can match SYN-ACK and RST replies to probes from the acknowledgement number alone.
+"""
+
+import hashlib
+import os
+import random
+import socket
+import struct
+import sys
+from collections.abc import Iterable, Iterator
+
+from port_scanner.batch import DEFAULT_RETRIES, DEFAULT_TIMEOUT, BatchProber
+from port_scanner.networking import PortState, ProbeResult
+from port_scanner.packetio import (
+    ACCEPT,
+    BPF_ABS,
+    BPF_B,
+    BPF_H,
+    BPF_IND,
+    BPF_JEQ,
+    BPF_JMP,
+    BPF_JSET,
+    BPF_K,
+    BPF_LD,
+    BPF_LDX,
+    BPF_MSH,
+    BPF_RET,
+    Instruction,
+    Packet,
+    PacketIO,
+    RawIO,
+    ScapyIO,
+    attach_filter,
+)
+from port_scanner.ratelimit import RateLimiter
+from port_scanner.timing import HostTimings
+
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_ACK = 0x10
+
+TCP_HEADER = struct.Struct("!HHIIBBHHH")  # sport, dport, seq, ack, data offset, flags, window, checksum, urgent
+TCP_HEADER_LEN = TCP_HEADER.size
+WINDOW_SIZE = 1024
+
+DEFAULT_RATE = 10_000  # probes per second
+
+
+def _fold(total: int) -> int:
+    """Fold a sum of 16 bit words into a ones' complement 16 bit sum."""
+    while total >> 16:
+        total = (total & 0xFFFF) + (total >> 16)
+    return total
+
+
+def _sum16(data: bytes) -> int:
+    """Sum `data` as big endian 16 bit words, padding odd lengths with a zero byte."""
+    if len(data) % 2:
+        data += b"\x00"
+    return sum(struct.unpack(f"!{len(data) // 2}H", data))
+
+
+def checksum(data: bytes) -> int:
+    """Compute the internet checksum of `data`.
+
+    Args:
+        data (bytes): the bytes to checksum
+
+    Returns:
+        int: the ones' complement of the ones' complement sum of `data`
+    """
+    return ~_fold(_sum16(data)) & 0xFFFF
+
+
+def source_address(host: str) -> str:
+    """Find the local address the kernel would use to reach `host`.
+
+    Args:
+        host (str): ip address of the destination
+
+    Returns:
+        str: the local ip address
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        # connecting a udp socket sends nothing, it only picks a route
+        s.connect((host, 9))
+        return s.getsockname()[0]
+
+
+class SynTemplate:
+    """A SYN (or other flag) segment to one destination with only dport, seq, ack and checksum left to fill in."""
+
+    def __init__(self, source: str, destination: str, source_port: int, flags: int = TCP_SYN) -> None:
+        """Build the template.
+
+        Args:
+            source (str): ip address the segment is sent from
+            destination (str): ip address the segment is sent to
+            source_port (int): tcp port the segment is sent from
+            flags (int): tcp flags of the segment
+        """
+        self.buffer = bytearray(TCP_HEADER.pack(source_port, 0, 0, 0, 5 << 4, flags, WINDOW_SIZE, 0, 0))
+        pseudo_header = socket.inet_aton(source) + socket.inet_aton(destination) + struct.pack("!BBH", 0, 6, 20)
+        # the checksum of everything but the dport, seq and ack fields never changes
+        self._partial_sum = _sum16(pseudo_header + bytes(self.buffer))
+
+    def patch(self, port: int, seq: int, ack: int = 0) -> bytearray:
+        """Fill in the destination port, sequence and acknowledgement numbers and fix up the checksum in place.
+
+        Args:
+            port (int): destination port
+            seq (int): sequence number
+            ack (int): acknowledgement number
+
+        Returns:
+            bytearray: the template buffer, ready to send
+        """
+        buffer = self.buffer
+        struct.pack_into("!HII", buffer, 2, port, seq, ack)
+        total = _fold(self._partial_sum + port + (seq >> 16) + (seq & 0xFFFF) + (ack >> 16) + (ack & 0xFFFF))
+        struct.pack_into("!H", buffer, 16, ~total & 0xFFFF)
+        return buffer
+
+
+def reply_filter(source_port: int) -> list[Instruction]:
+    """A classic BPF program that only admits replies to probes sent from `source_port`.
+
+    It runs on the ipv4 packets of a raw tcp socket and keeps unfragmented segments to `source_port` that carry a RST
+    or an ACK, which every answer to a SYN or ACK probe does.
+
+    Args:
+        source_port (int): the tcp port the probes are sent from
+
+    Returns:
+        list[Instruction]: the program, see `packetio.attach_filter`
+    """
+    return [
+        (BPF_LD | BPF_H | BPF_ABS, 0, 0, 6),  # flags and fragment offset
+        (BPF_JMP | BPF_JSET | BPF_K, 6, 0, 0x1FFF),  # later fragments have no tcp header
+        (BPF_LDX | BPF_B | BPF_MSH, 0, 0, 0),  # length of the ip header
+        (BPF_LD | BPF_H | BPF_IND, 0, 0, 2),  # destination port
+        (BPF_JMP | BPF_JEQ | BPF_K, 0, 3, source_port),
+        (BPF_LD | BPF_B | BPF_IND, 0, 0, 13),  # tcp flags
+        (BPF_JMP | BPF_JSET | BPF_K, 0, 1, TCP_RST | TCP_ACK),
+        (BPF_RET | BPF_K, 0, 0, ACCEPT),
+        (BPF_RET | BPF_K, 0, 0, 0),
+    ]
+
+
+def parse_reply(packet: Packet) -> tuple[str, int, int, int, int, int] | None:
+    """Extract the fields needed to match a reply from a raw ipv4 packet, without copying it.
+
+    Args:
+        packet (Packet): an ipv4 packet as read from a raw socket, or a view of one
+
+    Returns:
+        tuple[str, int, int, int, int, int] | None: source address, source port, destination port, sequence number,
+      acknowledgement number and tcp flags, or None if it isn't a tcp packet
+    """
+    if len(packet) < 20 or packet[0] >> 4 != 4 or packet[9] != socket.IPPROTO_TCP:  # noqa: PLR2004
+        return None
+    offset = (packet[0] & 0x0F) * 4
+    if len(packet) < offset + TCP_HEADER_LEN:
+        return None
+    sport, dport, seq, ack, _, flags, _, _, _ = TCP_HEADER.unpack_from(packet, offset)
+    return socket.inet_ntoa(packet[12:16]), sport, dport, seq, ack, flags
+
+
+class SynScanner(BatchProber[tuple[str, int], ProbeResult]):
+    """Send SYN probes at a limited rate and collect the replies asynchronously.
+
+    With `flags=TCP_ACK` it sends ACK probes instead: any RST that comes back shows the port is reachable, which is
+    reported as closed. That is mostly useful to find hosts behind stateless firewalls.
+    """
+
+    def __init__(
+        self,
+        *,
+        rate: float = DEFAULT_RATE,
+        retries: int = DEFAULT_RETRIES,
+        timeout: float = DEFAULT_TIMEOUT,
+        source_port: int | None = None,
+        flags: int = TCP_SYN,
+        timings: HostTimings | None = None,
+        limiter: RateLimiter | None = None,
+        send_socket: socket.socket | None = None,
+        recv_socket: socket.socket | None = None,
+        io: PacketIO | None = None,
+    ) -> None:
+        """Configure the scanner.
+
+        Args:
+            rate (float): maximum number of packets sent per second, retransmissions included, unless `limiter` is
+          given
+            retries (int): how often an unanswered probe is retransmitted before the port is reported filtered
+            timeout (float): seconds to wait for a reply before retransmitting, unless `timings` is given
+            source_port (int | None): tcp port to send from, random if not given
+            flags (int): flags of the probes, TCP_SYN or TCP_ACK
+            timings (HostTimings | None): derive timeouts from the round trip times of every host, and update them
+            limiter (RateLimiter | None): global and per host packet budgets, shared with other scanners
+            send_socket (socket.socket | None): socket the SYNs are written to, a raw tcp socket if not given
+            recv_socket (socket.socket | None): socket replies are read from, a raw tcp socket if not given
+            io (PacketIO | None): backend to send and receive on instead of the sockets
+
+        Raises:
+            ValueError: if rate isn't positive or retries is negative
+        """
+        if rate <= 0:
+            msg = "rate needs to be positive"
+            raise ValueError(msg)
+        super().__init__(
+            retries=retries,
+            timeout=timeout,
+            timings=timings,
+            limiter=limiter if limiter is not None else RateLimiter(rate),
+            send_socket=send_socket,
+            recv_socket=recv_socket,
+            io=io,
+        )
+        self.flags = flags
+        self.source_port = source_port or random.randint(32768, 60999)  # noqa: S311
+        self._key = os.urandom(16)
+        self._templates: dict[str, SynTemplate] = {}
+
+    def cookie(self, host: str, port: int) -> int:
+        """Sequence number used for probing `port` on `host`.
+
+        Args:
+            host (str): ip address of the destination
+            port (int): destination port
+
+        Returns:
+            int: a 32 bit sequence number only this scanner can predict
+        """
+        digest = hashlib.blake2b(socket.inet_aton(host) + port.to_bytes(2), key=self._key, digest_size=4).digest()
+        return int.from_bytes(digest)
+
+    def scan(self, host: str, ports: Iterable[int]) -> Iterator[ProbeResult]:
+        """SYN scan `ports` on `host`.
+
+        Results are yielded as replies arrive, so they are not in port order.
+
+        Args:
+            host (str): ip address of the host to scan
+            ports (Iterable[int]): the ports to scan
+
+        Yields:
+            ProbeResult: the result of every probe
+        """
+        return self.scan_targets((host, port) for port in ports)
+
+    def scan_targets(self, targets: Iterable[tuple[str, int]]) -> Iterator[ProbeResult]:
+        """SYN scan (host, port) `targets`.
+
+        Targets are consumed lazily by the sender thread and results are yielded as replies arrive.
+
+        Args:
+            targets (Iterable[tuple[str, int]]): the hosts and ports to scan
+
+        Yields:
+            ProbeResult: the result of every probe, with the round trip time of the answered transmission as latency
+        """
+        return self.run(targets)
+
+    def _open_io(self) -> PacketIO:
+        send_socket = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_TCP)
+        if sys.platform.startswith("linux"):
+            recv_socket = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_TCP)
+            # a raw tcp socket sees every segment the machine receives
+            attach_filter(recv_socket, reply_filter(self.source_port))
+            return RawIO(send_socket, recv_socket)
+        # raw sockets of the BSDs never receive tcp segments, the replies are captured instead
+        return ScapyIO(capture_filter=f"tcp dst port {self.source_port}", link_layer=False, send_socket=send_socket)
+
+    def _host(self, key: tuple[str, int]) -> str:
+        return key[0]
+
+    def _transmit(self, key: tuple[str, int]) -> None:
+        host, port = key
+        template = self._templates.get(host)
+        if template is None:
+            template = self._templates[host] = SynTemplate(source_address(host), host, self.source_port, self.flags)
+        cookie = self.cookie(host, port)
+        # an ACK probe is answered with a RST carrying our acknowledgement number as its sequence number
+        segment = template.patch(port, cookie, cookie if self.flags & TCP_ACK else 0)
+        self._io.send(segment, (host, 0))
+
+    def _expired(self, key: tuple[str, int], waited: float) -> ProbeResult:
+        # no answer at all, the port is filtered
+        return ProbeResult(*key, PortState.FILTERED, waited)
+
+    def handle_reply(self, packet: Packet, source: str | None = None) -> None:  # noqa: ARG002
+        """Report the port `packet` answers for, if it is a reply to one of our probes.
+
+        Args:
+            packet (Packet): an ipv4 packet as read from a raw socket
+            source (str | None): unused, the source address is read from the packet
+        """
+        reply = parse_reply(packet)
+        if reply is None:
+            return
+        host, port, dport, seq, ack, flags = reply
+        if dport != self.source_port:
+            return
+        cookie = self.cookie(host, port)
+        if flags & TCP_ACK and ack == (cookie + 1) & 0xFFFFFFFF:
+            # the answer to a SYN
+            if flags & TCP_RST:
+                state = PortState.CLOSED
+            elif flags & TCP_SYN:
+                state = PortState.OPEN
+            else:
+                return
+        elif flags & TCP_RST and self.flags & TCP_ACK and seq == cookie:
+            # the answer to an ACK
+            state = PortState.CLOSED
+        else:
+            return
+        self._answered((host, port), lambda rtt: ProbeResult(host, port, state, rtt))
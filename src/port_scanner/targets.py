@@ -0,0 +1,307 @@
+"""Parsing and lazy expansion of host and port specifications.
+
+Hosts and ports are kept as sorted lists of inclusive ``(first, last)`` ranges, so a /16 times every port costs a
+handful of integers no matter how many (host, port) pairs it describes.
+"""
+
+import bisect
+import functools
+import ipaddress
+import itertools
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from pathlib import Path
+
+from port_scanner.networking import MAX_PORT, MIN_PORT
+
+Ranges = list[tuple[int, int]]
+
+MAX_ADDRESS = 2**32 - 1
+HOST_CACHE_SIZE = 65536  # hosts whose index `cached_host_index` remembers
+
+# nmap's fast scan (-F) list, most frequently open ports on the internet
+TOP_100_PORTS = (
+    7, 9, 13, 21, 22, 23, 25, 26, 37, 53, 79, 80, 81, 88, 106, 110, 111, 113, 119, 135, 139, 143, 144, 179, 199,
+    389, 427, 443, 444, 445, 465, 513, 514, 515, 543, 544, 548, 554, 587, 631, 646, 873, 990, 993, 995, 1025, 1026,
+    1027, 1028, 1029, 1110, 1433, 1720, 1723, 1755, 1900, 2000, 2001, 2049, 2121, 2717, 3000, 3128, 3306, 3389, 3986,
+    4899, 5000, 5009, 5051, 5060, 5101, 5190, 5357, 5432, 5631, 5666, 5800, 5900, 6000, 6001, 6646, 7070, 8000, 8008,
+    8009, 8080, 8081, 8443, 8888, 9100, 9999, 10000, 32768, 49152, 49153, 49154, 49155, 49156, 49157,
+)  # fmt: skip
+
+
+def _top_ports(count: int) -> tuple[int, ...]:
+    """The top 100 ports padded with the lowest remaining ports up to `count` ports."""
+    top = set(TOP_100_PORTS)
+    padding = (port for port in range(MIN_PORT, MAX_PORT + 1) if port not in top)
+    return TOP_100_PORTS + tuple(itertools.islice(padding, count - len(TOP_100_PORTS)))
+
+
+# names that can be used in place of ports in a port specification
+NAMED_PORTS: dict[str, tuple[int, ...] | range] = {
+    "all": range(MIN_PORT, MAX_PORT + 1),
+    "well-known": range(MIN_PORT, 1024),
+    "top-100": TOP_100_PORTS,
+    # an approximation of nmap's top 1000, which isn't shipped with the scanner
+    "top-1000": _top_ports(1000),
+}
+
+
+def _merge(ranges: Iterable[tuple[int, int]]) -> Ranges:
+    """Sort `ranges` and merge the ones that overlap or touch."""
+    merged: Ranges = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(last, merged[-1][1]))
+        else:
+            merged.append((first, last))
+    return merged
+
+
+def _ranges_of(values: Iterable[int]) -> Ranges:
+    return _merge((value, value) for value in values)
+
+
+def _parse_address(address: str) -> int:
+    try:
+        return int(ipaddress.IPv4Address(address))
+    except ipaddress.AddressValueError:
+        msg = f"{address!r} is not a valid ipv4 address"
+        raise ValueError(msg) from None
+
+
+def _parse_host(host: str) -> tuple[int, int]:
+    """Parse a single address, a network (ip/mask) or an address range (first-last or a.b.c.d-e)."""
+    if "/" in host:
+        try:
+            network = ipaddress.IPv4Network(host, strict=False)
+        except (ipaddress.AddressValueError, ipaddress.NetmaskValueError):
+            msg = f"{host!r} is not a valid ip network"
+            raise ValueError(msg) from None
+        return int(network.network_address), int(network.broadcast_address)
+    if "-" in host:
+        first, last = host.split("-", 1)
+        if "." not in last:
+            # short form, only the last octet is given: 10.0.0.1-20
+            last = f"{first.rsplit('.', 1)[0]}.{last}"
+        start, end = _parse_address(first), _parse_address(last)
+        if start > end:
+            msg = f"{host!r} is an empty address range"
+            raise ValueError(msg)
+        return start, end
+    address = _parse_address(host)
+    return address, address
+
+
+def parse_hosts(spec: str) -> Ranges:
+    """Parse a comma separated host specification.
+
+    Every item can be an ip address (10.0.0.1), a network (10.0.0.0/24) or an address range (10.0.0.1-10.0.0.20 or
+    10.0.0.1-20).
+
+    Args:
+        spec (str): the host specification
+
+    Raises:
+        ValueError: if any of the items isn't valid
+
+    Returns:
+        Ranges: sorted, merged ranges of addresses as integers
+    """
+    items = [item.strip() for item in spec.split(",") if item.strip()]
+    if not items:
+        msg = "no hosts given"
+        raise ValueError(msg)
+    return _merge(_parse_host(item) for item in items)
+
+
+def read_hosts_file(path: str | Path) -> Ranges:
+    """Read host specifications from a file, one or more per line.
+
+    Blank lines and everything after a ``#`` are ignored.
+
+    Args:
+        path (str | Path): the file to read
+
+    Raises:
+        ValueError: if the file contains an invalid host or no hosts at all
+
+    Returns:
+        Ranges: sorted, merged ranges of addresses as integers
+    """
+    ranges: Ranges = []
+    with open(path) as file:
+        for line in file:
+            line = line.split("#", 1)[0].strip()  # noqa: PLW2901
+            if line:
+                ranges.extend(parse_hosts(line))
+    if not ranges:
+        msg = f"no hosts in {path}"
+        raise ValueError(msg)
+    return _merge(ranges)
+
+
+def _parse_port(port: str) -> int:
+    try:
+        value = int(port)
+    except ValueError:
+        msg = f"{port!r} is not a port number"
+        raise ValueError(msg) from None
+    if value < MIN_PORT or value > MAX_PORT:
+        msg = f"port needs to be in between {MIN_PORT} and {MAX_PORT}, got {value}"
+        raise ValueError(msg)
+    return value
+
+
+def parse_ports(spec: str) -> Ranges:
+    """Parse a comma separated port specification.
+
+    Every item can be a port (80), a port range (1000-2000) or one of the names in `NAMED_PORTS` (top-1000).
+
+    Args:
+        spec (str): the port specification
+
+    Raises:
+        ValueError: if any of the items isn't valid
+
+    Returns:
+        Ranges: sorted, merged port ranges
+    """
+    ranges: Ranges = []
+    for item in (item.strip().lower() for item in spec.split(",")):
+        if not item:
+            continue
+        if item in NAMED_PORTS:
+            named = NAMED_PORTS[item]
+            if isinstance(named, range):
+                ranges.append((named.start, named.stop - 1))
+            else:
+                ranges.extend(_ranges_of(named))
+        elif "-" in item:
+            first, last = (_parse_port(port) for port in item.split("-", 1))
+            if first > last:
+                msg = f"{item!r} is an empty port range"
+                raise ValueError(msg)
+            ranges.append((first, last))
+        else:
+            port = _parse_port(item)
+            ranges.append((port, port))
+    if not ranges:
+        msg = "no ports given"
+        raise ValueError(msg)
+    return _merge(ranges)
+
+
+class _RangeList:
+    """Indexable view over sorted ranges without expanding them."""
+
+    def __init__(self, ranges: Ranges) -> None:
+        self.ranges = ranges
+        # offsets[i] is the index of the first value of ranges[i]
+        self.offsets = list(itertools.accumulate((last - first + 1 for first, last in ranges), initial=0))
+
+    def __len__(self) -> int:
+        return self.offsets[-1]
+
+    def __getitem__(self, index: int) -> int:
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        position = bisect.bisect_right(self.offsets, index) - 1
+        return self.ranges[position][0] + index - self.offsets[position]
+
+    def __iter__(self) -> Iterator[int]:
+        for first, last in self.ranges:
+            yield from range(first, last + 1)
+
+    def index(self, value: int) -> int:
+        """The index of `value`, a ValueError if it isn't in any of the ranges."""
+        position = bisect.bisect_right(self.ranges, (value, MAX_ADDRESS)) - 1
+        if position < 0 or value > self.ranges[position][1]:
+            msg = f"{value} is not in the ranges"
+            raise ValueError(msg)
+        return self.offsets[position] + value - self.ranges[position][0]
+
+
+class TargetSpec(Sequence[tuple[str, int]]):
+    """Every (host, port) pair of a set of hosts and a set of ports, expanded lazily.
+
+    Pairs are ordered port-major: every host is probed on a port before any host is probed on the next one, so
+    consecutive probes are spread over all hosts instead of hammering one of them.
+    """
+
+    def __init__(self, hosts: Ranges, ports: Ranges) -> None:
+        """Combine parsed hosts and ports.
+
+        Args:
+            hosts (Ranges): address ranges, as returned by `parse_hosts`
+            ports (Ranges): port ranges, as returned by `parse_ports`
+        """
+        self._hosts = _RangeList(hosts)
+        self._ports = _RangeList(ports)
+
+    @classmethod
+    def parse(cls, hosts: str, ports: str) -> "TargetSpec":
+        """Build a target specification from host and port specification strings.
+
+        Args:
+            hosts (str): host specification, see `parse_hosts`
+            ports (str): port specification, see `parse_ports`
+
+        Returns:
+            TargetSpec: the targets
+        """
+        return cls(parse_hosts(hosts), parse_ports(ports))
+
+    @property
+    def host_ranges(self) -> Ranges:
+        return self._hosts.ranges
+
+    @property
+    def port_ranges(self) -> Ranges:
+        return self._ports.ranges
+
+    @property
+    def host_count(self) -> int:
+        return len(self._hosts)
+
+    @property
+    def port_count(self) -> int:
+        return len(self._ports)
+
+    def hosts(self) -> Iterator[str]:
+        """Iterate over the hosts in address order."""
+        return (str(ipaddress.IPv4Address(address)) for address in self._hosts)
+
+    def ports(self) -> Iterator[int]:
+        """Iterate over the ports in ascending order."""
+        return iter(self._ports)
+
+    def host_index(self, host: str) -> int:
+        """The index of `host` among the hosts, a ValueError if it isn't one of them."""
+        return self._hosts.index(_parse_address(host))
+
+    def port_index(self, port: int) -> int:
+        """The index of `port` among the ports, a ValueError if it isn't one of them."""
+        return self._ports.index(port)
+
+    def __len__(self) -> int:
+        return len(self._hosts) * len(self._ports)
+
+    def __getitem__(self, index: int) -> tuple[str, int]:  # type: ignore[override]
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        port_index, host_index = divmod(index, len(self._hosts))
+        return str(ipaddress.IPv4Address(self._hosts[host_index])), self._ports[port_index]
+
+    def __iter__(self) -> Iterator[tuple[str, int]]:
+        hosts = list(self.hosts()) if len(self._hosts) <= 65536 else None  # noqa: PLR2004
+        for port in self._ports:
+            for host in hosts if hosts is not None else self.hosts():
+                yield host, port
+
+
+def cached_host_index(targets: TargetSpec) -> Callable[[str], int]:
+    """`targets.host_index`, remembering the index of recent hosts.
+
+    Parsing an address costs more than the rest of marking a target in a bitmap, and results come in for the same
+    few hosts over and over.
+    """
+    return functools.lru_cache(maxsize=HOST_CACHE_SIZE)(targets.host_index)
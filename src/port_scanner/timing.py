@@ -0,0 +1,98 @@
+"""Per-host round trip time estimation and adaptive probe timeouts.
+
+Estimates follow TCP's retransmission timer (RFC 6298): a smoothed round trip time and its variation are updated
+from every answered probe, and a probe's timeout is the smoothed value plus four times the variation.
+"""
+
+import threading
+
+ALPHA = 1 / 8  # weight of a new sample in the smoothed rtt
+BETA = 1 / 4  # weight of a new sample in the rtt variation
+K = 4  # how many variations above the smoothed rtt the timeout is
+
+INITIAL_TIMEOUT = 0.1  # seconds, used until a host has answered once, silent hosts are probed with it throughout
+MIN_TIMEOUT = 0.01  # seconds, keeps timeouts sane on a very fast LAN
+MAX_TIMEOUT = 10.0  # seconds, keeps a single slow reply from stalling a scan
+
+DEFAULT_RETRIES = 1  # retransmissions of an unanswered probe
+
+
+class RttEstimator:
+    """Smoothed round trip time and variation of one host."""
+
+    __slots__ = ("rttvar", "srtt")
+
+    def __init__(self, rtt: float) -> None:
+        """Start estimating from a first `rtt` sample in seconds."""
+        self.srtt = rtt
+        self.rttvar = rtt / 2
+
+    def update(self, rtt: float) -> None:
+        """Fold a new `rtt` sample in seconds into the estimate."""
+        self.rttvar = (1 - BETA) * self.rttvar + BETA * abs(self.srtt - rtt)
+        self.srtt = (1 - ALPHA) * self.srtt + ALPHA * rtt
+
+    @property
+    def timeout(self) -> float:
+        return self.srtt + K * self.rttvar
+
+
+class HostTimings:
+    """Round trip time estimates of every host in a scan, safe to share between threads."""
+
+    def __init__(
+        self,
+        *,
+        initial_timeout: float = INITIAL_TIMEOUT,
+        min_timeout: float = MIN_TIMEOUT,
+        max_timeout: float = MAX_TIMEOUT,
+    ) -> None:
+        """Configure the timeouts.
+
+        Args:
+            initial_timeout (float): timeout for hosts without any rtt sample yet
+            min_timeout (float): lower bound on every timeout
+            max_timeout (float): upper bound on every timeout
+
+        Raises:
+            ValueError: if the bounds aren't positive or min_timeout is higher than max_timeout
+        """
+        if min_timeout <= 0 or max_timeout < min_timeout:
+            msg = "timeouts need to be positive and min_timeout can't be higher than max_timeout"
+            raise ValueError(msg)
+        self.initial_timeout = initial_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self._estimates: dict[str, RttEstimator] = {}
+        self._lock = threading.Lock()
+
+    def update(self, host: str, rtt: float) -> None:
+        """Record a round trip time sample for `host`.
+
+        Args:
+            host (str): the host that answered
+            rtt (float): seconds between sending a probe and receiving its answer
+        """
+        with self._lock:
+            estimate = self._estimates.get(host)
+            if estimate is None:
+                self._estimates[host] = RttEstimator(rtt)
+            else:
+                estimate.update(rtt)
+
+    def estimate(self, host: str) -> RttEstimator | None:
+        """The current estimate for `host`, None if it hasn't answered yet."""
+        return self._estimates.get(host)
+
+    def timeout(self, host: str) -> float:
+        """How long to wait for an answer from `host`.
+
+        Args:
+            host (str): the host that is probed
+
+        Returns:
+            float: the timeout in seconds
+        """
+        estimate = self._estimates.get(host)
+        timeout = self.initial_timeout if estimate is None else estimate.timeout
+        return min(self.max_timeout, max(self.min_timeout, timeout))
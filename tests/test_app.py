@@ -1,6 +1,21 @@
+import json
+import socket
+import threading
+import time
+
 import pytest
 import typer
-from port_scanner.app import _typer_check_host, _typer_check_range, app
+from port_scanner import app as app_module
+from port_scanner.app import _typer_check_host, _typer_check_ports, _typer_check_range, app
+from port_scanner.arp import ArpReply
+from port_scanner.checkpoint import Checkpoint
+from port_scanner.distributed import run_worker
+from port_scanner.logger import ResultLog
+from port_scanner.metrics import METRICS
+from port_scanner.networking import PortState, ProbeResult
+from port_scanner.output import read_binary
+from port_scanner.store import ResultStore
+from port_scanner.targets import parse_hosts
 from typer.testing import CliRunner
 
 runner = CliRunner()
@@ -8,47 +23,77 @@ runner = CliRunner()
 _LOCALHOST = "127.0.0.1"
 
 
+def _patch_probe(mocker, state):
+    return mocker.patch(
+        "port_scanner.app.probe", side_effect=lambda host, port, **_: ProbeResult(host, port, state, 0.0)
+    )
+
+
+def _patch_discover(mocker, rtt):
+    return mocker.patch("port_scanner.app.discover", side_effect=lambda hosts, **_: ((host, rtt) for host in hosts))
+
+
 def test_app_portscan_localhost_with_open_port(mocker):
-    mocker.patch("port_scanner.app.is_port_open", return_value=True)
-    mocker.patch("port_scanner.app.ping", return_value=True)
+    _patch_probe(mocker, PortState.OPEN)
+    _patch_discover(mocker, 0.001)
 
     result = runner.invoke(app, ["port-scan", "--host", f"{_LOCALHOST}", "--start-port", "20", "--end-port", "20"])
     assert result.exit_code == 0
-    assert "20" in result.stdout
-    assert "open" in result.stdout
-    assert "closed" not in result.stdout
+    assert "│ 127.0.0.1 │ 20 " in result.stdout
+    assert "open 1, closed 0" in result.stdout
 
 
 def test_app_portscan_localhost_with_closed_port(mocker):
-    mocker.patch("port_scanner.app.is_port_open", return_value=False)
-    mocker.patch("port_scanner.app.ping", return_value=True)
+    _patch_probe(mocker, PortState.CLOSED)
+    _patch_discover(mocker, 0.001)
 
     result = runner.invoke(app, ["port-scan", "--host", f"{_LOCALHOST}", "--start-port", "20", "--end-port", "20"])
     assert result.exit_code == 0
-    assert "20" in result.stdout
-    assert "closed" in result.stdout
-    assert "open" not in result.stdout
+    # only open ports get a row, closed ones are counted
+    assert "│ 127.0.0.1 │ 20 " not in result.stdout
+    assert "open 0, closed 1" in result.stdout
 
 
 def test_app_portscan_localhost_with_multiple_port(mocker):
-    mocker.patch("port_scanner.app.is_port_open", return_value=False)
-    mocker.patch("port_scanner.app.ping", return_value=True)
+    _patch_probe(mocker, PortState.CLOSED)
+    _patch_discover(mocker, 0.001)
 
     result = runner.invoke(app, ["port-scan", "--host", f"{_LOCALHOST}", "--start-port", "20", "--end-port", "21"])
     assert result.exit_code == 0
-    assert "20" in result.stdout
-    assert "21" in result.stdout
+    assert "2/2 probes" in result.stdout
+    assert "closed 2" in result.stdout
+
+
+def test_app_portscan_filtered_port(mocker):
+    _patch_probe(mocker, PortState.FILTERED)
+    _patch_discover(mocker, 0.001)
+
+    result = runner.invoke(app, ["port-scan", "--host", f"{_LOCALHOST}", "--start-port", "20", "--end-port", "20"])
+    assert result.exit_code == 0
+    assert "filtered 1" in result.stdout
 
 
 def test_app_portscan_ping_failure(mocker):
-    mocker.patch("port_scanner.app.ping", return_value=False)
+    _patch_discover(mocker, None)
 
     result = runner.invoke(app, ["port-scan", "--host", f"{_LOCALHOST}", "--start-port", "20", "--end-port", "20"])
     assert result.exit_code == 1
 
 
+def test_app_portscan_falls_back_to_ping_command(mocker):
+    _patch_probe(mocker, PortState.OPEN)
+    mocker.patch("port_scanner.app.discover", side_effect=PermissionError)
+    ping = mocker.patch("port_scanner.app.ping_rtt", return_value=0.001)
+
+    result = runner.invoke(app, ["port-scan", "--host", f"{_LOCALHOST}", "--start-port", "20", "--end-port", "20"])
+    assert result.exit_code == 0
+    ping.assert_called_once_with(_LOCALHOST)
+    assert "open" in result.stdout
+
+
 def test_app_tcp_syn_scan(mocker):
-    mocker.patch("port_scanner.app.tcp_syn_scan", return_value=False)
+    scanner = mocker.patch("port_scanner.app.SynScanner")
+    scanner.return_value.scan_targets.return_value = iter([ProbeResult(_LOCALHOST, 20, PortState.FILTERED, 0.1)])
     result = runner.invoke(
         app,
         [
@@ -67,7 +112,10 @@ def test_app_tcp_syn_scan(mocker):
 
 
 def test_app_tcp_syn_scan_timeout(mocker):
-    mocker.patch("port_scanner.app.tcp_syn_scan", return_value=False)
+    scanner = mocker.patch("port_scanner.app.SynScanner")
+    scanner.return_value.scan_targets.return_value = iter(
+        [ProbeResult(_LOCALHOST, 20, PortState.CLOSED, 0.0), ProbeResult(_LOCALHOST, 21, PortState.CLOSED, 0.0)]
+    )
     result = runner.invoke(
         app,
         [
@@ -85,12 +133,168 @@ def test_app_tcp_syn_scan_timeout(mocker):
         ],
     )
     assert result.stdout
+    assert scanner.call_args.kwargs["limiter"].bucket.rate == 0.5
+
+
+def test_app_initial_timeout(mocker):
+    scanner = mocker.patch("port_scanner.app.SynScanner")
+    scanner.return_value.scan_targets.return_value = iter([ProbeResult(_LOCALHOST, 20, PortState.FILTERED, 0.0)])
+    args = ["--host", _LOCALHOST, "--ports", "20", "--use-tcp-syn", "--skip-ping", "--initial-timeout", "0.5"]
+    result = runner.invoke(app, ["port-scan", *args])
+    assert result.exit_code == 0
+    assert scanner.call_args.kwargs["timings"].timeout("10.0.0.1") == 0.5
+
+
+def test_app_portscan_concurrency(mocker):
+    async def fake_scan_targets(targets, **_):
+        for host, port in targets:
+            yield ProbeResult(host, port, PortState.OPEN if port == 21 else PortState.CLOSED, 0.0)
+
+    mocker.patch("port_scanner.app.scan_targets", fake_scan_targets)
+    result = runner.invoke(
+        app,
+        [
+            "port-scan",
+            "--host",
+            _LOCALHOST,
+            "--start-port",
+            "20",
+            "--end-port",
+            "21",
+            "--skip-ping",
+            "--concurrency",
+            "8",
+        ],
+    )
+    assert result.exit_code == 0
+    assert "open" in result.stdout
+    assert "closed" in result.stdout
+
+
+def test_app_portscan_rate_limits_every_probe(mocker):
+    scan = _patch_probe(mocker, PortState.CLOSED)
+    result = runner.invoke(
+        app,
+        ["port-scan", "--host", _LOCALHOST, "--ports", "20-21", "--skip-ping", "--rate", "100", "--host-rate", "50"],
+    )
+    assert result.exit_code == 0
+    limiter = scan.call_args.kwargs["limiter"]
+    assert limiter.bucket.rate == 100
+    assert limiter.host_rate == 50
+
+
+def test_app_portscan_invalid_rate():
+    result = runner.invoke(app, ["port-scan", "--host", _LOCALHOST, "--ports", "20", "--skip-ping", "--rate", "0"])
+    assert result.exit_code != 0
+
+
+def test_app_portscan_concurrency_with_tcp_syn():
+    result = runner.invoke(
+        app,
+        [
+            "port-scan",
+            "--host",
+            _LOCALHOST,
+            "--start-port",
+            "20",
+            "--end-port",
+            "21",
+            "--use-tcp-syn",
+            "--concurrency",
+            "8",
+        ],
+    )
+    assert result.exit_code != 0
+
+
+def test_app_portscan_multiple_hosts_and_ports(mocker):
+    scan = _patch_probe(mocker, PortState.CLOSED)
+    result = runner.invoke(
+        app, ["port-scan", "--host", "10.0.0.1-2", "--ports", "22,80", "--skip-ping"], terminal_width=200
+    )
+    assert result.exit_code == 0
+    # hosts are interleaved on every port
+    assert [c.args for c in scan.call_args_list] == [
+        ("10.0.0.1", 22),
+        ("10.0.0.2", 22),
+        ("10.0.0.1", 80),
+        ("10.0.0.2", 80),
+    ]
+
+
+def test_app_portscan_hosts_file(mocker, tmp_path):
+    scan = _patch_probe(mocker, PortState.OPEN)
+    hosts_file = tmp_path / "hosts.txt"
+    hosts_file.write_text("# lab\n10.0.0.1\n10.0.1.0/31  # router\n")
+    result = runner.invoke(app, ["port-scan", "--hosts-file", str(hosts_file), "--ports", "22", "--skip-ping"])
+    assert result.exit_code == 0
+    assert [c.args[0] for c in scan.call_args_list] == ["10.0.0.1", "10.0.1.0", "10.0.1.1"]
+
+
+def test_app_portscan_skips_hosts_that_are_down(mocker):
+    mocker.patch(
+        "port_scanner.app.discover",
+        side_effect=lambda hosts, **_: ((host, 0.001 if host == "10.0.0.2" else None) for host in hosts),
+    )
+    scan = _patch_probe(mocker, PortState.OPEN)
+    result = runner.invoke(app, ["port-scan", "--host", "10.0.0.1-3", "--ports", "22"])
+    assert result.exit_code == 0
+    assert [c.args for c in scan.call_args_list] == [("10.0.0.2", 22)]
+
+
+def test_app_portscan_invalid_ports():
+    result = runner.invoke(app, ["port-scan", "--host", _LOCALHOST, "--ports", "22,70000", "--skip-ping"])
+    assert result.exit_code != 0
+
+
+def test_app_portscan_randomized_shards(mocker):
+    scan = _patch_probe(mocker, PortState.CLOSED)
+    visited = []
+    for shard in ("1/2", "2/2"):
+        args = ["port-scan", "--host", "10.0.0.0/30", "--ports", "20-29", "--skip-ping", "--randomize", "--seed", "5"]
+        result = runner.invoke(app, [*args, "--shard", shard])
+        assert result.exit_code == 0
+        visited += [c.args for c in scan.call_args_list]
+        scan.reset_mock()
+    assert len(visited) == len(set(visited)) == 40
+    assert visited != sorted(visited, key=lambda target: (target[1], target[0]))
+
+
+def test_app_portscan_start_index(mocker):
+    scan = _patch_probe(mocker, PortState.CLOSED)
+    result = runner.invoke(
+        app, ["port-scan", "--host", _LOCALHOST, "--ports", "20-29", "--skip-ping", "--start-index", "8"]
+    )
+    assert result.exit_code == 0
+    assert [c.args[1] for c in scan.call_args_list] == [28, 29]
+
+
+@pytest.mark.parametrize("shard", ["0/2", "3/2", "1", "a/b"])
+def test_app_portscan_invalid_shard(shard):
+    result = runner.invoke(app, ["port-scan", "--host", _LOCALHOST, "--ports", "20", "--skip-ping", "--shard", shard])
+    assert result.exit_code != 0
 
 
 def test_app_arp_scan(mocker):
-    mocker.patch("port_scanner.networking.arp_scan", return_value=["10.10.10.10", "10.1.1.1"])
-    result = runner.invoke(app, ["scan-arp", "--ip-range", "10.10.10.0/24"])
+    sweep = mocker.patch(
+        "port_scanner.app.arp_sweep",
+        return_value=iter(
+            [ArpReply("10.10.10.10", "02:00:00:00:00:01", 0.001), ArpReply("10.1.1.1", "02:00:00:00:00:02", 0.002)]
+        ),
+    )
+    result = runner.invoke(app, ["scan-arp", "--ip-range", "10.10.10.0/24", "--rate", "100"])
+    assert result.exit_code == 0
+    sweep.assert_called_once_with("10.10.10.0/24", rate=100, retries=2)
+    assert "10.10.10.10" in result.stdout
+    assert "02:00:00:00:00:01" in result.stdout
+
+
+def test_app_arp_scan_stats(mocker):
+    mocker.patch("port_scanner.app.arp_sweep", return_value=iter([]))
+    result = runner.invoke(app, ["scan-arp", "--ip-range", "10.10.10.0/24", "--stats"])
     assert result.exit_code == 0
+    assert "packets_captured" in result.stdout
+    assert "kernel_drops" in result.stdout
 
 
 def test_typer_check_host():
@@ -98,6 +302,498 @@ def test_typer_check_host():
         _typer_check_host("invalid")
 
 
+def test_typer_check_ports():
+    assert _typer_check_ports("22,top-100") == "22,top-100"
+    with pytest.raises(typer.BadParameter):
+        _typer_check_ports("top-5")
+
+
 def test_typer_check_range():
     with pytest.raises(typer.BadParameter):
         _typer_check_range("invalid")
+
+
+def test_app_discover_scan_scans_live_hosts(mocker):
+    probe = _patch_probe(mocker, PortState.OPEN)
+    mocker.patch(
+        "port_scanner.app.discover",
+        side_effect=lambda hosts, **_: ((host, 0.001 if host != "10.0.0.2" else None) for host in hosts),
+    )
+    result = runner.invoke(app, ["discover-scan", "--host", "10.0.0.1-3", "--ports", "22,80", "--queue-size", "1"])
+    assert result.exit_code == 0
+    assert [call.args for call in probe.call_args_list] == [
+        ("10.0.0.1", 22),
+        ("10.0.0.1", 80),
+        ("10.0.0.3", 22),
+        ("10.0.0.3", 80),
+    ]
+    assert "2 live hosts scanned" in result.stdout
+
+
+def test_app_discover_scan_with_concurrency(mocker):
+    scanned = []
+
+    async def fake_scan_targets(targets, **_):
+        async for host, port in targets:
+            scanned.append((host, port))
+            yield ProbeResult(host, port, PortState.CLOSED, 0.0)
+
+    mocker.patch("port_scanner.app.scan_targets", fake_scan_targets)
+    _patch_discover(mocker, 0.001)
+    result = runner.invoke(app, ["discover-scan", "--host", "10.0.0.1-2", "--ports", "22", "--concurrency", "10"])
+    assert result.exit_code == 0
+    assert scanned == [("10.0.0.1", 22), ("10.0.0.2", 22)]
+
+
+def test_app_discover_scan_with_arp(mocker):
+    scanner = mocker.patch("port_scanner.app.ArpScanner")
+    scanner.for_network.return_value.sweep.side_effect = lambda hosts: (
+        ArpReply(host, "02:00:00:00:00:01", 0.001) for host in hosts if host == "192.168.0.5"
+    )
+    probe = _patch_probe(mocker, PortState.CLOSED)
+    result = runner.invoke(app, ["discover-scan", "--host", "192.168.0.0/24", "--ports", "22", "--discovery", "arp"])
+    assert result.exit_code == 0
+    scanner.for_network.assert_called_once_with("192.168.0.0")
+    probe.assert_called_once()
+    assert "192.168.0.5" in result.stdout
+
+
+def test_app_portscan_headless(mocker):
+    _patch_probe(mocker, PortState.OPEN)
+    live = mocker.patch("port_scanner.app.Live")
+    _patch_discover(mocker, 0.001)
+
+    result = runner.invoke(app, ["port-scan", "--host", _LOCALHOST, "--ports", "20-29", "--shard", "1/2", "--headless"])
+    assert result.exit_code == 0
+    live.assert_not_called()
+    assert "5/5 probes" in result.stdout
+    assert "open 5" in result.stdout
+
+
+def test_app_portscan_log_results(mocker):
+    _patch_probe(mocker, PortState.CLOSED)
+    _patch_discover(mocker, 0.001)
+    result_logger = mocker.patch("port_scanner.app.ResultLogger")
+
+    result = runner.invoke(app, ["port-scan", "--host", _LOCALHOST, "--ports", "20-21", "--log-results", "open"])
+    assert result.exit_code == 0
+    assert result_logger.call_args.args[1] == ResultLog.OPEN
+    assert result_logger.return_value.call_count == 2
+    result_logger.return_value.close.assert_called_once()
+
+
+def test_app_portscan_output_file(mocker, tmp_path):
+    _patch_probe(mocker, PortState.OPEN)
+    _patch_discover(mocker, 0.001)
+    path = tmp_path / "scan.csv"
+
+    result = runner.invoke(
+        app,
+        ["port-scan", "--host", _LOCALHOST, "--ports", "20-21", "--output", "csv", "--output-file", str(path)],
+    )
+    assert result.exit_code == 0
+    assert path.read_text().splitlines() == [
+        "host,port,state,latency",
+        "127.0.0.1,20,open,0.000000",
+        "127.0.0.1,21,open,0.000000",
+    ]
+    assert "2/2 probes" in result.stdout
+
+
+def test_app_portscan_output_to_stdout(mocker):
+    _patch_probe(mocker, PortState.OPEN)
+    _patch_discover(mocker, 0.001)
+    mocker.patch.object(app_module.console, "stderr", False)
+
+    result = runner.invoke(app, ["port-scan", "--host", _LOCALHOST, "--ports", "20", "--output", "jsonl"])
+    assert result.exit_code == 0
+    # the live view and messages make way for the results
+    assert result.stdout.splitlines() == ['{"host": "127.0.0.1", "port": 20, "state": "open", "latency": 0.000000}']
+    assert "seems to be up" in result.stderr
+
+
+def test_app_discover_scan_binary_output(mocker, tmp_path):
+    _patch_probe(mocker, PortState.CLOSED)
+    _patch_discover(mocker, 0.001)
+    path = tmp_path / "scan.bin"
+
+    result = runner.invoke(
+        app,
+        ["discover-scan", "--host", _LOCALHOST, "--ports", "20-22", "--output", "bin", "--output-file", str(path)],
+    )
+    assert result.exit_code == 0
+    assert [(result.port, result.state) for result in read_binary(path)] == [
+        (20, PortState.CLOSED),
+        (21, PortState.CLOSED),
+        (22, PortState.CLOSED),
+    ]
+
+
+def test_app_portscan_resume(mocker, tmp_path):
+    path = tmp_path / "scan.ckpt"
+    args = [
+        "--host",
+        "127.0.0.1-2",
+        "--ports",
+        "20-24",
+        "--randomize",
+        "--seed",
+        "5",
+        "--checkpoint",
+        str(path),
+        "--headless",
+    ]
+    _patch_discover(mocker, 0.001)
+    probe = _patch_probe(mocker, PortState.CLOSED)
+    result = runner.invoke(app, ["port-scan", *args])
+    assert result.exit_code == 0
+    everything = [call.args for call in probe.call_args_list]
+    assert len(everything) == 10
+
+    # interrupted while probing the fifth target
+    probed = []
+
+    def _interrupted(host, port, **_):
+        if len(probed) == 4:
+            raise KeyboardInterrupt
+        probed.append((host, port))
+        return ProbeResult(host, port, PortState.CLOSED, 0.0)
+
+    mocker.patch("port_scanner.app.probe", side_effect=_interrupted)
+    result = runner.invoke(app, ["port-scan", *args])
+    assert result.exit_code != 0
+
+    probe = _patch_probe(mocker, PortState.CLOSED)
+    result = runner.invoke(app, ["port-scan", "--resume", str(path), "--headless"])
+    assert result.exit_code == 0
+    assert "resuming: 4 probes were done" in result.stdout
+    assert "6/6 probes" in result.stdout
+    # the rest of the scan, in the same order
+    assert [call.args for call in probe.call_args_list] == everything[4:]
+    with Checkpoint.open(path) as checkpoint:
+        assert checkpoint.completed == 10
+
+
+def test_app_portscan_resume_not_a_checkpoint(tmp_path):
+    path = tmp_path / "scan.ckpt"
+    path.write_bytes(b"nope")
+    result = runner.invoke(app, ["port-scan", "--resume", str(path)])
+    assert result.exit_code != 0
+
+
+def test_app_portscan_store_and_results(mocker, tmp_path):
+    _patch_probe(mocker, PortState.OPEN)
+    _patch_discover(mocker, 0.001)
+    path = tmp_path / "scan.store"
+
+    result = runner.invoke(app, ["port-scan", "--host", "127.0.0.1-2", "--ports", "20-21", "--store", str(path)])
+    assert result.exit_code == 0
+
+    result = runner.invoke(app, ["results", str(path), "--host", "127.0.0.2", "--port", "21"])
+    assert result.exit_code == 0
+    assert "127.0.0.2: 20, 21" in result.stdout
+    assert "port 21 is open on 2 hosts" in result.stdout
+    assert "2 hosts, 4 ports probed - open 4, closed 0, filtered 0" in result.stdout
+
+    result = runner.invoke(app, ["results", str(path), "--host", "127.0.0.3"])
+    assert result.exit_code != 0
+
+
+def test_app_discover_scan_store(mocker, tmp_path):
+    _patch_probe(mocker, PortState.CLOSED)
+    _patch_discover(mocker, 0.001)
+    path = tmp_path / "scan.store"
+
+    args = ["discover-scan", "--host", _LOCALHOST, "--ports", "20-22", "--store", str(path), "--store-latency"]
+    result = runner.invoke(app, args)
+    assert result.exit_code == 0
+    with ResultStore.open(path) as store:
+        assert store.ports(_LOCALHOST, PortState.CLOSED) == [20, 21, 22]
+        assert store.latency(_LOCALHOST, 20) == 0.0
+
+
+def test_app_portscan_baseline(mocker, tmp_path):
+    _patch_discover(mocker, 0.001)
+    path = tmp_path / "baseline.store"
+    with ResultStore.create(parse_hosts(_LOCALHOST), path) as store:
+        for port in range(20, 25):
+            store.add(ProbeResult(_LOCALHOST, port, PortState.CLOSED, 0.001))
+        store.add(ProbeResult(_LOCALHOST, 22, PortState.OPEN, 0.001))
+    open_ports = {21}
+    probe = mocker.patch(
+        "port_scanner.app.probe",
+        side_effect=lambda host, port, **_: ProbeResult(
+            host, port, PortState.OPEN if port in open_ports else PortState.CLOSED, 0.0
+        ),
+    )
+    output = tmp_path / "changes.csv"
+    args = ["port-scan", "--host", _LOCALHOST, "--ports", "20-25", "--baseline", str(path), "--headless"]
+
+    result = runner.invoke(app, [*args, "--output", "csv", "--output-file", str(output)])
+    assert result.exit_code == 0
+    # the open port is checked first
+    assert probe.call_args_list[0].args == (_LOCALHOST, 22)
+    assert "6/6 probes" in result.stdout
+    assert "│ 127.0.0.1 │ 21   │ closed │ open   │" in result.stdout
+    assert "│ 127.0.0.1 │ 22   │ open   │ closed │" in result.stdout
+    # port 25 wasn't scanned before, but is closed now
+    assert "25" not in output.read_text()
+    assert output.read_text().count("\n") == 3
+
+    probe.reset_mock()
+    open_ports = {22}
+    result = runner.invoke(app, [*args, "--closed-policy", "skip"])
+    assert result.exit_code == 0
+    assert [call.args[1] for call in probe.call_args_list] == [22, 25]
+    assert "no changes since the baseline" in result.stdout
+
+
+def test_app_portscan_baseline_skips_every_night(mocker, tmp_path):
+    _patch_discover(mocker, 0.001)
+    with ResultStore.create(parse_hosts(_LOCALHOST), tmp_path / "0.store") as store:
+        for port in range(20, 25):
+            store.add(ProbeResult(_LOCALHOST, port, PortState.OPEN if port == 22 else PortState.CLOSED, 0.001))
+    probe = _patch_probe(mocker, PortState.CLOSED)
+    args = ["port-scan", "--host", _LOCALHOST, "--ports", "20-25", "--closed-policy", "skip", "--headless"]
+    for night in (1, 2):
+        probe.reset_mock()
+        result = runner.invoke(
+            app,
+            [*args, "--baseline", str(tmp_path / f"{night - 1}.store"), "--store", str(tmp_path / f"{night}.store")],
+        )
+        assert result.exit_code == 0
+        # the open port of the first baseline, and port 25 that wasn't probed before the first night
+        assert [call.args[1] for call in probe.call_args_list] == ([22, 25] if night == 1 else [])
+    with ResultStore.open(tmp_path / "2.store") as store:
+        assert store.ports(_LOCALHOST, PortState.CLOSED) == [20, 21, 22, 23, 24, 25]
+
+
+@pytest.mark.parametrize("option", [["--randomize"], ["--shard", "1/2"], ["--start-index", "1"]])
+def test_app_portscan_baseline_conflicts(tmp_path, option):
+    path = tmp_path / "baseline.store"
+    ResultStore.create(parse_hosts(_LOCALHOST), path).close()
+    result = runner.invoke(app, ["port-scan", "--host", _LOCALHOST, "--ports", "20", "--baseline", str(path), *option])
+    assert result.exit_code != 0
+    assert "can't be combined" in result.output
+
+
+def test_app_portscan_processes(mocker):
+    scan = mocker.patch(
+        "port_scanner.app.scan_processes",
+        return_value=iter([ProbeResult(_LOCALHOST, 20, PortState.OPEN, 0.0)]),
+    )
+    result = runner.invoke(
+        app,
+        ["port-scan", "--host", _LOCALHOST, "--ports", "20-21", "--skip-ping", "--processes", "2", "--shard", "2/3"],
+    )
+    assert result.exit_code == 0
+    assert "│ 127.0.0.1 │ 20 " in result.stdout
+    assert scan.call_args.kwargs["processes"] == 2
+    assert (scan.call_args.kwargs["shard"], scan.call_args.kwargs["shards"]) == (1, 3)
+
+
+def test_app_portscan_processes_worker_dies(mocker):
+    def _scan(*_, **__):
+        yield ProbeResult(_LOCALHOST, 20, PortState.OPEN, 0.0)
+        msg = "worker process 1 died with exit code -9"
+        raise RuntimeError(msg)
+
+    mocker.patch("port_scanner.app.scan_processes", side_effect=_scan)
+    args = ["--host", _LOCALHOST, "--ports", "20-21", "--skip-ping", "--headless", "--processes", "2"]
+    result = runner.invoke(app, ["port-scan", *args])
+    assert result.exit_code == 1
+    assert "scan failed: worker process 1 died" in result.stdout
+
+
+def test_app_portscan_processes_on_loopback():
+    with socket.socket() as listener:
+        listener.bind((_LOCALHOST, 0))
+        listener.listen()
+        port = listener.getsockname()[1]
+        args = ["--host", _LOCALHOST, "--ports", f"{port - 5}-{port + 5}", "--skip-ping", "--headless"]
+        result = runner.invoke(app, ["port-scan", *args, "--processes", "2", "--concurrency", "4"])
+    assert result.exit_code == 0
+    assert "11/11 probes" in result.stdout
+    assert "open 1, closed 10" in result.stdout
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind((_LOCALHOST, 0))
+        return sock.getsockname()[1]
+
+
+def test_app_coordinate_with_a_worker(tmp_path):
+    address = f"{_LOCALHOST}:{_free_port()}"
+
+    def _work():
+        for _ in range(100):
+            try:
+                run_worker(address)
+            except ConnectionRefusedError:
+                time.sleep(0.05)
+            else:
+                return
+
+    with socket.socket() as listener:
+        listener.bind((_LOCALHOST, 0))
+        listener.listen()
+        port = listener.getsockname()[1]
+        worker = threading.Thread(target=_work)
+        worker.start()
+        args = ["--host", _LOCALHOST, "--ports", f"{port - 5}-{port + 5}", "--headless", "--retries", "0"]
+        result = runner.invoke(
+            app, ["coordinate", *args, "--listen", address, "--pieces", "3", "--store", str(tmp_path / "results")]
+        )
+        worker.join()
+    assert result.exit_code == 0
+    assert f"waiting for workers on {address}" in result.stdout
+    assert "11/11 probes" in result.stdout
+    with ResultStore.open(tmp_path / "results") as store:
+        assert store.ports(_LOCALHOST) == [port]
+
+
+def test_app_coordinate_reports_dropped_workers(mocker):
+    mocker.patch("port_scanner.distributed.scan_shard", side_effect=PermissionError("Operation not permitted"))
+    address = f"{_LOCALHOST}:{_free_port()}"
+
+    def _work():
+        for _ in range(100):
+            try:
+                run_worker(address, name="node-1")
+            except ConnectionRefusedError:
+                time.sleep(0.05)
+            except PermissionError:
+                return
+
+    worker = threading.Thread(target=_work)
+    worker.start()
+    result = runner.invoke(app, ["coordinate", "--host", _LOCALHOST, "--ports", "20-21", "--listen", address])
+    worker.join()
+    assert result.exit_code == 1
+    assert "scan failed: node-1" in result.stdout
+    assert "dropped node-1" in result.stdout
+
+
+def test_app_coordinate_bad_listen_address():
+    result = runner.invoke(app, ["coordinate", "--host", _LOCALHOST, "--listen", "localhost:http"])
+    assert result.exit_code != 0
+
+
+def test_app_scan_worker(mocker):
+    run = mocker.patch("port_scanner.app.run_worker", return_value=3)
+    result = runner.invoke(app, ["scan-worker", "10.0.0.1:7000", "--name", "node-1"])
+    assert result.exit_code == 0
+    assert "3 pieces scanned" in result.stdout
+    run.assert_called_once_with("10.0.0.1:7000", name="node-1")
+
+
+def test_app_scan_worker_without_coordinator(mocker):
+    mocker.patch("port_scanner.app.run_worker", side_effect=ConnectionRefusedError("refused"))
+    result = runner.invoke(app, ["scan-worker", "10.0.0.1:7000"])
+    assert result.exit_code == 1
+    assert "lost the coordinator" in result.stdout
+
+
+def test_app_scan_worker_without_privileges(mocker):
+    mocker.patch("port_scanner.app.run_worker", side_effect=PermissionError("Operation not permitted"))
+    result = runner.invoke(app, ["scan-worker", "10.0.0.1:7000"])
+    assert result.exit_code == 1
+    assert "not allowed to scan: Operation not permitted" in result.stdout
+
+
+def test_app_portscan_services():
+    with socket.socket() as server:
+        server.bind((_LOCALHOST, 0))
+        server.listen()
+        port = server.getsockname()[1]
+
+        def _greet():
+            connection, _ = server.accept()
+            with connection:
+                connection.sendall(b"SSH-2.0-OpenSSH_9.6\r\n")
+                connection.recv(1)
+
+        greeter = threading.Thread(target=_greet)
+        greeter.start()
+        args = ["--host", _LOCALHOST, "--ports", f"{port}", "--skip-ping", "--headless", "--services"]
+        result = runner.invoke(app, ["port-scan", *args, "--concurrency", "2"])
+        greeter.join()
+    assert result.exit_code == 0
+    assert f"│ 127.0.0.1 │ {port} │ ssh     │ OpenSSH_9.6 │" in result.stdout
+
+
+@pytest.mark.parametrize("option", [["--use-tcp-syn"], ["--processes", "2"]])
+def test_app_portscan_services_needs_connect_scan(option):
+    args = ["--host", _LOCALHOST, "--ports", "22", "--skip-ping", "--services"]
+    result = runner.invoke(app, ["port-scan", *args, *option])
+    assert result.exit_code != 0
+
+
+def test_app_portscan_workers():
+    with socket.socket() as server:
+        server.bind((_LOCALHOST, 0))
+        server.listen()
+        port = server.getsockname()[1]
+        args = ["--host", _LOCALHOST, "--ports", f"{port - 2}-{port}", "--skip-ping", "--headless", "--workers", "3"]
+        result = runner.invoke(app, ["port-scan", *args])
+    assert result.exit_code == 0
+    assert "3/3 probes" in result.stdout
+    assert "open 1" in result.stdout
+
+
+@pytest.mark.parametrize("option", [["--use-tcp-syn"], ["--concurrency", "2"], ["--processes", "2"]])
+def test_app_portscan_workers_needs_sequential_engine(option):
+    args = ["--host", _LOCALHOST, "--ports", "22", "--skip-ping", "--workers", "2"]
+    result = runner.invoke(app, ["port-scan", *args, *option])
+    assert result.exit_code != 0
+
+
+def test_app_portscan_stats(mocker):
+    _patch_probe(mocker, PortState.CLOSED)
+    args = ["--host", _LOCALHOST, "--ports", "20-21", "--skip-ping", "--headless", "--stats"]
+    result = runner.invoke(app, ["port-scan", *args])
+    assert result.exit_code == 0
+    assert "stats" in result.stdout
+    assert "results" in result.stdout
+
+
+def test_app_portscan_stats_file(mocker, tmp_path):
+    _patch_probe(mocker, PortState.CLOSED)
+    path = tmp_path / "stats.jsonl"
+    args = ["--host", _LOCALHOST, "--ports", "20-21", "--skip-ping", "--headless", "--stats-file", f"{path}"]
+    result = runner.invoke(app, ["port-scan", *args])
+    assert result.exit_code == 0
+    line = json.loads(path.read_text().splitlines()[-1])
+    assert line["metrics"]["results"] >= 2
+
+
+def test_app_portscan_stats_of_worker_processes(tmp_path):
+    METRICS.reset()
+    path = tmp_path / "stats.jsonl"
+    with socket.socket() as listener:
+        listener.bind((_LOCALHOST, 0))
+        listener.listen()
+        port = listener.getsockname()[1]
+        args = ["--host", _LOCALHOST, "--ports", f"{port - 5}-{port + 5}", "--skip-ping", "--headless"]
+        result = runner.invoke(app, ["port-scan", *args, "--processes", "2", "--stats", "--stats-file", f"{path}"])
+    assert result.exit_code == 0
+    # counted in the worker processes
+    metrics = json.loads(path.read_text().splitlines()[-1])["metrics"]
+    assert metrics["probes_sent"] == 11
+    assert metrics["stage_seconds{stage=connect}"]["count"] == 11
+    assert metrics["results"] == 11
+
+
+def test_app_portscan_stats_interval_needs_to_be_positive(tmp_path):
+    args = ["--host", _LOCALHOST, "--ports", "20", "--skip-ping", "--stats-file", f"{tmp_path / 'stats.jsonl'}"]
+    result = runner.invoke(app, ["port-scan", *args, "--stats-interval", "0"])
+    assert result.exit_code != 0
+
+
+def test_app_portscan_metrics_port(mocker):
+    _patch_probe(mocker, PortState.CLOSED)
+    args = ["--host", _LOCALHOST, "--ports", "20", "--skip-ping", "--headless", "--metrics-port", "0"]
+    result = runner.invoke(app, ["port-scan", *args])
+    assert result.exit_code == 0
+    assert "metrics on http://127.0.0.1:" in result.stdout
@@ -0,0 +1,122 @@
+import queue
+
+import pytest
+from port_scanner.arp import ArpReply, ArpScanner, arp_request, arp_sweep, parse_arp_reply
+from scapy.all import ARP, Ether  # type: ignore
+
+_SOURCE_IP = "192.168.0.100"
+_SOURCE_MAC = bytes.fromhex("020000000064")
+
+
+def _mac(ip):
+    return "02:00:00:00:00:" + ip.rsplit(".", 1)[1].zfill(2)[-2:]
+
+
+class FakeLink:
+    """Stands in for a packet socket on a network where `up` hosts answer ARP requests."""
+
+    def __init__(self, up=(), drop_first=0):
+        self.up = set(up)
+        self.drop_first = drop_first
+        self.sent = []
+        self.replies = queue.SimpleQueue()
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def send(self, frame):
+        self.sent.append(bytes(frame))
+        request = Ether(bytes(frame))
+        if len(self.sent) <= self.drop_first or request[ARP].pdst not in self.up:
+            return
+        reply = Ether(dst=request.src, src=_mac(request[ARP].pdst)) / ARP(
+            op=2, hwsrc=_mac(request[ARP].pdst), psrc=request[ARP].pdst, hwdst=request.src, pdst=request[ARP].psrc
+        )
+        self.replies.put(bytes(reply))
+
+    def recvfrom(self, _):
+        try:
+            return self.replies.get(timeout=self.timeout), ("eth0", 0x0806, 0, 1, b"")
+        except queue.Empty:
+            raise TimeoutError from None
+
+
+class FakeLimiter:
+    def __init__(self):
+        self.hosts = []
+
+    def acquire(self, host):
+        self.hosts.append(host)
+
+
+def _scanner(link, **kwargs):
+    return ArpScanner("eth0", _SOURCE_IP, _SOURCE_MAC, transport=link, **kwargs)
+
+
+def test_arp_request_matches_scapy():
+    expected = Ether(dst="ff:ff:ff:ff:ff:ff", src="02:00:00:00:00:64") / ARP(
+        hwsrc="02:00:00:00:00:64", psrc=_SOURCE_IP, pdst="192.168.0.7"
+    )
+    assert bytes(arp_request(_SOURCE_MAC, _SOURCE_IP, "192.168.0.7")) == bytes(expected)
+
+
+def test_parse_arp_reply():
+    reply = Ether() / ARP(op=2, hwsrc="02:00:00:00:00:07", psrc="192.168.0.7", pdst=_SOURCE_IP)
+    assert parse_arp_reply(bytes(reply)) == ("192.168.0.7", bytes.fromhex("020000000007"), _SOURCE_IP)
+
+
+def test_parse_arp_reply_ignores_other_frames():
+    assert parse_arp_reply(b"") is None
+    assert parse_arp_reply(bytes(Ether() / ARP(op=1, pdst="192.168.0.7"))) is None
+    assert parse_arp_reply(bytes(Ether(type=0x0800) / (b"x" * 40))) is None
+
+
+def test_sweep_yields_answering_hosts():
+    link = FakeLink(up=["192.168.0.1", "192.168.0.7"])
+    replies = list(_scanner(link, timeout=0.05, retries=1).sweep(f"192.168.0.{i}" for i in range(1, 9)))
+    assert sorted((reply.ip, reply.mac) for reply in replies) == [
+        ("192.168.0.1", "02:00:00:00:00:01"),
+        ("192.168.0.7", "02:00:00:00:00:07"),
+    ]
+    assert all(reply.rtt >= 0 for reply in replies)
+    # every silent address is asked twice
+    assert len(link.sent) == 2 + 6 * 2
+
+
+def test_sweep_retries_lost_requests():
+    link = FakeLink(up=["192.168.0.1"], drop_first=1)
+    assert [reply.ip for reply in _scanner(link, timeout=0.05, retries=1).sweep(["192.168.0.1"])] == ["192.168.0.1"]
+    assert len(link.sent) == 2
+
+
+def test_sweep_ignores_replies_to_others():
+    scanner = _scanner(FakeLink())
+    scanner._pending["192.168.0.7"] = (0.0, 0)
+    reply = Ether() / ARP(op=2, hwsrc="02:00:00:00:00:07", psrc="192.168.0.7", pdst="192.168.0.99")
+    scanner.handle_reply(bytes(reply))
+    assert scanner._pending
+
+
+def test_sweep_is_paced():
+    limiter = FakeLimiter()
+    list(_scanner(FakeLink(), timeout=0.01, retries=0, limiter=limiter).sweep(["192.168.0.1", "192.168.0.2"]))
+    assert limiter.hosts == ["192.168.0.1", "192.168.0.2"]
+
+
+def test_arp_sweep_sweeps_host_addresses(mocker):
+    mocker.patch("port_scanner.arp.route", return_value=("eth0", _SOURCE_IP, _SOURCE_MAC))
+    sweep = mocker.patch.object(
+        ArpScanner, "sweep", return_value=iter([ArpReply("192.168.0.1", "02:00:00:00:00:01", 0.1)])
+    )
+    assert list(arp_sweep("192.168.0.0/30")) == [ArpReply("192.168.0.1", "02:00:00:00:00:01", 0.1)]
+    assert list(sweep.call_args.args[0]) == ["192.168.0.1", "192.168.0.2"]
+
+
+def test_arp_sweep_invalid_network():
+    with pytest.raises(ValueError):
+        arp_sweep("invalid")
+
+
+def test_arp_scanner_invalid_rate():
+    with pytest.raises(ValueError):
+        ArpScanner("eth0", _SOURCE_IP, _SOURCE_MAC, rate=0)
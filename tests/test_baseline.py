@@ -0,0 +1,76 @@
+import pytest
+from port_scanner.baseline import Change, ClosedPolicy, Differ, plan
+from port_scanner.networking import PortState, ProbeResult
+from port_scanner.store import ResultStore
+from port_scanner.targets import TargetSpec, parse_hosts
+
+
+@pytest.fixture
+def baseline():
+    with ResultStore.create(parse_hosts("10.0.0.1-2")) as store:
+        for port in range(20, 30):
+            store.add(ProbeResult("10.0.0.1", port, PortState.CLOSED, 0.001))
+            store.add(ProbeResult("10.0.0.2", port, PortState.FILTERED, 1.0))
+        store.add(ProbeResult("10.0.0.1", 22, PortState.OPEN, 0.001))
+        store.add(ProbeResult("10.0.0.2", 25, PortState.OPEN, 0.001))
+        store.add(ProbeResult("10.0.0.2", 80, PortState.OPEN, 0.001))
+        yield store
+
+
+def test_plan_puts_open_ports_first(baseline):
+    targets = TargetSpec.parse("10.0.0.1-2", "20-29")
+    planned = list(plan(targets, baseline))
+    # port 80 isn't one of the targets
+    assert planned[:2] == [("10.0.0.1", 22), ("10.0.0.2", 25)]
+    assert sorted(planned) == sorted(targets)
+
+
+def test_plan_skips_closed_ports(baseline):
+    targets = TargetSpec.parse("10.0.0.1-3", "20-30")
+    planned = list(plan(targets, baseline, policy=ClosedPolicy.SKIP))
+    assert planned[:2] == [("10.0.0.1", 22), ("10.0.0.2", 25)]
+    # unknown ports and hosts are always probed
+    assert sorted(planned[2:]) == sorted(
+        [("10.0.0.1", 30), ("10.0.0.2", 30), *(("10.0.0.3", port) for port in range(20, 31))]
+    )
+
+
+def test_plan_carries_skipped_ports_over(baseline):
+    targets = TargetSpec.parse("10.0.0.1-2", "20-29")
+    with ResultStore.create(parse_hosts("10.0.0.1"), latency=True) as store:
+        planned = list(plan(targets, baseline, policy=ClosedPolicy.SKIP, carry=store))
+        assert planned == [("10.0.0.1", 22), ("10.0.0.2", 25)]
+        # only the hosts the store has room for, and not the ports that are probed
+        assert store.ports("10.0.0.1", PortState.CLOSED) == [20, 21, *range(23, 30)]
+        assert store.state("10.0.0.1", 22) is None
+        assert store.latency("10.0.0.1", 20) == pytest.approx(0.0)
+
+
+def test_plan_samples_closed_ports(baseline):
+    targets = TargetSpec.parse("10.0.0.1-2", "20-29")
+    planned = list(plan(targets, baseline, policy=ClosedPolicy.SAMPLE, sample=0.5, seed=1))
+    assert planned == list(plan(targets, baseline, policy=ClosedPolicy.SAMPLE, sample=0.5, seed=1))
+    assert 2 < len(planned) < len(targets)
+    assert len(list(plan(targets, baseline, policy=ClosedPolicy.SAMPLE, sample=0))) == 2
+    assert len(list(plan(targets, baseline, policy=ClosedPolicy.SAMPLE, sample=1))) == len(targets)
+
+
+def test_plan_invalid_sample(baseline):
+    with pytest.raises(ValueError, match="sample needs to be"):
+        list(plan(TargetSpec.parse("10.0.0.1", "22"), baseline, sample=2))
+
+
+def test_differ_reports_opened_and_closed_ports(baseline):
+    differ = Differ(baseline)
+    assert differ(ProbeResult("10.0.0.1", 22, PortState.OPEN, 0.001)) is None
+    assert differ(ProbeResult("10.0.0.1", 23, PortState.CLOSED, 0.001)) is None
+    # closed and filtered are both not open
+    assert differ(ProbeResult("10.0.0.2", 20, PortState.CLOSED, 0.001)) is None
+    assert differ(ProbeResult("10.0.0.1", 30, PortState.CLOSED, 0.001)) is None
+    opened = differ(ProbeResult("10.0.0.1", 23, PortState.OPEN, 0.001))
+    closed = differ(ProbeResult("10.0.0.2", 25, PortState.FILTERED, 1.0))
+    new = differ(ProbeResult("10.0.0.3", 443, PortState.OPEN, 0.001))
+    assert opened == Change("10.0.0.1", 23, PortState.CLOSED, PortState.OPEN)
+    assert closed == Change("10.0.0.2", 25, PortState.OPEN, PortState.FILTERED)
+    assert new == Change("10.0.0.3", 443, None, PortState.OPEN)
+    assert differ.changes == [opened, closed, new]
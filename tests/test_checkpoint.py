@@ -0,0 +1,69 @@
+import pytest
+from port_scanner.checkpoint import HEADER, Checkpoint
+from port_scanner.targets import TargetSpec
+
+
+@pytest.fixture
+def targets():
+    return TargetSpec.parse("10.0.0.1-3,10.0.0.9", "22,80-81")
+
+
+def test_create_and_mark(tmp_path, targets):
+    with Checkpoint.create(tmp_path / "scan.ckpt", targets, seed=7) as checkpoint:
+        assert checkpoint.completed == 0
+        assert not checkpoint.done("10.0.0.9", 81)
+        checkpoint.mark("10.0.0.9", 81)
+        checkpoint.mark("10.0.0.9", 81)
+        assert checkpoint.done("10.0.0.9", 81)
+        assert not checkpoint.done("10.0.0.9", 80)
+        assert checkpoint.completed == 1
+
+
+def test_open_restores_progress(tmp_path, targets):
+    path = tmp_path / "scan.ckpt"
+    with Checkpoint.create(path, targets, seed=7, randomize=True) as checkpoint:
+        for host, port in list(targets)[::2]:
+            checkpoint.mark(host, port)
+
+    with Checkpoint.open(path) as checkpoint:
+        assert list(checkpoint.targets) == list(targets)
+        assert checkpoint.settings == {"seed": 7, "randomize": True}
+        assert checkpoint.completed == 6
+        assert list(checkpoint.pending(targets)) == list(targets)[1::2]
+
+
+def test_marks_survive_without_close(tmp_path, targets):
+    path = tmp_path / "scan.ckpt"
+    checkpoint = Checkpoint.create(path, targets)
+    checkpoint.mark("10.0.0.1", 22)
+    # another process sees the mapped pages, as after a crash
+    assert Checkpoint.open(path).done("10.0.0.1", 22)
+    checkpoint.close()
+
+
+def test_bitmap_is_compact(tmp_path):
+    targets = TargetSpec.parse("10.0.0.0/24", "all")
+    path = tmp_path / "scan.ckpt"
+    Checkpoint.create(path, targets).close()
+    assert path.stat().st_size < HEADER.size + 100 + len(targets) // 8 + 1
+
+
+def test_mark_unknown_target(tmp_path, targets):
+    with Checkpoint.create(tmp_path / "scan.ckpt", targets) as checkpoint, pytest.raises(ValueError):
+        checkpoint.mark("10.0.0.4", 22)
+
+
+@pytest.mark.parametrize("data", [b"", b"PSCK", b"NOPE" + bytes(HEADER.size)])
+def test_open_not_a_checkpoint(tmp_path, data):
+    path = tmp_path / "scan.ckpt"
+    path.write_bytes(data)
+    with pytest.raises(ValueError, match="not a checkpoint file"):
+        Checkpoint.open(path)
+
+
+def test_open_truncated(tmp_path, targets):
+    path = tmp_path / "scan.ckpt"
+    Checkpoint.create(path, targets).close()
+    path.write_bytes(path.read_bytes()[:-1])
+    with pytest.raises(ValueError, match="truncated"):
+        Checkpoint.open(path)
@@ -1,4 +1,7 @@
 # Mock function for testing
+import asyncio
+import itertools
+import threading
 import time
 
 from port_scanner.decorators import rate_limit
@@ -42,3 +45,39 @@ def test_rate_limit_decorator_multiple_functions():
     test_function_2()
     elapsed_time = time.time() - start_time
     assert elapsed_time > 2
+
+
+def test_rate_limit_decorator_coroutine():
+    @rate_limit(interval=0.2)
+    async def test_coroutine():
+        return "Test"
+
+    async def call_twice():
+        return [await test_coroutine(), await test_coroutine()]
+
+    start_time = time.time()
+    assert asyncio.run(call_twice()) == ["Test", "Test"]
+    assert time.time() - start_time >= 0.2
+
+
+def test_rate_limit_decorator_threads():
+    calls = []
+
+    @rate_limit(interval=0.1)
+    def test_function():
+        calls.append(time.monotonic())
+
+    threads = [threading.Thread(target=test_function) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    calls.sort()
+    assert all(later - earlier >= 0.09 for earlier, later in itertools.pairwise(calls))
+
+
+def test_rate_limit_decorator_without_interval():
+    def test_function():
+        return "Test"
+
+    assert rate_limit(interval=0)(test_function) is test_function
@@ -0,0 +1,113 @@
+import queue
+import struct
+
+import pytest
+from port_scanner.discovery import IcmpPinger, discover, echo_request, parse_echo_reply
+from port_scanner.syn_scanner import TCP_ACK, TCP_SYN
+from port_scanner.timing import HostTimings
+from scapy.all import ICMP, IP  # type: ignore
+
+
+class FakeIcmpSocket:
+    """Stands in for an ICMP socket, answering echo requests to `up` hosts like a raw or datagram socket would."""
+
+    def __init__(self, up=(), *, raw=True, drop_first=0):
+        self.up = set(up)
+        self.raw = raw
+        self.drop_first = drop_first
+        self.sent = []
+        self.replies = queue.SimpleQueue()
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def sendto(self, data, address):
+        self.sent.append((bytes(data), address))
+        if len(self.sent) <= self.drop_first or address[0] not in self.up:
+            return
+        _, _, _, ident, seq = struct.unpack("!BBHHH", data)
+        reply = ICMP(type=0, id=ident, seq=seq)
+        if self.raw:
+            reply = IP(src=address[0], dst="127.0.0.1") / reply
+        self.replies.put((bytes(reply), address))
+
+    def recvfrom(self, _):
+        try:
+            return self.replies.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError from None
+
+
+def test_echo_request_matches_scapy():
+    assert echo_request(0x1234, 7) == bytes(ICMP(type=8, id=0x1234, seq=7))
+
+
+def test_parse_echo_reply_with_and_without_ip_header():
+    reply = ICMP(type=0, id=1, seq=2)
+    assert parse_echo_reply(bytes(reply)) == (1, 2, False)
+    assert parse_echo_reply(bytes(IP(src="10.0.0.2", dst="10.0.0.1") / reply)) == (1, 2, True)
+
+
+def test_parse_echo_reply_ignores_other_messages():
+    assert parse_echo_reply(b"") is None
+    assert parse_echo_reply(bytes(ICMP(type=8, id=1, seq=2))) is None
+    assert parse_echo_reply(bytes(IP() / ICMP(type=3, code=1))) is None
+
+
+@pytest.mark.parametrize("raw", [True, False])
+def test_pinger_reports_up_and_down_hosts(raw):
+    sock = FakeIcmpSocket(up=["10.0.0.1", "10.0.0.3"], raw=raw)
+    pinger = IcmpPinger(timeout=0.05, retries=1, sock=sock)  # type: ignore
+    results = dict(pinger.ping(["10.0.0.1", "10.0.0.2", "10.0.0.3"]))
+    assert results.keys() == {"10.0.0.1", "10.0.0.2", "10.0.0.3"}
+    assert results["10.0.0.1"] is not None
+    assert results["10.0.0.2"] is None
+    assert results["10.0.0.3"] is not None
+    # only the silent host is retried
+    assert [address[0] for _, address in sock.sent].count("10.0.0.2") == 2
+
+
+def test_pinger_yields_live_hosts_first():
+    sock = FakeIcmpSocket(up=["10.0.0.2"])
+    results = list(IcmpPinger(timeout=0.05, retries=0, sock=sock).ping(["10.0.0.1", "10.0.0.2"]))  # type: ignore
+    assert [host for host, _ in results] == ["10.0.0.2", "10.0.0.1"]
+
+
+def test_pinger_retransmits_lost_requests():
+    sock = FakeIcmpSocket(up=["10.0.0.1"], drop_first=1)
+    timings = HostTimings()
+    results = dict(IcmpPinger(timeout=0.05, retries=1, timings=timings, sock=sock).ping(["10.0.0.1"]))  # type: ignore
+    assert results["10.0.0.1"] is not None
+    assert len(sock.sent) == 2
+    # the reply to a retransmission isn't an rtt sample
+    assert timings.estimate("10.0.0.1") is None
+
+
+def test_pinger_ignores_other_pings():
+    pinger = IcmpPinger(sock=FakeIcmpSocket())  # type: ignore
+    pinger._pending["10.0.0.1"] = (0.0, 0)
+    seq = pinger.cookie("10.0.0.1")
+    pinger.handle_reply(bytes(IP(src="10.0.0.1") / ICMP(type=0, id=pinger.ident ^ 1, seq=seq)), "10.0.0.1")
+    pinger.handle_reply(bytes(IP(src="10.0.0.1") / ICMP(type=0, id=pinger.ident, seq=seq ^ 1)), "10.0.0.1")
+    assert pinger._pending
+    pinger.handle_reply(bytes(IP(src="10.0.0.1") / ICMP(type=0, id=pinger.ident, seq=seq)), "10.0.0.1")
+    assert not pinger._pending
+
+
+def test_discover_falls_back_to_tcp_pings(mocker):
+    pinger = mocker.patch("port_scanner.discovery.IcmpPinger")
+    pinger.return_value.ping.side_effect = lambda *_: [("10.0.0.1", 0.1), ("10.0.0.2", None), ("10.0.0.3", None)]
+    answers = {TCP_SYN: [("10.0.0.2", 0.2)], TCP_ACK: []}
+    tcp_ping = mocker.patch("port_scanner.discovery.tcp_ping", side_effect=lambda *_, flags, **__: answers[flags])
+
+    results = list(discover(["10.0.0.1", "10.0.0.2", "10.0.0.3"], ack_ports=[80], report_down=True))
+    assert results == [("10.0.0.1", 0.1), ("10.0.0.2", 0.2), ("10.0.0.3", None)]
+    assert tcp_ping.call_args_list[0].args == (["10.0.0.2", "10.0.0.3"], (80, 443))
+    assert tcp_ping.call_args_list[1].args == (["10.0.0.3"], (80,))
+
+
+def test_discover_without_icmp(mocker):
+    pinger = mocker.patch("port_scanner.discovery.IcmpPinger")
+    mocker.patch("port_scanner.discovery.tcp_ping", return_value=[("10.0.0.1", 0.1)])
+    assert list(discover(["10.0.0.1", "10.0.0.2"], icmp=False)) == [("10.0.0.1", 0.1)]
+    pinger.assert_not_called()
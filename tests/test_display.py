@@ -0,0 +1,61 @@
+from port_scanner.display import ScanView
+from port_scanner.networking import PortState, ProbeResult
+from rich.console import Console
+
+
+def _result(port, state):
+    return ProbeResult("10.0.0.1", port, state, 0.001)
+
+
+def test_view_counts_results():
+    view = ScanView(total=10)
+    for port, state in [(1, PortState.OPEN), (2, PortState.CLOSED), (3, PortState.CLOSED), (4, PortState.FILTERED)]:
+        view.add(_result(port, state))
+    assert view.completed == 4
+    assert view.counts == {PortState.OPEN: 1, PortState.CLOSED: 2, PortState.FILTERED: 1}
+    assert list(view.open_ports) == [_result(1, PortState.OPEN)]
+    assert "4/10 probes" in view.summary()
+    assert "open 1, closed 2, filtered 1" in view.summary()
+
+
+def test_view_keeps_only_the_latest_open_ports():
+    view = ScanView(max_rows=3)
+    for port in range(1, 101):
+        view.add(_result(port, PortState.OPEN))
+    assert [result.port for result in view.open_ports] == [98, 99, 100]
+    console = Console(width=100, record=True)
+    console.print(view)
+    output = console.export_text()
+    assert "│ 10.0.0.1 │ 100  │" in output
+    assert "│ 10.0.0.1 │ 97" not in output
+    assert "100/? probes" in output
+
+
+def test_view_rate_and_eta(mocker):
+    clock = mocker.patch("port_scanner.display.time.monotonic", return_value=100.0)
+    view = ScanView(total=300)
+    clock.return_value = 102.0
+    for port in range(100):
+        view.add(_result(port, PortState.CLOSED))
+    rate = view.rate()
+    assert rate == 50
+    assert view.eta(rate) == 4
+    assert "ETA 0:00:04" in view.summary()
+
+
+def test_view_rate_forgets_old_samples(mocker):
+    clock = mocker.patch("port_scanner.display.time.monotonic", return_value=0.0)
+    view = ScanView()
+    for second in range(1, 60):
+        clock.return_value = float(second)
+        view.add(_result(second, PortState.CLOSED))
+        view.rate()
+    assert len(view._samples) <= 7
+    assert view.rate() == 1
+
+
+def test_view_eta_unknown():
+    view = ScanView()
+    assert view.eta(100) is None
+    assert view.eta(0) is None
+    assert "ETA ?" in view.summary()
@@ -0,0 +1,241 @@
+import contextlib
+import socket
+import threading
+import time
+
+import pytest
+from port_scanner import distributed
+from port_scanner.distributed import (
+    DONE,
+    HELLO,
+    JOB,
+    REQUEST,
+    Coordinator,
+    _Link,
+    _parse_address,
+    run_worker,
+)
+from port_scanner.networking import PortState
+from port_scanner.output import RECORD
+from port_scanner.parallel import RESULTS, STATS
+from port_scanner.targets import TargetSpec
+from port_scanner.timing import HostTimings
+
+_LOCALHOST = "127.0.0.1"
+
+
+@pytest.fixture
+def listener():
+    with socket.socket() as sock:
+        sock.bind((_LOCALHOST, 0))
+        sock.listen()
+        yield sock.getsockname()[1]
+
+
+def _coordinator(port, **kwargs):
+    return Coordinator(
+        TargetSpec.parse(_LOCALHOST, f"{port - 10}-{port + 10}"),
+        address=(_LOCALHOST, 0),
+        retries=0,
+        timings=HostTimings(min_timeout=0.1, max_timeout=1.0),
+        **kwargs,
+    )
+
+
+def _start_workers(address, count):
+    workers = [threading.Thread(target=run_worker, args=(address,), kwargs={"name": f"w{i}"}) for i in range(count)]
+    for worker in workers:
+        worker.start()
+    return workers
+
+
+def test_parse_address():
+    assert _parse_address("10.0.0.1:8000") == ("10.0.0.1", 8000)
+    assert _parse_address("10.0.0.1") == ("10.0.0.1", distributed.DEFAULT_PORT)
+    assert _parse_address(":8000") == (distributed.DEFAULT_HOST, 8000)
+    with pytest.raises(ValueError, match="host:port"):
+        _parse_address("10.0.0.1:http")
+
+
+def test_coordinator_checks_arguments():
+    targets = TargetSpec.parse(_LOCALHOST, "1")
+    with pytest.raises(ValueError, match="pieces"):
+        Coordinator(targets, address=(_LOCALHOST, 0), pieces=0)
+    with pytest.raises(ValueError, match="lease"):
+        Coordinator(targets, address=(_LOCALHOST, 0), lease=0)
+    with pytest.raises(ValueError, match="max_failures"):
+        Coordinator(targets, address=(_LOCALHOST, 0), max_failures=0)
+
+
+def test_workers_scan_every_target_once(listener):
+    with _coordinator(listener, pieces=5, randomize=True, seed=1) as coordinator:
+        workers = _start_workers(coordinator.listening, 2)
+        results = list(coordinator)
+        for worker in workers:
+            worker.join()
+    assert sorted(result.port for result in results) == list(range(listener - 10, listener + 11))
+    assert [result.port for result in results if result.state == PortState.OPEN] == [listener]
+
+
+def test_piece_of_a_dead_worker_is_reassigned(listener):
+    # shorter than the wait of a worker that finds every piece leased, which mustn't cost it its connection
+    with _coordinator(listener, pieces=2, lease=distributed.WAIT_INTERVAL / 3) as coordinator:
+        # a worker that takes a piece and goes silent
+        with socket.create_connection(coordinator.listening) as sock:
+            link = _Link(sock)
+            link.send(HELLO, b"silent")
+            link.send(REQUEST)
+            kind, _ = link.receive()
+            assert kind == JOB
+            workers = _start_workers(coordinator.listening, 1)
+            results = list(coordinator)
+        workers[0].join()
+        assert coordinator.reassigned == 1
+    assert len(results) == len({(result.host, result.port) for result in results}) == 21
+
+
+def test_results_of_a_reassigned_piece_are_reported_once(listener):
+    with _coordinator(listener, pieces=1, lease=0.5) as coordinator:
+        with socket.create_connection(coordinator.listening) as sock:
+            link = _Link(sock)
+            link.send(REQUEST)
+            link.receive()
+            # scan the piece without reporting it done
+            sender = distributed.BatchSender(link)
+            distributed.scan_shard(coordinator.jobs[0], sender)
+            sender.flush()
+        workers = _start_workers(coordinator.listening, 1)
+        results = list(coordinator)
+        workers[0].join()
+    assert len(results) == 21
+    assert coordinator.reassigned == 1
+
+
+def test_done_from_a_worker_without_the_lease_is_ignored(listener):
+    with _coordinator(listener, pieces=1) as coordinator:
+        with socket.create_connection(coordinator.listening) as sock:
+            link = _Link(sock)
+            link.send(DONE, distributed.PIECE.pack(0))
+            link.send(REQUEST)
+            kind, _ = link.receive()
+            assert kind == JOB
+            assert not coordinator.finished
+
+
+def test_results_without_a_lease_are_ignored(listener):
+    with _coordinator(listener, pieces=1) as coordinator:
+        with socket.create_connection(coordinator.listening) as sock:
+            link = _Link(sock)
+            link.send(RESULTS, RECORD.pack(socket.inet_aton(_LOCALHOST), listener, PortState.OPEN, 0.0))
+            link.send(REQUEST)
+            assert link.receive()[0] == JOB
+        workers = _start_workers(coordinator.listening, 1)
+        results = list(coordinator)
+        workers[0].join()
+    assert len(results) == 21
+
+
+@pytest.mark.parametrize(
+    ("kind", "payload"),
+    [
+        (RESULTS, b"\x00" * (RECORD.size - 1)),
+        (RESULTS, RECORD.pack(socket.inet_aton(_LOCALHOST), 1, 0xFF, 0.0)),
+        (RESULTS, RECORD.pack(socket.inet_aton("10.0.0.1"), 1, PortState.OPEN, 0.0)),
+        (STATS, b"[{"),
+        (STATS, b'[{"kind": "meter"}]'),
+    ],
+    ids=["truncated", "unknown state", "not a target", "stats not json", "not stats"],
+)
+def test_malformed_messages_drop_the_worker(listener, kind, payload):
+    with _coordinator(listener, pieces=1) as coordinator:
+        with socket.create_connection(coordinator.listening) as sock:
+            link = _Link(sock)
+            link.send(REQUEST)
+            assert link.receive()[0] == JOB
+            link.send(kind, payload)
+            assert sock.recv(1) == b""
+        workers = _start_workers(coordinator.listening, 1)
+        results = list(coordinator)
+        workers[0].join()
+    assert coordinator.reassigned == 1
+    assert len(results) == 21
+
+
+def test_worker_errors_end_the_scan(mocker, listener):
+    mocker.patch.object(distributed, "scan_shard", side_effect=OSError("no route"))
+    with _coordinator(listener, pieces=2) as coordinator:
+        errors = []
+
+        def _work():
+            try:
+                run_worker(coordinator.listening, name="broken")
+            except OSError as e:
+                errors.append(e)
+
+        worker = threading.Thread(target=_work)
+        worker.start()
+        with pytest.raises(RuntimeError, match=r"broken .* failed: OSError: no route"):
+            list(coordinator)
+        worker.join()
+    assert len(errors) == 1
+
+
+def test_failing_worker_is_dropped_while_others_scan(mocker, listener):
+    scan_shard = distributed.scan_shard
+    failed = threading.Event()
+
+    def _scan_shard(job, sender):
+        if threading.current_thread().name == "broken":
+            failed.set()
+            msg = "Operation not permitted"
+            raise PermissionError(msg)
+        # keep the healthy worker connected until the other one failed
+        failed.wait(5)
+        scan_shard(job, sender)
+
+    mocker.patch.object(distributed, "scan_shard", side_effect=_scan_shard)
+    with _coordinator(listener, pieces=4) as coordinator:
+        (healthy,) = _start_workers(coordinator.listening, 1)
+        while not coordinator.leases:
+            time.sleep(0.01)
+        errors = []
+
+        def _work():
+            try:
+                run_worker(coordinator.listening, name="broken")
+            except PermissionError as e:
+                errors.append(e)
+
+        broken = threading.Thread(target=_work, name="broken")
+        broken.start()
+        results = list(coordinator)
+        broken.join()
+        healthy.join()
+    assert len(results) == 21
+    assert len(errors) == 1
+    assert list(coordinator.failed.values()) == ["PermissionError: Operation not permitted"]
+    assert coordinator.reassigned == 1
+
+
+def test_piece_failing_on_every_worker_ends_the_scan(mocker, listener):
+    mocker.patch.object(distributed, "scan_shard", side_effect=OSError("no route"))
+    with _coordinator(listener, pieces=1, max_failures=1) as coordinator:
+        # a second worker that is connected but never asks for a piece
+        with socket.create_connection(coordinator.listening):
+
+            def _work():
+                with contextlib.suppress(OSError):
+                    run_worker(coordinator.listening)
+
+            worker = threading.Thread(target=_work)
+            worker.start()
+            with pytest.raises(RuntimeError, match="failed: OSError: no route"):
+                list(coordinator)
+            worker.join()
+
+
+def test_worker_finishes_when_there_is_nothing_to_scan():
+    with Coordinator(TargetSpec.parse(_LOCALHOST, "1"), address=(_LOCALHOST, 0), pieces=1) as coordinator:
+        coordinator.complete(0)
+        assert list(coordinator) == []
+        assert run_worker(coordinator.listening) == 0
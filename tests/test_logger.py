@@ -0,0 +1,129 @@
+import logging
+import re
+import threading
+from pathlib import Path
+
+import pytest
+from port_scanner.logger import LOG_FORMAT, LogWriter, ResultLog, ResultLogger, get_logger
+from port_scanner.networking import PortState, ProbeResult
+
+_OPEN = ProbeResult("10.0.0.1", 22, PortState.OPEN, 0.001)
+_CLOSED = ProbeResult("10.0.0.1", 23, PortState.CLOSED, 0.001)
+
+
+@pytest.fixture
+def logger():
+    logger = logging.getLogger("port_scanner.tests")
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    yield logger
+    for handler in logger.handlers[:]:
+        logger.removeHandler(handler)
+
+
+@pytest.fixture
+def writer(tmp_path, logger):
+    writer = LogWriter(str(tmp_path / "scan.log"), logging.Formatter(LOG_FORMAT))
+    writer.start()
+    logger.addHandler(writer.handler)
+    yield writer
+    writer.stop()
+
+
+def _lines(writer):
+    writer.stop()
+    path = Path(writer.filename)
+    return path.read_text(encoding="utf-8").splitlines() if path.exists() else []
+
+
+def test_writer_writes_records_and_results(writer, logger):
+    logger.warning("starting %s", "scan")
+    writer.write_result(_OPEN)
+    lines = _lines(writer)
+    assert re.fullmatch(r"WARNING \d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3} \[test_logger.py:.*\] starting scan", lines[0])
+    assert re.fullmatch(r"INFO \d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3} \[results\] port 22 on 10.0.0.1 is open", lines[1])
+
+
+def test_writer_creates_the_file_on_the_first_record(writer):
+    writer.stop()
+    assert not Path(writer.filename).exists()
+
+
+def test_file_handler_creates_the_file_on_the_first_record(tmp_path):
+    before = set(logging.getLogger("port_scanner.logger").handlers)
+    logger = get_logger(str(tmp_path / "scan.log"), background=False)
+    (handler,) = set(logger.handlers) - before
+    logger.removeHandler(handler)
+    assert not (tmp_path / "scan.log").exists()
+    handler.close()
+
+
+def test_writer_drops_records_when_full(tmp_path):
+    writer = LogWriter(str(tmp_path / "scan.log"), logging.Formatter(LOG_FORMAT), maxsize=2)
+    # not started, so nothing is taken off the queue
+    for _ in range(5):
+        writer.write_result(_CLOSED)
+    assert writer.dropped == 3
+    assert writer.queue.qsize() == 2
+
+
+def test_writer_counts_drops_from_every_thread(tmp_path):
+    writer = LogWriter(str(tmp_path / "scan.log"), logging.Formatter(LOG_FORMAT), maxsize=0)
+
+    def _write():
+        for _ in range(10_000):
+            writer.write_result(_CLOSED)
+
+    threads = [threading.Thread(target=_write) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert writer.dropped == 40_000
+
+
+def test_writer_stop_flushes_everything(writer):
+    for _ in range(1000):
+        writer.write_result(_CLOSED)
+    assert len(_lines(writer)) == 1000
+
+
+@pytest.mark.parametrize(
+    ("mode", "expected"),
+    [(ResultLog.ALL, ["22", "23"]), (ResultLog.OPEN, ["22"]), (ResultLog.NONE, [])],
+)
+def test_result_logger_modes(writer, logger, mode, expected):
+    log = ResultLogger(logger, mode)
+    log(_OPEN)
+    log(_CLOSED)
+    log.close()
+    assert [line.split()[5] for line in _lines(writer)] == expected
+
+
+def test_result_logger_samples_summaries(writer, logger, mocker):
+    clock = mocker.patch("port_scanner.logger.time.monotonic", return_value=0.0)
+    summaries = iter(range(100))
+    log = ResultLogger(logger, ResultLog.SUMMARY, summary=lambda: f"summary {next(summaries)}", interval=10)
+    for second in range(25):
+        clock.return_value = float(second)
+        log(_CLOSED)
+    log.close()
+    assert [line.split(maxsplit=4)[4] for line in _lines(writer)] == ["summary 0", "summary 1", "summary 2"]
+
+
+def test_result_logger_without_background_writer(tmp_path, logger):
+    handler = logging.FileHandler(tmp_path / "scan.log")
+    logger.addHandler(handler)
+    ResultLogger(logger)(_OPEN)
+    handler.close()
+    assert (tmp_path / "scan.log").read_text().strip() == "port 22 on 10.0.0.1 is open"
+
+
+def test_get_logger_background(tmp_path):
+    before = set(logging.getLogger("port_scanner.logger").handlers)
+    logger = get_logger(str(tmp_path / "scan.log"))
+    (handler,) = set(logger.handlers) - before
+    logger.removeHandler(handler)
+    logger.info("not logged anymore")
+    handler.writer.write_result(_OPEN)
+    assert len(_lines(handler.writer)) == 1
@@ -0,0 +1,156 @@
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+from port_scanner import metrics
+from port_scanner.metrics import Counter, Gauge, Histogram, Metrics, StatsDumper, serve_metrics
+
+
+def test_counter_counts():
+    counter = Counter("probes", "probes sent")
+    counter.inc()
+    counter.inc(2)
+    assert counter.snapshot() == 3
+    counter.reset()
+    assert counter.value == 0
+
+
+def test_gauge_keeps_its_peak():
+    gauge = Gauge("depth", "queue depth")
+    for value in (3, 7, 2):
+        gauge.set(value)
+    assert gauge.snapshot() == {"value": 2, "peak": 7}
+
+
+def test_histogram_quantiles_within_their_bucket():
+    histogram = Histogram("latency", "seconds", buckets=(0.001, 0.01, 0.1))
+    for _ in range(90):
+        histogram.observe(0.0005)
+    for _ in range(10):
+        histogram.observe(0.05)
+    assert histogram.count == 100
+    assert histogram.sum == pytest.approx(0.545)
+    assert 0 < histogram.quantile(0.5) <= 0.001
+    assert 0.01 < histogram.quantile(0.99) <= 0.1
+
+
+def test_histogram_without_values():
+    assert Histogram("latency", "seconds").quantile(0.99) == 0.0
+
+
+def test_histogram_above_the_highest_bucket():
+    histogram = Histogram("latency", "seconds", buckets=(0.001,))
+    histogram.observe(5.0)
+    assert histogram.quantile(0.5) > 0.001
+
+
+def test_registry_returns_the_same_metric():
+    registry = Metrics()
+    assert registry.counter("sent", "probes") is registry.counter("sent", "probes")
+    assert registry.histogram("stage", "seconds", stage="a") is not registry.histogram("stage", "seconds", stage="b")
+
+
+def test_registry_rejects_another_kind():
+    registry = Metrics()
+    registry.counter("sent", "probes")
+    with pytest.raises(ValueError, match="already registered as a counter"):
+        registry.gauge("sent", "probes")
+
+
+def test_registry_snapshot_and_reset():
+    registry = Metrics()
+    registry.counter("sent", "probes").inc(5)
+    registry.histogram("stage_seconds", "seconds", stage="connect").observe(0.002)
+    snapshot = registry.snapshot()
+    assert snapshot["sent"] == 5
+    assert snapshot["stage_seconds{stage=connect}"]["count"] == 1
+    registry.reset()
+    assert registry.snapshot()["sent"] == 0
+
+
+def test_registry_prometheus_format():
+    registry = Metrics()
+    registry.counter("sent", "probes sent").inc(3)
+    registry.gauge("queue_depth", "items", queue="log").set(4)
+    histogram = registry.histogram("stage_seconds", "seconds", stage="connect")
+    histogram.observe(0.5)
+    text = registry.prometheus()
+    assert "# HELP port_scanner_sent probes sent\n# TYPE port_scanner_sent counter\nport_scanner_sent 3\n" in text
+    assert 'port_scanner_queue_depth{queue="log"} 4\n' in text
+    assert 'port_scanner_stage_seconds_bucket{stage="connect",le="+Inf"} 1\n' in text
+    assert 'port_scanner_stage_seconds_count{stage="connect"} 1\n' in text
+    assert text.count("# TYPE port_scanner_stage_seconds histogram") == 1
+
+
+def test_registry_export_and_merge():
+    worker = Metrics()
+    worker.counter("sent", "probes").inc(3)
+    worker.gauge("queue_depth", "items", queue="log").set(4)
+    worker.histogram("stage_seconds", "seconds", stage="connect").observe(0.002)
+    parent = Metrics()
+    parent.counter("sent", "probes").inc(2)
+    for _ in range(2):
+        parent.merge(json.loads(json.dumps(worker.export(reset=True))))
+    snapshot = parent.snapshot()
+    assert snapshot["sent"] == 5
+    assert snapshot["queue_depth{queue=log}"] == {"value": 4, "peak": 4}
+    assert snapshot["stage_seconds{stage=connect}"]["count"] == 1
+    # what was exported with a reset is only merged once
+    assert worker.snapshot()["sent"] == 0
+
+
+@pytest.mark.parametrize(
+    "exported",
+    [
+        [{"kind": "meter", "name": "sent", "description": "", "labels": {}, "values": 1}],
+        [{"kind": "counter", "name": "sent", "description": "", "labels": [], "values": 1}],
+        [{"kind": "histogram", "name": "stage", "description": "", "labels": {}, "values": [[1], 1, 0.1]}],
+        [{"kind": "gauge", "name": "sent", "description": "", "labels": {}, "values": [1, 1]}],
+    ],
+    ids=["unknown kind", "bad labels", "other buckets", "other kind"],
+)
+def test_registry_merge_rejects_garbage(exported):
+    registry = Metrics()
+    registry.counter("sent", "probes")
+    with pytest.raises((KeyError, ValueError)):
+        registry.merge(exported)
+
+
+def test_stages_share_a_histogram_name():
+    assert metrics.stage("connect").labels == {"stage": "connect"}
+    assert metrics.stage("connect") is metrics.stage("connect")
+
+
+def test_stats_dumper_appends_lines(tmp_path):
+    registry = Metrics()
+    registry.counter("sent", "probes").inc()
+    path = tmp_path / "stats.jsonl"
+    with StatsDumper(path, interval=0.01, metrics=registry) as dumper:
+        dumper.dump()
+        registry.counter("sent", "probes").inc()
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(lines) >= 2
+    assert lines[0]["metrics"] == {"sent": 1}
+    assert lines[-1]["metrics"] == {"sent": 2}
+
+
+def test_stats_dumper_needs_positive_interval(tmp_path):
+    with pytest.raises(ValueError, match="positive"):
+        StatsDumper(tmp_path / "stats.jsonl", interval=0)
+
+
+def test_serve_metrics():
+    registry = Metrics()
+    registry.counter("sent", "probes").inc(2)
+    server = serve_metrics(0, metrics=registry)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        with urllib.request.urlopen(f"{url}/metrics", timeout=5) as response:  # noqa: S310
+            assert response.status == 200
+            assert "port_scanner_sent 2" in response.read().decode()
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"{url}/other", timeout=5)  # noqa: S310
+    finally:
+        server.shutdown()
+        server.server_close()
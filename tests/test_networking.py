@@ -1,9 +1,31 @@
+import asyncio
+import random
 import socket
+import threading
+import time
 
 import hypothesis.strategies as st
 import pytest
 from hypothesis import given
-from port_scanner.networking import arp_scan, is_ip_address, is_port_open, ping, tcp_syn_scan
+from port_scanner.arp import ArpReply
+from port_scanner.networking import (
+    PortState,
+    ProbeResult,
+    arp_scan,
+    async_is_port_open,
+    async_probe,
+    is_ip_address,
+    is_port_open,
+    ping,
+    ping_rtt,
+    probe,
+    scan_ports,
+    scan_targets,
+    scan_threads,
+    tcp_syn_scan,
+)
+from port_scanner.ratelimit import RateLimiter
+from port_scanner.timing import HostTimings
 from scapy.all import TCP  # type: ignore
 
 
@@ -55,6 +77,87 @@ def test_is_port_open_localhost_open_port(mocker):
     assert is_port_open("127.0.0.1", 20)
 
 
+def test_probe_closes_socket(mocker):
+    mock_socket = mocker.MagicMock(spec=socket.socket)
+    mock_socket.connect.side_effect = TimeoutError()
+    mocker.patch("socket.socket", return_value=mock_socket)
+    assert probe("127.0.0.1", 80, timeout=0.5).state is PortState.FILTERED
+    mock_socket.settimeout.assert_called_once_with(0.5)
+    mock_socket.close.assert_called_once()
+
+
+def test_probe_connection_refused_is_closed(mocker):
+    mock_socket = mocker.MagicMock(spec=socket.socket)
+    mock_socket.connect.side_effect = ConnectionRefusedError()
+    mocker.patch("socket.socket", return_value=mock_socket)
+    result = probe("127.0.0.1", 80)
+    assert result.state is PortState.CLOSED
+    assert not result.is_open
+    mock_socket.close.assert_called_once()
+
+
+def test_probe_localhost(listening_port, unused_port):
+    assert probe("127.0.0.1", listening_port) == (
+        "127.0.0.1",
+        listening_port,
+        PortState.OPEN,
+        pytest.approx(0, abs=0.1),
+    )
+    closed = probe("127.0.0.1", unused_port, timeout=5)
+    assert closed.state is PortState.CLOSED
+    # a RST resolves right away instead of waiting out the timeout
+    assert closed.latency < 1
+
+
+def test_probe_retries_filtered_ports(mocker):
+    mock_socket = mocker.MagicMock(spec=socket.socket)
+    mock_socket.connect.side_effect = [TimeoutError(), TimeoutError(), None]
+    mocker.patch("socket.socket", return_value=mock_socket)
+    assert probe("127.0.0.1", 80, retries=1).state is PortState.FILTERED
+    assert probe("127.0.0.1", 80, retries=1).state is PortState.OPEN
+    assert mock_socket.close.call_count == 3
+
+
+def test_probe_acquires_rate_limit_for_every_attempt(mocker):
+    mock_socket = mocker.MagicMock(spec=socket.socket)
+    mock_socket.connect.side_effect = TimeoutError()
+    mocker.patch("socket.socket", return_value=mock_socket)
+    limiter = mocker.MagicMock()
+    probe("127.0.0.1", 80, retries=2, limiter=limiter)
+    assert limiter.acquire.call_args_list == [mocker.call("127.0.0.1")] * 3
+
+
+def test_probe_adapts_timeout_to_host(mocker):
+    timings = HostTimings()
+    timings.update("127.0.0.1", 0.002)
+    expected_timeout = timings.timeout("127.0.0.1")
+    connect = mocker.patch(
+        "port_scanner.networking._connect", return_value=ProbeResult("127.0.0.1", 80, PortState.CLOSED, 0.02)
+    )
+    probe("127.0.0.1", 80, timings=timings)
+    connect.assert_called_once_with("127.0.0.1", 80, expected_timeout, None)
+    # the answer refined the estimate
+    assert timings.estimate("127.0.0.1").srtt > 0.002  # type: ignore
+
+
+@pytest.mark.parametrize(
+    ("output", "expected"),
+    [
+        ("64 bytes from 10.0.0.1: icmp_seq=1 ttl=64 time=0.045 ms", 0.000045),
+        ("Reply from 10.0.0.1: bytes=32 time<1ms TTL=128", 0.001),
+        ("Reply from 10.0.0.1: bytes=32 time=12ms TTL=128", 0.012),
+    ],
+)
+def test_ping_rtt_parses_output(mocker, output, expected):
+    mocker.patch("subprocess.run", return_value=mocker.MagicMock(returncode=0, stdout=output))
+    assert ping_rtt("10.0.0.1") == pytest.approx(expected)
+
+
+def test_ping_rtt_no_answer(mocker):
+    mocker.patch("subprocess.run", return_value=mocker.MagicMock(returncode=1, stdout=""))
+    assert ping_rtt("10.0.0.1") is None
+
+
 def test_is_port_open_invalid_ip():
     with pytest.raises(ValueError):
         is_port_open("invalid", 20)
@@ -72,19 +175,217 @@ def test_is_port_open_port_not_in_range():
         is_port_open("127.0.0.1", 100000)
 
 
+@pytest.fixture
+def listening_port():
+    with socket.socket() as server:
+        server.bind(("127.0.0.1", 0))
+        server.listen()
+        yield server.getsockname()[1]
+
+
+@pytest.fixture
+def unused_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_async_is_port_open_localhost(listening_port, unused_port):
+    assert asyncio.run(async_is_port_open("127.0.0.1", listening_port))
+    assert not asyncio.run(async_is_port_open("127.0.0.1", unused_port))
+
+
+def test_async_probe_localhost(listening_port, unused_port):
+    assert asyncio.run(async_probe("127.0.0.1", listening_port)).state is PortState.OPEN
+    assert asyncio.run(async_probe("127.0.0.1", unused_port)).state is PortState.CLOSED
+
+
+def test_async_is_port_open_timeout(mocker):
+    async def never_connects(*_):
+        await asyncio.sleep(10)
+
+    mocker.patch("asyncio.selector_events.BaseSelectorEventLoop.sock_connect", never_connects)
+    assert asyncio.run(async_probe("127.0.0.1", 80, timeout=0.01)).state is PortState.FILTERED
+
+
+def test_async_probe_closes_the_socket_when_cancelled(mocker):
+    sockets = []
+
+    async def never_connects(_, sock, __):
+        sockets.append(sock)
+        await asyncio.sleep(10)
+
+    mocker.patch("asyncio.selector_events.BaseSelectorEventLoop.sock_connect", never_connects)
+
+    async def cancel():
+        task = asyncio.create_task(async_probe("127.0.0.1", 80, timeout=5))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel())
+    assert sockets[0].fileno() == -1
+
+
+def test_scan_ports_streams_every_port(listening_port, unused_port):
+    async def collect():
+        return [result async for result in scan_ports("127.0.0.1", [listening_port, unused_port], concurrency=2)]
+
+    results = {result.port: result.state for result in asyncio.run(collect())}
+    assert results == {listening_port: PortState.OPEN, unused_port: PortState.CLOSED}
+
+
+def test_probe_hands_open_connections_over(listening_port, unused_port):
+    handed = []
+    probe("127.0.0.1", listening_port, on_open=lambda result, sock: handed.append((result, sock)))
+    probe("127.0.0.1", unused_port, on_open=lambda result, sock: handed.append((result, sock)))
+    assert [result.port for result, _ in handed] == [listening_port]
+    sock = handed[0][1]
+    assert sock.fileno() != -1
+    assert sock.getpeername() == ("127.0.0.1", listening_port)
+    sock.close()
+
+
+def test_scan_targets_hands_open_connections_over(listening_port, unused_port):
+    handed = []
+
+    async def collect():
+        targets = [("127.0.0.1", listening_port), ("127.0.0.1", unused_port)]
+        return [
+            result
+            async for result in scan_targets(targets, concurrency=2, on_open=lambda _r, sock: handed.append(sock))
+        ]
+
+    assert len(asyncio.run(collect())) == 2
+    assert len(handed) == 1
+    assert handed[0].getpeername() == ("127.0.0.1", listening_port)
+    handed[0].close()
+
+
+def test_scan_ports_limits_concurrency(mocker):
+    in_flight = 0
+    peak = 0
+
+    async def fake_probe(host, port, *_, **__):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0)
+        in_flight -= 1
+        return ProbeResult(host, port, PortState.CLOSED, 0.0)
+
+    mocker.patch("port_scanner.networking.async_probe", fake_probe)
+
+    async def collect():
+        return [result async for result in scan_ports("127.0.0.1", range(1, 101), concurrency=10)]
+
+    assert len(asyncio.run(collect())) == 100
+    assert peak == 10
+
+
+def test_scan_threads_matches_sequential_scan(listening_port, unused_port):
+    targets = [("127.0.0.1", port) for port in (listening_port, unused_port, listening_port, unused_port)]
+    expected = [(result.port, result.state) for result in (probe(host, port) for host, port in targets)]
+    assert [(result.port, result.state) for result in scan_threads(targets, workers=3)] == expected
+
+
+def test_scan_threads_keeps_target_order(mocker):
+    def slow_probe(host, port, **_):
+        time.sleep(random.random() / 100)  # noqa: S311
+        return ProbeResult(host, port, PortState.CLOSED, 0.0)
+
+    mocker.patch("port_scanner.networking.probe", slow_probe)
+    targets = [("127.0.0.1", port) for port in range(1, 51)]
+    assert [result.port for result in scan_threads(targets, workers=8)] == list(range(1, 51))
+
+
+def test_scan_threads_bounds_submission(mocker):
+    mocker.patch("port_scanner.networking.probe", lambda host, port, **_: ProbeResult(host, port, PortState.OPEN, 0))
+    pulled = 0
+
+    def targets():
+        nonlocal pulled
+        for port in range(1, 1001):
+            pulled += 1
+            yield "127.0.0.1", port
+
+    results = scan_threads(targets(), workers=4)
+    next(results)
+    assert pulled <= 4 * 2 + 1
+    results.close()
+
+
+def test_scan_threads_limits_threads(mocker):
+    in_flight = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def fake_probe(host, port, **_):
+        nonlocal in_flight, peak
+        with lock:
+            in_flight += 1
+            peak = max(peak, in_flight)
+        time.sleep(0.005)
+        with lock:
+            in_flight -= 1
+        return ProbeResult(host, port, PortState.CLOSED, 0.0)
+
+    mocker.patch("port_scanner.networking.probe", fake_probe)
+    assert len(list(scan_threads((("127.0.0.1", port) for port in range(1, 41)), workers=5))) == 40
+    assert peak <= 5
+
+
+def test_scan_threads_shares_the_rate_limiter(unused_port):
+    limiter = RateLimiter(20, burst=1)
+    start = time.monotonic()
+    results = list(scan_threads([("127.0.0.1", unused_port)] * 5, workers=5, limiter=limiter))
+    assert [result.state for result in results] == [PortState.CLOSED] * 5
+    # five connects at 20 per second, however many threads ask at once
+    assert time.monotonic() - start >= 0.19
+
+
+def test_scan_threads_invalid_workers():
+    with pytest.raises(ValueError):
+        next(scan_threads([("127.0.0.1", 80)], workers=0))
+
+
+def test_scan_targets_accepts_async_targets(mocker):
+    async def fake_probe(host, port, *_, **__):
+        await asyncio.sleep(0)
+        return ProbeResult(host, port, PortState.CLOSED, 0.0)
+
+    mocker.patch("port_scanner.networking.async_probe", fake_probe)
+
+    async def targets():
+        for port in range(1, 51):
+            await asyncio.sleep(0)
+            yield "127.0.0.1", port
+
+    async def collect():
+        return [result async for result in scan_targets(targets(), concurrency=10)]
+
+    assert sorted(result.port for result in asyncio.run(collect())) == list(range(1, 51))
+
+
+def test_scan_ports_invalid_arguments():
+    async def collect(host, concurrency):
+        return [result async for result in scan_ports(host, [80], concurrency=concurrency)]
+
+    with pytest.raises(ValueError):
+        asyncio.run(collect("invalid", 1))
+    with pytest.raises(ValueError):
+        asyncio.run(collect("127.0.0.1", 0))
+
+
 def test_arp_scan(mocker):
-    # Mock response packets
-    mock_response = (
-        [
-            (mocker.MagicMock(), mocker.MagicMock(psrc="192.168.0.1")),
-            (mocker.MagicMock(), mocker.MagicMock(psrc="192.168.0.2")),
-        ],
-        None,
+    mocker.patch(
+        "port_scanner.networking.arp_sweep",
+        return_value=iter(
+            [ArpReply("192.168.0.1", "02:00:00:00:00:01", 0.001), ArpReply("192.168.0.2", "02:00:00:00:00:02", 0.002)]
+        ),
     )
 
-    # Set the return value of srp to the mocker response
-    mocker.patch("port_scanner.networking.srp", return_value=mock_response)
-
     # Perform the ARP scan
     result = arp_scan("192.168.0.0/24")
 
@@ -104,7 +405,7 @@ def test_tcp_syn_scan_open_port(mocker):
     mock_response[TCP].flags = "SA"  # SYN-ACK flag
 
     # Set the return value of sr1 to the mocker response
-    mocker.patch("port_scanner.networking.sr1", return_value=mock_response)
+    mocker.patch("scapy.all.sr1", return_value=mock_response)
 
     # Perform the TCP SYN scan
     result = tcp_syn_scan("192.168.1.1", 80)
@@ -120,7 +421,7 @@ def test_tcp_syn_scan_closed_port(mocker):
     mock_response[TCP].flags = "RA"  # RST flag
 
     # Set the return value of sr1 to the mocker response
-    mocker.patch("port_scanner.networking.sr1", return_value=mock_response)
+    mocker.patch("scapy.all.sr1", return_value=mock_response)
 
     # Perform the TCP SYN scan
     result = tcp_syn_scan("192.168.1.1", 80)
@@ -136,7 +437,7 @@ def test_tcp_syn_scan_filtered_port(mocker):
     mock_response[TCP].flags = "R"  # Reset flag
 
     # Set the return value of sr1 to the mock response
-    mocker.patch("port_scanner.networking.sr1", return_value=mock_response)
+    mocker.patch("scapy.all.sr1", return_value=mock_response)
 
     # Perform the TCP SYN scan
     result = tcp_syn_scan("192.168.1.1", 80)
@@ -151,7 +452,7 @@ def test_tcp_syn_scan_no_tcp(mocker):
     mock_response.haslayer.return_value = False
 
     # Set the return value of sr1 to the mock response
-    mocker.patch("port_scanner.networking.sr1", return_value=mock_response)
+    mocker.patch("scapy.all.sr1", return_value=mock_response)
 
     # Perform the TCP SYN scan
     result = tcp_syn_scan("192.168.1.1", 80)
@@ -167,7 +468,7 @@ def test_tcp_syn_scan_other_status(mocker):
     mock_response[TCP].flags = "X"
 
     # Set the return value of sr1 to the mock response
-    mocker.patch("port_scanner.networking.sr1", return_value=mock_response)
+    mocker.patch("scapy.all.sr1", return_value=mock_response)
 
     # Perform the TCP SYN scan
     result = tcp_syn_scan("192.168.1.1", 80)
@@ -178,7 +479,7 @@ def test_tcp_syn_scan_other_status(mocker):
 
 def test_tcp_syn_scan_no_response(mocker):
     # Set sr1 to return None (indicating no response)
-    mocker.patch("port_scanner.networking.sr1", return_value=None)
+    mocker.patch("scapy.all.sr1", return_value=None)
 
     # Perform the TCP SYN scan
     result = tcp_syn_scan("192.168.1.1", 80)
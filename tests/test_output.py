@@ -0,0 +1,135 @@
+import io
+import json
+import sys
+
+import pytest
+from port_scanner.networking import PortState, ProbeResult
+from port_scanner.output import (
+    HEADER,
+    RECORD,
+    BinaryWriter,
+    CsvWriter,
+    JsonlWriter,
+    OutputFormat,
+    open_output,
+    read_binary,
+)
+
+_RESULTS = [
+    ProbeResult("10.0.0.1", 22, PortState.OPEN, 0.001),
+    ProbeResult("10.0.0.1", 23, PortState.CLOSED, 0.0005),
+    ProbeResult("192.168.255.254", 65535, PortState.FILTERED, 2.0),
+]
+
+
+class _ShortReads(io.BytesIO):
+    """A stream that returns at most a few bytes at a time, like a pipe."""
+
+    def read(self, size=-1):
+        return super().read(min(size, 5) if size >= 0 else 5)
+
+
+def _write(writer_class, results=_RESULTS, **kwargs):
+    stream = io.BytesIO()
+    with writer_class(stream, **kwargs) as writer:
+        for result in results:
+            writer.write(result)
+    return stream.getvalue()
+
+
+def test_jsonl_writer():
+    lines = _write(JsonlWriter).decode().splitlines()
+    assert [json.loads(line) for line in lines] == [
+        {"host": "10.0.0.1", "port": 22, "state": "open", "latency": 0.001},
+        {"host": "10.0.0.1", "port": 23, "state": "closed", "latency": 0.0005},
+        {"host": "192.168.255.254", "port": 65535, "state": "filtered", "latency": 2.0},
+    ]
+
+
+def test_csv_writer():
+    assert _write(CsvWriter).decode().splitlines() == [
+        "host,port,state,latency",
+        "10.0.0.1,22,open,0.001000",
+        "10.0.0.1,23,closed,0.000500",
+        "192.168.255.254,65535,filtered,2.000000",
+    ]
+
+
+def test_binary_writer_has_fixed_width_records():
+    data = _write(BinaryWriter)
+    assert len(data) == HEADER.size + len(_RESULTS) * RECORD.size
+
+
+def test_binary_round_trip():
+    results = list(read_binary(io.BytesIO(_write(BinaryWriter))))
+    assert [result[:3] for result in results] == [result[:3] for result in _RESULTS]
+    assert [result.latency for result in results] == pytest.approx([result.latency for result in _RESULTS])
+
+
+def test_read_binary_from_file(tmp_path):
+    path = tmp_path / "scan.bin"
+    path.write_bytes(_write(BinaryWriter))
+    assert len(list(read_binary(path))) == len(_RESULTS)
+    assert len(list(read_binary(str(path)))) == len(_RESULTS)
+
+
+def test_read_binary_completes_short_reads():
+    assert len(list(read_binary(_ShortReads(_write(BinaryWriter))))) == len(_RESULTS)
+
+
+def test_read_binary_empty_scan():
+    assert list(read_binary(io.BytesIO(_write(BinaryWriter, [])))) == []
+
+
+@pytest.mark.parametrize("data", [b"", b"PSCN", b"NOPE\x01\x0c\x00\x00", b"PSCN\x02\x0c\x00\x00"])
+def test_read_binary_bad_header(data):
+    with pytest.raises(ValueError, match="not a binary scan result file"):
+        list(read_binary(io.BytesIO(data)))
+
+
+def test_read_binary_truncated_record():
+    with pytest.raises(ValueError, match="halfway a record"):
+        list(read_binary(io.BytesIO(_write(BinaryWriter)[:-1])))
+
+
+def test_writer_writes_in_batches():
+    stream = io.BytesIO()
+    writer = CsvWriter(stream, batch_size=2, flush_interval=60)
+    writer.write(_RESULTS[0])
+    assert stream.getvalue() == b""
+    writer.write(_RESULTS[1])
+    assert stream.getvalue().count(b"\n") == 3
+    writer.write(_RESULTS[2])
+    assert stream.getvalue().count(b"\n") == 3
+    writer.close()
+    assert stream.getvalue().count(b"\n") == 4
+    assert writer.written == 3
+    assert not stream.closed
+
+
+def test_writer_flushes_old_results(mocker):
+    clock = mocker.patch("port_scanner.output.time.monotonic", return_value=0.0)
+    stream = io.BytesIO()
+    writer = JsonlWriter(stream, batch_size=100, flush_interval=1.0)
+    writer.write(_RESULTS[0])
+    assert stream.getvalue() == b""
+    clock.return_value = 1.5
+    writer.write(_RESULTS[1])
+    assert stream.getvalue().count(b"\n") == 2
+
+
+def test_open_output_file(tmp_path):
+    path = tmp_path / "scan.jsonl"
+    with open_output(OutputFormat.JSONL, path) as writer:
+        writer.write(_RESULTS[0])
+    assert writer.stream.closed
+    assert json.loads(path.read_text())["port"] == 22
+
+
+@pytest.mark.parametrize("path", [None, "-"])
+def test_open_output_stdout(mocker, path):
+    stdout = mocker.patch.object(sys, "stdout", io.TextIOWrapper(io.BytesIO()))
+    with open_output(OutputFormat.CSV, path) as writer:
+        writer.write(_RESULTS[0])
+    assert not stdout.buffer.closed
+    assert stdout.buffer.getvalue() == b"host,port,state,latency\n10.0.0.1,22,open,0.001000\n"
@@ -0,0 +1,190 @@
+import socket
+import struct
+
+import pytest
+from port_scanner import arp, syn_scanner
+from port_scanner.networking import PortState
+from port_scanner.packetio import (
+    ACCEPT,
+    BPF_ABS,
+    BPF_B,
+    BPF_JEQ,
+    BPF_JMP,
+    BPF_K,
+    BPF_LD,
+    BPF_RET,
+    RECEIVE_BATCH,
+    FakeIO,
+    RawIO,
+    SocketIO,
+    attach_filter,
+    kernel_statistics,
+)
+from port_scanner.syn_scanner import TCP_HEADER, SynScanner
+from scapy.all import ARP, IP, TCP, Ether  # type: ignore
+
+_LOCALHOST = "127.0.0.1"
+
+
+@pytest.fixture
+def pair():
+    left, right = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+    yield left, right
+    left.close()
+    right.close()
+
+
+def test_socket_io_receives_one_packet(pair):
+    left, right = pair
+    io = SocketIO(left, right)
+    io.send(b"probe")
+    assert [bytes(packet) for packet, _ in io.receive()] == [b"probe"]
+    assert list(io.receive()) == []
+
+
+def test_raw_io_drains_queued_packets_in_one_receive(pair):
+    left, right = pair
+    io = RawIO(left, right)
+    for i in range(5):
+        io.send(b"reply %d" % i)
+    assert [bytes(packet) for packet, _ in io.receive()] == [b"reply %d" % i for i in range(5)]
+    assert list(io.receive()) == []
+
+
+def test_raw_io_stops_at_the_batch_size(pair):
+    left, right = pair
+    io = RawIO(left, right, batch=2)
+    for i in range(3):
+        io.send(b"%d" % i)
+    assert [bytes(packet) for packet, _ in io.receive()] == [b"0", b"1"]
+    assert [bytes(packet) for packet, _ in io.receive()] == [b"2"]
+
+
+def test_raw_io_reuses_its_buffers(pair):
+    left, right = pair
+    io = RawIO(left, right, batch=1)
+    io.send(b"first")
+    ((first, _),) = io.receive()
+    io.send(b"second")
+    ((second, _),) = io.receive()
+    assert isinstance(second, memoryview)
+    assert first.obj is second.obj
+
+
+def test_raw_io_invalid_batch(pair):
+    with pytest.raises(ValueError):
+        RawIO(*pair, batch=0)
+
+
+def test_fake_io_answers_and_records():
+    io = FakeIO(lambda packet, address: [(packet.upper(), address[0])])
+    buffer = bytearray(b"probe")
+    io.send(buffer, ("10.0.0.1", 0))
+    buffer[:] = b"patch"
+    io.inject(b"unsolicited")
+    assert io.sent == [(b"probe", ("10.0.0.1", 0))]
+    assert list(io.receive()) == [(b"PROBE", "10.0.0.1"), (b"unsolicited", None)]
+    assert list(io.receive()) == []
+
+
+def test_fake_io_receives_in_batches():
+    io = FakeIO()
+    for i in range(RECEIVE_BATCH + 1):
+        io.inject(b"%d" % i)
+    assert len(list(io.receive())) == RECEIVE_BATCH
+    assert len(list(io.receive())) == 1
+
+
+def _answer(packet, address):
+    """Answer SYNs to port 80 with a SYN-ACK and every other port with a RST."""
+    sport, dport, seq, *_ = TCP_HEADER.unpack_from(packet)
+    flags = "SA" if dport == 80 else "RA"
+    yield bytes(IP(src=address[0], dst=_LOCALHOST) / TCP(sport=dport, dport=sport, flags=flags, ack=seq + 1)), None
+
+
+def test_syn_scanner_over_fake_io():
+    io = FakeIO(_answer)
+    scanner = SynScanner(timeout=0.05, retries=0, io=io)
+    results = {result.port: result.state for result in scanner.scan(_LOCALHOST, [22, 80])}
+    assert results == {22: PortState.CLOSED, 80: PortState.OPEN}
+    assert [struct.unpack_from("!H", packet, 2)[0] for packet, _ in io.sent] == [22, 80]
+    # a backend that was handed in is left open
+    assert not io.closed
+
+
+def _run_filter(program, packet):
+    """Run a classic BPF program over `packet` the way the kernel would, for the instructions the engines use."""
+    accumulator = index = pc = 0
+    while True:
+        code, jt, jf, k = program[pc]
+        pc += 1
+        kind, size, mode = code & 0x07, code & 0x18, code & 0xE0
+        if kind == 0x06:  # ret
+            return k
+        if kind == 0x01:  # ldx 4 * (byte & 0xf)
+            index = (packet[k] & 0x0F) * 4
+        elif kind == 0x00:  # ld
+            offset = k + (index if mode == 0x40 else 0)
+            width = {0x00: 4, 0x08: 2, 0x10: 1}[size]
+            if offset + width > len(packet):
+                return 0
+            accumulator = int.from_bytes(packet[offset : offset + width])
+        elif kind == 0x05:  # jeq or jset
+            taken = accumulator == k if code & 0xF0 == 0x10 else bool(accumulator & k)
+            pc += jt if taken else jf
+
+
+@pytest.mark.parametrize(
+    ("packet", "admitted"),
+    [
+        (IP(src="10.0.0.2") / TCP(sport=80, dport=40000, flags="SA"), True),
+        (IP(src="10.0.0.2") / TCP(sport=80, dport=40000, flags="RA"), True),
+        (IP(src="10.0.0.2") / TCP(sport=80, dport=40000, flags="R"), True),
+        (IP(src="10.0.0.2", options=b"\x01" * 4) / TCP(sport=80, dport=40000, flags="SA"), True),
+        (IP(src="10.0.0.2") / TCP(sport=80, dport=40001, flags="SA"), False),
+        (IP(src="10.0.0.2") / TCP(sport=80, dport=40000, flags="S"), False),
+        (IP(src="10.0.0.2", frag=100) / TCP(sport=80, dport=40000, flags="SA"), False),
+    ],
+)
+def test_syn_reply_filter(packet, admitted):
+    assert bool(_run_filter(syn_scanner.reply_filter(40000), bytes(packet))) is admitted
+
+
+@pytest.mark.parametrize(
+    ("frame", "admitted"),
+    [
+        (Ether() / ARP(op=2, psrc="192.168.0.7", pdst="192.168.0.100"), True),
+        (Ether() / ARP(op=2, psrc="192.168.0.7", pdst="192.168.0.99"), False),
+        (Ether() / ARP(op=1, psrc="192.168.0.7", pdst="192.168.0.100"), False),
+        (Ether() / IP(dst="192.168.0.100"), False),
+    ],
+)
+def test_arp_reply_filter(frame, admitted):
+    assert bool(_run_filter(arp.reply_filter("192.168.0.100"), bytes(frame))) is admitted
+
+
+def test_attach_filter_drops_in_the_kernel(pair):
+    left, right = pair
+    # unix sockets run socket filters too, over the datagram itself
+    attach_filter(
+        right,
+        [
+            (BPF_LD | BPF_B | BPF_ABS, 0, 0, 0),
+            (BPF_JMP | BPF_JEQ | BPF_K, 0, 1, 1),
+            (BPF_RET | BPF_K, 0, 0, ACCEPT),
+            (BPF_RET | BPF_K, 0, 0, 0),
+        ],
+    )
+    io = RawIO(left, right)
+    for packet in (b"\x01 wanted", b"\x02 unwanted", b"\x01 wanted too"):
+        left.send(packet)
+    assert [bytes(packet) for packet, _ in io.receive()] == [b"\x01 wanted", b"\x01 wanted too"]
+
+
+def test_attach_filter_needs_instructions(pair):
+    with pytest.raises(ValueError):
+        attach_filter(pair[0], [])
+
+
+def test_kernel_statistics_only_of_packet_sockets(pair):
+    assert kernel_statistics(pair[0]) is None
@@ -0,0 +1,120 @@
+import socket
+
+import pytest
+from port_scanner import parallel
+from port_scanner.networking import PortState, ProbeResult
+from port_scanner.output import RECORD
+from port_scanner.parallel import BATCH_SIZE, RESULTS, BatchSender, ShardJob, scan_processes, scan_shard
+from port_scanner.permutation import walk
+from port_scanner.targets import TargetSpec
+
+_LOCALHOST = "127.0.0.1"
+
+
+@pytest.fixture
+def listener():
+    with socket.socket() as sock:
+        sock.bind((_LOCALHOST, 0))
+        sock.listen()
+        yield sock.getsockname()[1]
+
+
+class _Connection:
+    def __init__(self):
+        self.messages = []
+
+    def send_bytes(self, data):
+        self.messages.append(bytes(data))
+
+
+def _job(**kwargs):
+    job = {
+        "hosts": TargetSpec.parse(_LOCALHOST, "1").host_ranges,
+        "ports": [(20, 29)],
+        "seed": 3,
+        "randomize": True,
+        "shard": 0,
+        "shards": 1,
+        "start": 0,
+        "use_tcp_syn": False,
+        "concurrency": 1,
+        "retries": 0,
+        "initial_timeout": 0.1,
+        "min_timeout": 0.1,
+        "max_timeout": 1.0,
+        "rate": None,
+        "burst": None,
+        "host_rate": None,
+        "host_burst": None,
+        "checkpoint": None,
+    }
+    return ShardJob(**(job | kwargs))
+
+
+def test_sender_batches_records(mocker):
+    mocker.patch.object(parallel.time, "monotonic", return_value=0.0)
+    connection = _Connection()
+    send = BatchSender(connection)
+    for port in range(BATCH_SIZE + 1):
+        send(ProbeResult(_LOCALHOST, port, PortState.CLOSED, 0.5))
+    assert len(connection.messages) == 1
+    send.flush()
+    send.flush()
+    assert [len(message) for message in connection.messages] == [
+        1 + BATCH_SIZE * RECORD.size,
+        1 + RECORD.size,
+    ]
+    assert connection.messages[1][:1] == RESULTS
+    assert RECORD.unpack(connection.messages[1][1:]) == (socket.inet_aton(_LOCALHOST), BATCH_SIZE, 2, 0.5)
+
+
+def testscan_shard_walks_its_shard(mocker):
+    probe = mocker.patch(
+        "port_scanner.parallel.probe", side_effect=lambda host, port, **_: ProbeResult(host, port, PortState.OPEN, 0)
+    )
+    results = []
+    scan_shard(_job(shard=1, shards=3, start=1), results.append)
+    expected = list(walk(TargetSpec.parse(_LOCALHOST, "20-29"), seed=3, randomize=True, shard=1, shards=3, start=1))
+    assert [(result.host, result.port) for result in results] == expected
+    assert probe.call_count == 2
+
+
+def testscan_shard_async_engine(listener):
+    results = []
+    scan_shard(_job(ports=[(listener, listener + 1)], concurrency=4), results.append)
+    assert sorted((result.port, result.state) for result in results) == [
+        (listener, PortState.OPEN),
+        (listener + 1, PortState.CLOSED),
+    ]
+
+
+@pytest.mark.parametrize(("shard", "shards", "start"), [(0, 1, 0), (1, 2, 0), (0, 1, 7), (2, 3, 5)])
+def test_scan_processes_covers_the_shard(listener, shard, shards, start):
+    targets = TargetSpec.parse(_LOCALHOST, f"{listener - 20}-{listener + 20}")
+    results = list(
+        scan_processes(
+            targets,
+            processes=3,
+            shard=shard,
+            shards=shards,
+            start=start,
+            seed=1,
+            randomize=True,
+            concurrency=8,
+            retries=0,
+        )
+    )
+    expected = sorted(walk(targets, seed=1, randomize=True, shard=shard, shards=shards, start=start))
+    assert sorted((result.host, result.port) for result in results) == expected
+    open_ports = [result.port for result in results if result.state == PortState.OPEN]
+    assert open_ports == ([listener] if (_LOCALHOST, listener) in expected else [])
+
+
+def test_scan_processes_reports_worker_errors(tmp_path):
+    with pytest.raises(RuntimeError, match="scan-worker-0 failed: FileNotFoundError"):
+        list(scan_processes(TargetSpec.parse(_LOCALHOST, "20"), processes=1, checkpoint=tmp_path / "missing"))
+
+
+def test_scan_processes_invalid_processes():
+    with pytest.raises(ValueError, match="processes"):
+        list(scan_processes(TargetSpec.parse(_LOCALHOST, "20"), processes=0))
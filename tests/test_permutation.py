@@ -0,0 +1,51 @@
+import hypothesis.strategies as st
+import pytest
+from hypothesis import given
+from port_scanner.permutation import Permutation, walk
+
+
+@given(st.integers(min_value=0, max_value=5000), st.integers(min_value=0, max_value=2**32))
+def test_permutation_is_a_bijection(size, seed):
+    assert sorted(Permutation(size, seed)) == list(range(size))
+
+
+def test_permutation_is_deterministic_per_seed():
+    assert list(Permutation(1000, 7)) == list(Permutation(1000, 7))
+    assert list(Permutation(1000, 7)) != list(Permutation(1000, 8))
+    assert list(Permutation(1000, 7)) != list(range(1000))
+
+
+def test_permutation_random_access():
+    permutation = Permutation(10**12, 1)
+    assert 0 <= permutation[10**12 - 1] < 10**12
+    with pytest.raises(IndexError):
+        permutation[10**12]
+
+
+def test_permutation_invalid_arguments():
+    with pytest.raises(ValueError):
+        Permutation(-1)
+    with pytest.raises(ValueError):
+        Permutation(10, rounds=0)
+
+
+@pytest.mark.parametrize("randomize", [False, True])
+def test_walk_shards_are_disjoint_and_complete(randomize):
+    targets = list(range(1001))
+    shards = [list(walk(targets, seed=3, randomize=randomize, shard=shard, shards=4)) for shard in range(4)]
+    visited = [target for shard in shards for target in shard]
+    assert len(visited) == len(set(visited)) == len(targets)
+
+
+@pytest.mark.parametrize("randomize", [False, True])
+def test_walk_resumes_from_index(randomize):
+    targets = list(range(500))
+    full = list(walk(targets, seed=3, randomize=randomize, shard=1, shards=3))
+    assert list(walk(targets, seed=3, randomize=randomize, shard=1, shards=3, start=40)) == full[40:]
+
+
+def test_walk_invalid_arguments():
+    with pytest.raises(ValueError):
+        list(walk([1], shard=2, shards=2))
+    with pytest.raises(ValueError):
+        list(walk([1], start=-1))
@@ -0,0 +1,86 @@
+import asyncio
+import threading
+
+import pytest
+from port_scanner.pipeline import HostPipe, aexpand, expand
+
+
+def test_pipe_yields_hosts_in_discovery_order():
+    with HostPipe(["10.0.0.1", "10.0.0.2", "10.0.0.3"]) as pipe:
+        assert list(pipe) == ["10.0.0.1", "10.0.0.2", "10.0.0.3"]
+    assert pipe.discovered == 3
+
+
+def test_pipe_applies_back_pressure():
+    produced = []
+
+    def discovery():
+        for i in range(100):
+            produced.append(i)
+            yield f"10.0.0.{i}"
+
+    with HostPipe(discovery(), maxsize=2) as pipe:
+        hosts = iter(pipe)
+        assert next(hosts) == "10.0.0.0"
+        threading.Event().wait(0.1)
+        # one host handed out, two queued and one waiting for room
+        assert len(produced) <= 4
+
+
+def test_pipe_close_stops_blocked_discovery():
+    closed = threading.Event()
+
+    def discovery():
+        try:
+            while True:
+                yield "10.0.0.1"
+        finally:
+            closed.set()
+
+    with HostPipe(discovery(), maxsize=1) as pipe:
+        next(iter(pipe))
+    assert closed.is_set()
+
+
+def test_pipe_reraises_discovery_errors():
+    def discovery():
+        yield "10.0.0.1"
+        raise PermissionError
+
+    with HostPipe(discovery()) as pipe, pytest.raises(PermissionError):
+        list(pipe)
+
+
+def test_pipe_async_iteration():
+    async def collect(pipe):
+        return [host async for host in pipe]
+
+    with HostPipe(["10.0.0.1", "10.0.0.2"]) as pipe:
+        assert asyncio.run(collect(pipe)) == ["10.0.0.1", "10.0.0.2"]
+
+
+def test_pipe_invalid_size():
+    with pytest.raises(ValueError, match="maxsize"):
+        HostPipe([], maxsize=0)
+
+
+def test_expand_pairs_hosts_with_ports():
+    assert list(expand(["10.0.0.1", "10.0.0.2"], [(20, 21), (80, 80)])) == [
+        ("10.0.0.1", 20),
+        ("10.0.0.1", 21),
+        ("10.0.0.1", 80),
+        ("10.0.0.2", 20),
+        ("10.0.0.2", 21),
+        ("10.0.0.2", 80),
+    ]
+
+
+def test_aexpand_matches_expand():
+    async def hosts():
+        yield "10.0.0.1"
+        yield "10.0.0.2"
+
+    async def collect():
+        return [target async for target in aexpand(hosts(), [(20, 22)])]
+
+    assert asyncio.run(collect()) == list(expand(["10.0.0.1", "10.0.0.2"], [(20, 22)]))
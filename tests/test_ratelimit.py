@@ -0,0 +1,102 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from port_scanner.ratelimit import RateLimiter, TokenBucket
+
+
+def test_token_bucket_allows_burst_then_paces():
+    bucket = TokenBucket(rate=10, burst=3)
+    assert [bucket.reserve() for _ in range(3)] == [0, 0, 0]
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.01)
+    assert bucket.reserve() == pytest.approx(0.2, abs=0.01)
+
+
+def test_token_bucket_refills():
+    bucket = TokenBucket(rate=100, burst=1)
+    bucket.acquire()
+    start = time.monotonic()
+    bucket.acquire()
+    assert time.monotonic() - start == pytest.approx(0.01, abs=0.01)
+
+
+def test_token_bucket_default_burst():
+    assert TokenBucket(10).burst == 1
+    assert TokenBucket(10_000).burst == 100
+
+
+def test_token_bucket_invalid_arguments():
+    with pytest.raises(ValueError):
+        TokenBucket(0)
+    with pytest.raises(ValueError):
+        TokenBucket(10, burst=0)
+
+
+def test_token_bucket_threads_share_the_budget():
+    bucket = TokenBucket(rate=200, burst=1)
+    start = time.monotonic()
+    threads = [threading.Thread(target=lambda: [bucket.acquire() for _ in range(10)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 40 acquisitions at 200 per second, the first one being free
+    assert time.monotonic() - start >= 39 / 200 - 0.01
+
+
+def test_token_bucket_async():
+    bucket = TokenBucket(rate=200, burst=1)
+
+    async def acquire_all():
+        await asyncio.gather(*(bucket.acquire_async() for _ in range(20)))
+
+    start = time.monotonic()
+    asyncio.run(acquire_all())
+    assert time.monotonic() - start >= 19 / 200 - 0.01
+
+
+def test_token_bucket_overhead():
+    bucket = TokenBucket(rate=1e9)
+    start = time.perf_counter()
+    for _ in range(100_000):
+        bucket.reserve()
+    assert time.perf_counter() - start < 1
+
+
+def test_rate_limiter_per_host_budget():
+    limiter = RateLimiter(host_rate=10, host_burst=1)
+    assert limiter.reserve("10.0.0.1") == 0
+    assert limiter.reserve("10.0.0.2") == 0
+    assert limiter.reserve("10.0.0.1") == pytest.approx(0.1, abs=0.01)
+
+
+def test_rate_limiter_global_budget():
+    limiter = RateLimiter(rate=10, burst=1, host_rate=1000)
+    assert limiter.reserve("10.0.0.1") == 0
+    assert limiter.reserve("10.0.0.2") == pytest.approx(0.1, abs=0.01)
+
+
+def test_rate_limiter_unlimited():
+    limiter = RateLimiter()
+    assert limiter.reserve("10.0.0.1") == 0
+    limiter.acquire("10.0.0.1")
+    asyncio.run(limiter.acquire_async("10.0.0.1"))
+
+
+def test_rate_limiter_invalid_host_rate():
+    with pytest.raises(ValueError):
+        RateLimiter(host_rate=-1)
+
+
+def test_rate_limiter_split():
+    share = RateLimiter(rate=100, burst=8, host_rate=10).split(4)
+    assert share.bucket.rate == 25
+    assert share.bucket.burst == 2
+    assert share.host_rate == 2.5
+    assert share.host_burst is None
+    unlimited = RateLimiter().split(4)
+    assert unlimited.bucket is None
+    assert unlimited.host_rate is None
+    with pytest.raises(ValueError, match="parts"):
+        RateLimiter().split(0)
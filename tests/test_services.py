@@ -0,0 +1,177 @@
+import socket
+import threading
+import time
+
+import pytest
+from port_scanner import services
+from port_scanner.networking import PortState, ProbeResult, probe
+from port_scanner.services import PROBES, Service, ServiceDetector, identify, match_banner
+
+_LOCALHOST = "127.0.0.1"
+
+
+@pytest.mark.parametrize(
+    ("banner", "expected"),
+    [
+        (b"SSH-2.0-OpenSSH_9.6p1 Ubuntu-3\r\n", ("ssh", "OpenSSH_9.6p1")),
+        (b"220 mx.example.com ESMTP Postfix (Ubuntu)\r\n", ("smtp", "Postfix (Ubuntu)")),
+        (b"220-smtp.example.com ESMTP\r\n", ("smtp", None)),
+        (b"220 ProFTPD Server ready.\r\n", ("ftp", "ProFTPD Server ready.")),
+        (b"+OK Dovecot ready.\r\n", ("pop3", "Dovecot ready.")),
+        (b"* OK IMAP4rev1 ready\r\n", ("imap", "IMAP4rev1 ready")),
+        (b"HTTP/1.1 301 Moved\r\nLocation: /\r\nServer: nginx/1.24.0\r\n\r\n", ("http", "nginx/1.24.0")),
+        (b"HTTP/1.0 200 OK\r\nserver:Caddy\r\n\r\n", ("http", "Caddy")),
+        (b"HTTP/1.1 404 Not Found\r\n\r\n", ("http", None)),
+        (b"\x16\x03\x03\x00\x5a\x02\x00\x00\x56\x03\x03", ("tls", None)),
+        (b"\x15\x03\x01\x00\x02\x02\x28", ("tls", None)),
+        (b"220 ready\r\n", (None, None)),
+        (b"", (None, None)),
+    ],
+)
+def test_match_banner(banner, expected):
+    assert match_banner(banner) == expected
+
+
+def test_client_hello_lengths_add_up():
+    hello = PROBES["tls"]
+    assert hello[:3] == b"\x16\x03\x01"
+    assert int.from_bytes(hello[3:5]) == len(hello) - 5
+    assert hello[5] == 1  # ClientHello
+    assert int.from_bytes(hello[6:9]) == len(hello) - 9
+
+
+class _Service:
+    """A loopback service that greets with `banner`, or answers `replies` to what it gets."""
+
+    def __init__(self, banner=b"", replies=None, delay=0.0):
+        self.banner = banner
+        self.replies = replies or {}
+        self.delay = delay
+        self.received = []
+        self.server = socket.socket()
+        self.server.bind((_LOCALHOST, 0))
+        self.server.listen()
+        self.port = self.server.getsockname()[1]
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        while True:
+            try:
+                connection, _ = self.server.accept()
+            except OSError:
+                return
+            with connection:
+                time.sleep(self.delay)
+                if self.banner:
+                    connection.sendall(self.banner)
+                connection.settimeout(2)
+                try:
+                    data = connection.recv(4096)
+                except OSError:
+                    continue
+                self.received.append(data)
+                for prefix, reply in self.replies.items():
+                    if data.startswith(prefix):
+                        connection.sendall(reply)
+                # let the client close first
+                try:
+                    connection.recv(1)
+                except OSError:
+                    pass
+
+    def close(self):
+        self.server.close()
+
+
+@pytest.fixture
+def service(request):
+    server = _Service(**request.param)
+    yield server
+    server.close()
+
+
+def _connect(port):
+    return socket.create_connection((_LOCALHOST, port))
+
+
+@pytest.mark.parametrize("service", [{"banner": b"SSH-2.0-OpenSSH_9.6\r\n"}], indirect=True)
+def test_identify_reads_the_greeting(service):
+    with _connect(service.port) as sock:
+        started = time.monotonic()
+        assert identify(sock, service.port, timeout=2) == ("ssh", "OpenSSH_9.6", b"SSH-2.0-OpenSSH_9.6\r\n")
+    # stops as soon as the banner matches
+    assert time.monotonic() - started < 1
+
+
+@pytest.mark.parametrize(
+    "service", [{"replies": {b"GET / ": b"HTTP/1.0 200 OK\r\nServer: test/1.0\r\n\r\nhello"}}], indirect=True
+)
+def test_identify_sends_http_to_silent_services(service):
+    with _connect(service.port) as sock:
+        name, version, _ = identify(sock, service.port, timeout=2, banner_wait=0.1)
+    assert (name, version) == ("http", "test/1.0")
+    assert service.received == [PROBES["http"]]
+
+
+@pytest.mark.parametrize("service", [{"replies": {b"\x16\x03\x01": b"\x15\x03\x03\x00\x02\x02\x28"}}], indirect=True)
+def test_identify_sends_a_client_hello_to_tls_ports(mocker, service):
+    mocker.patch.dict(services.PORT_PROBES, {service.port: "tls"})
+    with _connect(service.port) as sock:
+        name, _, _ = identify(sock, service.port, timeout=2, banner_wait=10)
+    assert name == "tls"
+    assert service.received == [PROBES["tls"]]
+
+
+@pytest.mark.parametrize("service", [{"banner": b"x" * 10000}], indirect=True)
+def test_identify_caps_the_read(service):
+    with _connect(service.port) as sock:
+        name, _, banner = identify(sock, service.port, read_size=100, timeout=2)
+    assert name is None
+    assert banner == b"x" * 100
+
+
+@pytest.mark.parametrize("service", [{}], indirect=True)
+def test_identify_gives_up_at_the_deadline(service):
+    with _connect(service.port) as sock:
+        started = time.monotonic()
+        assert identify(sock, service.port, timeout=0.3, banner_wait=0.1) == (None, None, b"")
+    assert time.monotonic() - started < 1
+
+
+@pytest.mark.parametrize("service", [{"banner": b"SSH-2.0-test\r\n"}], indirect=True)
+def test_detector_identifies_services_of_a_scan(service):
+    with ServiceDetector(concurrency=2) as detector:
+        result = probe(_LOCALHOST, service.port, on_open=detector)
+    assert result.state is PortState.OPEN
+    assert detector.services == [Service(_LOCALHOST, service.port, "ssh", "test", b"SSH-2.0-test\r\n")]
+
+
+@pytest.mark.parametrize("service", [{"banner": b"SSH-2.0-test\r\n", "delay": 0.3}], indirect=True)
+def test_detector_skips_connections_beyond_its_backlog(service):
+    with ServiceDetector(concurrency=1, backlog=0, timeout=1) as detector:
+        started = time.monotonic()
+        for _ in range(3):
+            probe(_LOCALHOST, service.port, on_open=detector)
+        # handing connections over never waits for detection
+        assert time.monotonic() - started < 0.3
+    assert detector.skipped == 2
+    assert [found.name for found in detector.services] == ["ssh"]
+
+
+def test_detector_checks_arguments():
+    with pytest.raises(ValueError, match="concurrency"):
+        ServiceDetector(concurrency=0)
+    with pytest.raises(ValueError, match="backlog"):
+        ServiceDetector(backlog=-1)
+    with pytest.raises(ValueError, match="read_size"):
+        ServiceDetector(read_size=0)
+
+
+def test_detector_closes_the_connection(mocker):
+    sock = mocker.Mock(spec=socket.socket)
+    sock.recv.side_effect = OSError
+    with ServiceDetector(banner_wait=0) as detector:
+        detector(ProbeResult(_LOCALHOST, 22, PortState.OPEN, 0.0), sock)
+    sock.close.assert_called_once()
+    assert detector.services == [Service(_LOCALHOST, 22, None, None, b"")]
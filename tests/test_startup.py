@@ -0,0 +1,25 @@
+import subprocess
+import sys
+
+
+def _modules_after(statement, tmp_path):
+    code = f"import sys\n{statement}\nprint('\\n'.join(sys.modules))"
+    output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True, cwd=tmp_path)  # noqa: S603
+    return set(output.stdout.split())
+
+
+def test_importing_the_app_does_not_import_scapy(tmp_path):
+    modules = _modules_after("import port_scanner.app", tmp_path)
+    assert "port_scanner.app" in modules
+    assert not any(module == "scapy" or module.startswith("scapy.") for module in modules)
+
+
+def test_importing_the_app_does_not_create_the_log_file(tmp_path):
+    _modules_after("import port_scanner.app", tmp_path)
+    assert not (tmp_path / "port-scan.log").exists()
+
+
+def test_importing_the_app_does_not_start_the_log_writer(tmp_path):
+    code = "import threading\nimport port_scanner.app\nprint([thread.name for thread in threading.enumerate()])"
+    output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True, cwd=tmp_path)  # noqa: S603
+    assert "log-writer" not in output.stdout
@@ -0,0 +1,117 @@
+import tracemalloc
+
+import pytest
+from port_scanner.networking import PortState, ProbeResult
+from port_scanner.store import HEADER, ROW_SIZE, ResultStore
+from port_scanner.targets import parse_hosts
+
+_HOSTS = parse_hosts("10.0.0.1-3,10.0.0.9")
+
+
+@pytest.fixture
+def store():
+    with ResultStore.create(_HOSTS) as store:
+        store.add(ProbeResult("10.0.0.1", 22, PortState.OPEN, 0.001))
+        store.add(ProbeResult("10.0.0.1", 23, PortState.CLOSED, 0.002))
+        store.add(ProbeResult("10.0.0.1", 65535, PortState.OPEN, 0.003))
+        store.add(ProbeResult("10.0.0.9", 22, PortState.OPEN, 0.004))
+        store.add(ProbeResult("10.0.0.9", 25, PortState.FILTERED, 1.0))
+        yield store
+
+
+def test_state(store):
+    assert store.state("10.0.0.1", 22) == PortState.OPEN
+    assert store.state("10.0.0.1", 23) == PortState.CLOSED
+    assert store.state("10.0.0.9", 25) == PortState.FILTERED
+    assert store.state("10.0.0.1", 24) is None
+    assert store.state("10.0.0.2", 22) is None
+
+
+def test_add_replaces_state(store):
+    store.add(ProbeResult("10.0.0.1", 22, PortState.CLOSED, 0.001))
+    assert store.state("10.0.0.1", 22) == PortState.CLOSED
+    # the neighbours sharing the byte are untouched
+    assert store.state("10.0.0.1", 23) == PortState.CLOSED
+    assert store.state("10.0.0.1", 21) is None
+
+
+def test_add_unknown_host(store):
+    with pytest.raises(ValueError, match="not in the ranges"):
+        store.add(ProbeResult("10.0.0.4", 22, PortState.OPEN, 0.001))
+
+
+def test_ports(store):
+    assert store.ports("10.0.0.1") == [22, 65535]
+    assert store.ports("10.0.0.1", PortState.CLOSED) == [23]
+    assert store.ports("10.0.0.2") == []
+
+
+def test_hosts_with(store):
+    assert store.hosts_with(22) == ["10.0.0.1", "10.0.0.9"]
+    assert store.hosts_with(25, PortState.FILTERED) == ["10.0.0.9"]
+    assert store.hosts_with(80) == []
+
+
+def test_counts_and_summary(store):
+    assert store.counts() == {PortState.OPEN: 3, PortState.CLOSED: 1, PortState.FILTERED: 1}
+    assert store.summary() == "4 hosts, 5 ports probed - open 3, closed 1, filtered 1"
+
+
+def test_latency(store):
+    assert store.latency("10.0.0.1", 22) is None
+    with ResultStore.create(_HOSTS, latency=True) as timed:
+        timed.add(ProbeResult("10.0.0.3", 443, PortState.OPEN, 0.25))
+        assert timed.latency("10.0.0.3", 443) == 0.25
+        assert timed.latency("10.0.0.3", 444) is None
+        latencies = timed.latencies("10.0.0.3")
+        assert len(latencies) == 65536
+        assert latencies[443] == 0.25
+    with pytest.raises(ValueError, match="doesn't keep latencies"):
+        store.latencies("10.0.0.1")
+
+
+def test_reopen_file(tmp_path):
+    path = tmp_path / "scan.store"
+    with ResultStore.create(_HOSTS, path, latency=True) as store:
+        store.add(ProbeResult("10.0.0.9", 8080, PortState.OPEN, 0.5))
+    assert path.stat().st_size > HEADER.size + 4 * ROW_SIZE
+
+    with ResultStore.open(path) as store:
+        assert store.host_ranges == _HOSTS
+        assert list(store.hosts()) == ["10.0.0.1", "10.0.0.2", "10.0.0.3", "10.0.0.9"]
+        assert store.ports("10.0.0.9") == [8080]
+        assert store.latency("10.0.0.9", 8080) == 0.5
+        with pytest.raises(TypeError):
+            store.add(ProbeResult("10.0.0.9", 80, PortState.OPEN, 0.5))
+
+    with ResultStore.open(path, writable=True) as store:
+        store.add(ProbeResult("10.0.0.9", 80, PortState.OPEN, 0.5))
+    with ResultStore.open(path) as store:
+        assert store.ports("10.0.0.9") == [80, 8080]
+
+
+@pytest.mark.parametrize("data", [b"", b"PSRS", b"NOPE" + bytes(HEADER.size)])
+def test_open_not_a_store(tmp_path, data):
+    path = tmp_path / "scan.store"
+    path.write_bytes(data)
+    with pytest.raises(ValueError, match="not a result store"):
+        ResultStore.open(path)
+
+
+def test_open_truncated(tmp_path):
+    path = tmp_path / "scan.store"
+    ResultStore.create(_HOSTS, path).close()
+    path.write_bytes(path.read_bytes()[:-1])
+    with pytest.raises(ValueError, match="truncated"):
+        ResultStore.open(path)
+
+
+def test_huge_sweep_is_mapped(tmp_path):
+    tracemalloc.start()
+    with ResultStore.create(parse_hosts("10.0.0.0/16"), tmp_path / "scan.store") as store:
+        store.add(ProbeResult("10.0.255.255", 443, PortState.OPEN, 0.001))
+        assert store.hosts_with(443) == ["10.0.255.255"]
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # the 1 GiB of rows stays in the page cache, only a column was copied
+    assert peak < 2_000_000
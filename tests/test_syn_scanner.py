@@ -0,0 +1,136 @@
+import queue
+import socket
+import struct
+
+import pytest
+from port_scanner.networking import PortState
+from port_scanner.syn_scanner import TCP_ACK, SynScanner, SynTemplate, checksum, parse_reply
+from port_scanner.timing import HostTimings
+from scapy.all import IP, TCP  # type: ignore
+
+_LOCALHOST = "127.0.0.1"
+
+
+class FakeNetwork:
+    """Stands in for both raw sockets, answering SYNs like a host with `open_ports` and `closed_ports`."""
+
+    def __init__(self, open_ports=(), closed_ports=(), drop_first=0):
+        self.open_ports = set(open_ports)
+        self.closed_ports = set(closed_ports)
+        self.drop_first = drop_first
+        self.sent = []
+        self.replies = queue.SimpleQueue()
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def sendto(self, data, address):
+        self.sent.append((bytes(data), address))
+        sport, dport, seq = struct.unpack_from("!HHI", data)
+        if len(self.sent) <= self.drop_first:
+            return
+        if dport in self.open_ports:
+            flags = "SA"
+        elif dport in self.closed_ports:
+            flags = "RA"
+        else:
+            return
+        self.replies.put(
+            bytes(IP(src=address[0], dst=_LOCALHOST) / TCP(sport=dport, dport=sport, flags=flags, ack=seq + 1))
+        )
+
+    def recvfrom(self, _):
+        try:
+            return self.replies.get(timeout=self.timeout), (_LOCALHOST, 0)
+        except queue.Empty:
+            raise TimeoutError from None
+
+
+def test_checksum_of_valid_header_is_zero():
+    segment = bytes(IP(src="10.0.0.1", dst="10.0.0.2") / TCP(sport=1234, dport=80, flags="S"))[20:]
+    pseudo_header = socket.inet_aton("10.0.0.1") + socket.inet_aton("10.0.0.2") + struct.pack("!BBH", 0, 6, 20)
+    assert checksum(pseudo_header + segment) == 0
+
+
+@pytest.mark.parametrize(("port", "seq"), [(1, 0), (80, 12345), (65535, 0xFFFFFFFF)])
+def test_syn_template_matches_scapy(port, seq):
+    template = SynTemplate("10.0.0.1", "10.0.0.2", 40000)
+    expected = IP(src="10.0.0.1", dst="10.0.0.2") / TCP(sport=40000, dport=port, seq=seq, flags="S", window=1024)
+    assert bytes(template.patch(port, seq)) == bytes(expected)[20:]
+
+
+def test_parse_reply():
+    packet = bytes(IP(src="10.0.0.2", dst="10.0.0.1") / TCP(sport=80, dport=40000, flags="SA", ack=5))
+    assert parse_reply(packet) == ("10.0.0.2", 80, 40000, 0, 5, 0x12)
+
+
+def test_parse_reply_ignores_other_packets():
+    assert parse_reply(b"") is None
+    assert parse_reply(bytes(IP(src="10.0.0.2", dst="10.0.0.1", proto=17) / (b"x" * 20))) is None
+
+
+def test_syn_scanner_reports_open_closed_and_filtered():
+    network = FakeNetwork(open_ports=[22, 80], closed_ports=[21])
+    scanner = SynScanner(timeout=0.05, retries=1, send_socket=network, recv_socket=network)  # type: ignore
+    results = {result.port: result.state for result in scanner.scan(_LOCALHOST, [21, 22, 23, 80])}
+    assert results == {21: PortState.CLOSED, 22: PortState.OPEN, 23: PortState.FILTERED, 80: PortState.OPEN}
+    # the unanswered port is retransmitted once
+    assert [struct.unpack_from("!H", data, 2)[0] for data, _ in network.sent].count(23) == 2
+
+
+def test_syn_scanner_retransmits_lost_probes():
+    network = FakeNetwork(open_ports=[80], drop_first=1)
+    scanner = SynScanner(timeout=0.05, retries=2, send_socket=network, recv_socket=network)  # type: ignore
+    assert [(result.port, result.state) for result in scanner.scan(_LOCALHOST, [80])] == [(80, PortState.OPEN)]
+    assert len(network.sent) == 2
+
+
+def test_syn_scanner_updates_host_timings():
+    network = FakeNetwork(open_ports=[22], closed_ports=[23])
+    timings = HostTimings(initial_timeout=0.05)
+    scanner = SynScanner(retries=0, timings=timings, send_socket=network, recv_socket=network)  # type: ignore
+    assert len(list(scanner.scan(_LOCALHOST, [22, 23, 24]))) == 3
+    estimate = timings.estimate(_LOCALHOST)
+    assert estimate is not None
+    assert estimate.srtt < 0.05
+
+
+def test_syn_scanner_ignores_replies_with_wrong_cookie():
+    scanner = SynScanner(source_port=40000)
+    scanner._pending[_LOCALHOST, 80] = (0, 0)
+    forged = bytes(IP(src=_LOCALHOST) / TCP(sport=80, dport=40000, flags="SA", ack=1))
+    scanner.handle_reply(forged)
+    assert (_LOCALHOST, 80) in scanner._pending
+    genuine = bytes(IP(src=_LOCALHOST) / TCP(sport=80, dport=40000, flags="SA", ack=scanner.cookie(_LOCALHOST, 80) + 1))
+    scanner.handle_reply(genuine)
+    assert (_LOCALHOST, 80) not in scanner._pending
+
+
+def test_syn_scanner_invalid_arguments():
+    with pytest.raises(ValueError):
+        SynScanner(rate=0)
+    with pytest.raises(ValueError):
+        SynScanner(retries=-1)
+
+
+@pytest.mark.parametrize(("port", "seq", "ack"), [(80, 12345, 12345), (65535, 0xFFFFFFFF, 0xFFFFFFFF)])
+def test_ack_template_matches_scapy(port, seq, ack):
+    template = SynTemplate("10.0.0.1", "10.0.0.2", 40000, flags=TCP_ACK)
+    expected = IP(src="10.0.0.1", dst="10.0.0.2") / TCP(
+        sport=40000, dport=port, seq=seq, ack=ack, flags="A", window=1024
+    )
+    assert bytes(template.patch(port, seq, ack)) == bytes(expected)[20:]
+
+
+def test_ack_scanner_matches_rst_by_sequence_number():
+    network = FakeNetwork()
+    scanner = SynScanner(flags=TCP_ACK, send_socket=network, recv_socket=network)  # type: ignore
+    scanner._pending[(_LOCALHOST, 80)] = (0.0, 0)
+    cookie = scanner.cookie(_LOCALHOST, 80)
+    reply = IP(src=_LOCALHOST, dst=_LOCALHOST) / TCP(sport=80, dport=scanner.source_port, flags="R", seq=cookie ^ 1)
+    scanner.handle_reply(bytes(reply))
+    assert scanner._pending
+    reply[TCP].seq = cookie
+    scanner.handle_reply(bytes(reply))
+    assert not scanner._pending
+    assert scanner._results.get_nowait().state == PortState.CLOSED
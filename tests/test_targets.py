@@ -0,0 +1,122 @@
+import ipaddress
+import tracemalloc
+
+import pytest
+from port_scanner.targets import (
+    NAMED_PORTS,
+    TOP_100_PORTS,
+    TargetSpec,
+    cached_host_index,
+    parse_hosts,
+    parse_ports,
+    read_hosts_file,
+)
+
+
+def _address(address):
+    return int(ipaddress.IPv4Address(address))
+
+
+@pytest.mark.parametrize(
+    ("spec", "expected"),
+    [
+        ("10.0.0.1", [("10.0.0.1", "10.0.0.1")]),
+        ("10.0.0.0/30", [("10.0.0.0", "10.0.0.3")]),
+        ("10.0.0.5/30", [("10.0.0.4", "10.0.0.7")]),
+        ("10.0.0.1-10.0.1.1", [("10.0.0.1", "10.0.1.1")]),
+        ("10.0.0.1-20", [("10.0.0.1", "10.0.0.20")]),
+        # overlapping and adjacent items are merged
+        ("10.0.0.3, 10.0.0.1-2,10.0.0.2", [("10.0.0.1", "10.0.0.3")]),
+        ("10.0.0.9,10.0.0.1", [("10.0.0.1", "10.0.0.1"), ("10.0.0.9", "10.0.0.9")]),
+    ],
+)
+def test_parse_hosts(spec, expected):
+    assert parse_hosts(spec) == [(_address(first), _address(last)) for first, last in expected]
+
+
+@pytest.mark.parametrize("spec", ["", "invalid", "10.0.0.256", "10.0.0.0/33", "10.0.0.9-1", "10.0.0.1-x"])
+def test_parse_hosts_invalid(spec):
+    with pytest.raises(ValueError):
+        parse_hosts(spec)
+
+
+def test_read_hosts_file(tmp_path):
+    path = tmp_path / "hosts"
+    path.write_text("10.0.0.1 # gateway\n\n# nothing here\n10.0.0.2,10.0.0.8/31\n")
+    assert read_hosts_file(path) == [
+        (_address("10.0.0.1"), _address("10.0.0.2")),
+        (_address("10.0.0.8"), _address("10.0.0.9")),
+    ]
+
+
+def test_read_hosts_file_empty(tmp_path):
+    path = tmp_path / "hosts"
+    path.write_text("# nothing\n")
+    with pytest.raises(ValueError):
+        read_hosts_file(path)
+
+
+def test_parse_ports():
+    assert parse_ports("80, 22,20-23,443") == [(20, 23), (80, 80), (443, 443)]
+    assert parse_ports("all") == [(1, 65535)]
+    assert parse_ports("well-known") == [(1, 1023)]
+
+
+@pytest.mark.parametrize("spec", ["", "0", "65536", "http", "30-20", "1-2-3"])
+def test_parse_ports_invalid(spec):
+    with pytest.raises(ValueError):
+        parse_ports(spec)
+
+
+def test_named_port_sets():
+    assert len(set(TOP_100_PORTS)) == 100
+    assert len(set(NAMED_PORTS["top-1000"])) == 1000
+    assert set(TOP_100_PORTS) <= set(NAMED_PORTS["top-1000"])
+
+
+def test_target_spec_interleaves_hosts():
+    targets = TargetSpec.parse("10.0.0.1-2,10.0.0.9", "22,80")
+    expected = [
+        ("10.0.0.1", 22),
+        ("10.0.0.2", 22),
+        ("10.0.0.9", 22),
+        ("10.0.0.1", 80),
+        ("10.0.0.2", 80),
+        ("10.0.0.9", 80),
+    ]
+    assert list(targets) == expected
+    assert len(targets) == 6
+    assert [targets[i] for i in range(len(targets))] == expected
+    with pytest.raises(IndexError):
+        targets[6]
+
+
+def test_target_spec_index():
+    targets = TargetSpec.parse("10.0.0.1-2,10.0.0.9", "22,80-81")
+    assert [targets.host_index(host) for host in ["10.0.0.1", "10.0.0.2", "10.0.0.9"]] == [0, 1, 2]
+    assert [targets.port_index(port) for port in [22, 80, 81]] == [0, 1, 2]
+    for host in ["10.0.0.0", "10.0.0.3", "10.0.0.10"]:
+        with pytest.raises(ValueError, match="not in the ranges"):
+            targets.host_index(host)
+    for port in [21, 79, 82]:
+        with pytest.raises(ValueError, match="not in the ranges"):
+            targets.port_index(port)
+
+
+def test_cached_host_index():
+    targets = TargetSpec.parse("10.0.0.1-2,10.0.0.9", "22")
+    host_index = cached_host_index(targets)
+    assert [host_index(host) for host in ["10.0.0.9", "10.0.0.1", "10.0.0.9"]] == [2, 0, 2]
+    assert host_index.cache_info().hits == 1
+    with pytest.raises(ValueError, match="not in the ranges"):
+        host_index("10.0.0.3")
+
+
+def test_target_spec_is_lazy():
+    tracemalloc.start()
+    targets = TargetSpec.parse("10.0.0.0/16", "all")
+    assert len(targets) == 65536 * 65535
+    assert targets[len(targets) - 1] == ("10.0.255.255", 65535)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert peak < 100_000
@@ -0,0 +1,64 @@
+import threading
+
+import pytest
+from port_scanner.timing import INITIAL_TIMEOUT, HostTimings, RttEstimator
+
+
+def test_rtt_estimator_first_sample():
+    estimate = RttEstimator(0.1)
+    assert estimate.srtt == 0.1
+    assert estimate.rttvar == 0.05
+    assert estimate.timeout == pytest.approx(0.3)
+
+
+def test_rtt_estimator_converges_on_stable_rtt():
+    estimate = RttEstimator(0.5)
+    for _ in range(100):
+        estimate.update(0.02)
+    assert estimate.srtt == pytest.approx(0.02, rel=0.01)
+    assert estimate.timeout == pytest.approx(0.02, rel=0.05)
+
+
+def test_rtt_estimator_variation_widens_timeout():
+    estimate = RttEstimator(0.02)
+    estimate.update(0.2)
+    assert estimate.timeout > 0.2
+
+
+def test_host_timings_per_host():
+    timings = HostTimings(min_timeout=0.001)
+    assert timings.timeout("10.0.0.1") == INITIAL_TIMEOUT
+    assert timings.estimate("10.0.0.1") is None
+    timings.update("10.0.0.1", 0.01)
+    assert timings.timeout("10.0.0.1") == pytest.approx(0.03)
+    assert timings.timeout("10.0.0.2") == INITIAL_TIMEOUT
+
+
+def test_host_timings_bounds():
+    timings = HostTimings(min_timeout=0.05, max_timeout=2)
+    timings.update("10.0.0.1", 0.001)
+    timings.update("10.0.0.2", 5)
+    assert timings.timeout("10.0.0.1") == 0.05
+    assert timings.timeout("10.0.0.2") == 2
+
+
+def test_host_timings_invalid_bounds():
+    with pytest.raises(ValueError):
+        HostTimings(min_timeout=0)
+    with pytest.raises(ValueError):
+        HostTimings(min_timeout=2, max_timeout=1)
+
+
+def test_host_timings_concurrent_updates():
+    timings = HostTimings()
+
+    def update():
+        for _ in range(1000):
+            timings.update("10.0.0.1", 0.01)
+
+    threads = [threading.Thread(target=update) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert timings.estimate("10.0.0.1").srtt == pytest.approx(0.01)  # type: ignore